@@ -0,0 +1,337 @@
+"""時間の予算付きでプランを作る「いつ止めても使える」ソルバー
+
+使い方:
+    python src/anytime_solver.py                   # プリセットを 1 秒の予算で解いて表示
+    python src/anytime_solver.py --budget 5        # 夜間バッチなど、時間をかけてよい場合
+    （GUI の「プラン生成」とライブプレビューは、時間ではなく SOLVER_STEPS 手で止めて使います）
+
+まず allocate_by_priority（貪欲法）の結果をすぐに作り、予算が残っている間だけ局所探索で改善します。
+途中のどの時点でも「今までで最良の、条件を満たすプラン」を持っているので、予算を使い切ったら
+それを返します（予算 0 なら allocate_by_priority と同じ結果）。
+
+良さ（小さいほど良い）は plan_pareto.py の3つの目的を1つの値にまとめたものです（重みは OBJECTIVE_WEIGHTS）。
+    未完了  +  優先遅れ  +  SPREAD_WEIGHT × 負荷のばらつき
+未完了は「期限までに入らなかった時間 × 優先度の重み」で数え（問題数で数えると、優先度の低い
+小さな問題ばかりを詰める方が良くなってしまうため）、最小の1問でも優先遅れの最大値より重くなるように
+拡大するので、未完了を減らすことが最優先になります。
+
+局所探索の手（どちらも各日の容量と前提タスクの順序を守る手だけを試し、悪くならなければ採用）:
+ - 移動: あるタスクの問題をいくつか別の日へ動かす（未割当の問題を空いている日へ入れるのも含む）
+ - 交換: 2つの日の間で、あるタスクの1問と別のタスクの何問かを入れ替える
+貪欲法で容量を超えた日（最低1問ルール）は、そこから出す手だけを許します。
+
+使う探索は規模（タスク数 × 日数）で自動的に選びます（ENGINE_LIMITS）。
+ - 'sweep+local': 小さい問題。plan_pareto.py のパラメータを全部試して最良の割当から局所探索
+ - 'local'      : 中くらいの問題。貪欲法の結果から局所探索
+ - 'greedy'     : 非常に大きい問題。貪欲法の結果をそのまま返す（表の確保だけで予算を超えるため）
+"""
+import argparse
+import math
+import random
+import time
+
+import first_study_plan
+import plan_pareto
+from first_study_plan import deadline_days
+
+SPREAD_WEIGHT = 0.05
+# 良さの各項の重み。overload は容量を超えた時間（最低1問ルールではみ出した分）で、既定では数えない
+# （plan_improver.py は重みを変えて使う）
+OBJECTIVE_WEIGHTS = {'unfinished': 1.0, 'lateness': 1.0, 'spread': SPREAD_WEIGHT, 'overload': 0.0}
+# 規模（タスク数 × 日数）ごとの探索: この値以下なら sweep+local、次の値以下なら local、それより上は greedy
+ENGINE_LIMITS = (5000, 2000000)
+ENGINES = ('sweep+local', 'local', 'greedy')
+# 予算の確認は何手ごとに行うか
+CHECK_EVERY = 64
+
+
+def choose_engine(n_tasks, n_days):
+    work = n_tasks * n_days
+    if work <= ENGINE_LIMITS[0]:
+        return 'sweep+local'
+    if work <= ENGINE_LIMITS[1]:
+        return 'local'
+    return 'greedy'
+
+
+class LocalSearch:
+    """タスク × 日 の問題数の表に対する局所探索。cost は常に今の表（＝今までの最良）の値。"""
+
+    def __init__(self, day_capacities, tasks, plan, deadline=None, seed=0, weights=None):
+        self.tasks = tasks
+        self.weights = dict(OBJECTIVE_WEIGHTS, **(weights or {}))
+        self.n = len(tasks)
+        self.days = len(day_capacities)
+        self.deadline = self.days if deadline is None else min(deadline, self.days)
+        self.rng = random.Random(seed)
+        self.index = {t['name']: i for i, t in enumerate(tasks)}
+        if len(self.index) != self.n:
+            # プランの項目は名前でしか表せないので、同じ名前のタスクがあると表を作れない
+            raise ValueError("同じ名前のタスクが複数あるため局所探索できません")
+        self.qt = [first_study_plan.task_quanta(t) for t in tasks]
+        self.need = [max(0, int(t.get('remaining', 0))) for t in tasks]
+        self.cap = [first_study_plan.to_quanta(c) for c in day_capacities]
+        ranks = {p: i for i, p in enumerate(sorted({t.get('priority', 99) for t in tasks}))}
+        self.weight = [1.0 / (ranks[t.get('priority', 99)] + 1) if need > 0 else 0.0
+                       for t, need in zip(tasks, self.need)]
+        self.weight_sum = sum(self.weight) or 1.0
+        self.prereqs = [[self.index[p] for p in first_study_plan._prerequisites(t)] for t in tasks]
+        self.dependents = [[] for _ in tasks]
+        for i, pres in enumerate(self.prereqs):
+            for p in pres:
+                self.dependents[p].append(i)
+        self.movable = [i for i in range(self.n) if self.qt[i] > 0 and self.need[i] > 0]
+
+        self.x = [[0] * self.days for _ in tasks]
+        self.total = [0] * self.n
+        self.early = [0] * self.n
+        self.first = [self.days] * self.n
+        self.last = [-1] * self.n
+        self.load = [0] * self.days
+        for d, day_tasks in enumerate(plan):
+            for it in day_tasks:
+                i = self.index[it['name']]
+                self.x[i][d] += it['assigned']
+                self.total[i] += it['assigned']
+                if d < self.deadline:
+                    self.early[i] += it['assigned']
+                self.load[d] += it['assigned'] * self.qt[i]
+                self.first[i] = min(self.first[i], d)
+                self.last[i] = max(self.last[i], d)
+        # 未完了1問あたりの重み（優先度の重み × 1問の時間）。最小の1問でも優先遅れの最大値（日数 + 1）より重くする
+        unit = [w * q for w, q in zip(self.weight, self.qt)]
+        smallest = min((u for u in unit if u > 0), default=1.0)
+        self.unfinished_weight = [u * (self.days + 2) / smallest for u in unit]
+        self.unfinished = sum(uw * max(0, need - e)
+                              for uw, need, e in zip(self.unfinished_weight, self.need, self.early))
+        self.lateness = sum(self.weight[i] * self._completion(i) for i in range(self.n))
+        self.load_sum = sum(self.load)
+        self.load_sq = sum(q * q for q in self.load)
+        self.overload = sum(max(0, q - c) for q, c in zip(self.load, self.cap))
+        self.cost = self._cost()
+        self.steps = 0
+        self.accepted = 0
+
+    # -- 目的値
+    def _completion(self, i):
+        # 完了日（1 始まり）。期限までに終わらなければ期限の翌日扱い（plan_pareto.evaluate と同じ）
+        if self.total[i] >= self.need[i]:
+            return min(self.last[i] + 1, self.deadline + 1)
+        return self.deadline + 1
+
+    def _cost(self):
+        mean = self.load_sum / self.days if self.days else 0.0
+        var = max(0.0, self.load_sq / self.days - mean * mean) if self.days else 0.0
+        spread = first_study_plan.quanta_to_hours(math.sqrt(var))
+        w = self.weights
+        return (w['unfinished'] * self.unfinished + w['lateness'] * self.lateness / self.weight_sum
+                + w['spread'] * spread + w['overload'] * first_study_plan.quanta_to_hours(self.overload))
+
+    # -- 表の更新（元に戻せるように差分で行う）
+    def _change(self, i, d, delta):
+        before = self._completion(i)
+        old_x = self.x[i][d]
+        self.x[i][d] = old_x + delta
+        self.total[i] += delta
+        if d < self.deadline:
+            uw = self.unfinished_weight[i]
+            self.unfinished -= uw * max(0, self.need[i] - self.early[i])
+            self.early[i] += delta
+            self.unfinished += uw * max(0, self.need[i] - self.early[i])
+        q = delta * self.qt[i]
+        self.load_sq += (self.load[d] + q) ** 2 - self.load[d] ** 2
+        self.overload += max(0, self.load[d] + q - self.cap[d]) - max(0, self.load[d] - self.cap[d])
+        self.load[d] += q
+        self.load_sum += q
+        if self.x[i][d] > 0:
+            self.first[i] = min(self.first[i], d)
+            self.last[i] = max(self.last[i], d)
+        elif old_x > 0 and d in (self.first[i], self.last[i]):
+            row = self.x[i]
+            days = [k for k in range(self.days) if row[k] > 0]
+            self.first[i] = days[0] if days else self.days
+            self.last[i] = days[-1] if days else -1
+        self.lateness += self.weight[i] * (self._completion(i) - before)
+
+    def _apply(self, changes):
+        for i, d, delta in changes:
+            self._change(i, d, delta)
+
+    def _valid(self, tasks_touched):
+        # 前提タスクがすべて終わった日以降にしか後続の問題が無いこと
+        for i in tasks_touched:
+            for j in [i] + self.dependents[i]:
+                if self.total[j] == 0:
+                    continue
+                for p in self.prereqs[j]:
+                    if self.total[p] < self.need[p] or self.last[p] > self.first[j]:
+                        return False
+        return True
+
+    def _room(self, d):
+        return self.cap[d] - self.load[d]
+
+    # -- 手
+    def _random_move(self):
+        i = self.rng.choice(self.movable)
+        q = self.qt[i]
+        unassigned = self.need[i] - self.total[i]
+        if unassigned > 0 and (self.total[i] == 0 or self.rng.random() < 0.5):
+            src = None
+            available = unassigned
+        else:
+            if self.total[i] == 0:
+                return None
+            src = self.rng.randint(self.first[i], self.last[i])
+            available = self.x[i][src]
+            if available == 0:
+                return None
+        # 前へ動かす手を多めに試す（優先遅れ・未完了が減るのは主に前倒し）
+        hi = src if src is not None and self.rng.random() < 0.7 else self.days
+        if hi <= 0:
+            return None
+        dst = self.rng.randrange(hi)
+        if dst == src:
+            return None
+        k = min(available, self._room(dst) // q)
+        if k <= 0:
+            return None
+        k = self.rng.randint(1, k)
+        changes = [(i, dst, k)]
+        if src is not None:
+            changes.append((i, src, -k))
+        return changes, (i,)
+
+    def _random_swap(self):
+        i, j = self.rng.choice(self.movable), self.rng.choice(self.movable)
+        if i == j or self.total[i] == 0 or self.total[j] == 0:
+            return None
+        a = self.rng.randint(self.first[i], self.last[i])
+        b = self.rng.randint(self.first[j], self.last[j])
+        if a == b or self.x[i][a] == 0 or self.x[j][b] == 0:
+            return None
+        qi, qj = self.qt[i], self.qt[j]
+        # i の1問を a -> b、j の kj 問を b -> a
+        kj = min(self.x[j][b], (self._room(a) + qi) // qj)
+        if kj <= 0 or qi > self._room(b) + kj * qj:
+            return None
+        return [(i, a, -1), (i, b, 1), (j, b, -kj), (j, a, kj)], (i, j)
+
+    def step(self):
+        """ランダムな手を1つ試し、悪くならなければ採用する。採用したら True。"""
+        self.steps += 1
+        if not self.movable:
+            return False
+        proposal = self._random_move() if self.rng.random() < 0.6 else self._random_swap()
+        if proposal is None:
+            return False
+        changes, touched = proposal
+        before = self.cost
+        self._apply(changes)
+        new_cost = self._cost()
+        if new_cost <= before + 1e-12 and self._valid(touched):
+            self.cost = new_cost
+            self.accepted += 1
+            return True
+        self._apply([(i, d, -delta) for i, d, delta in reversed(changes)])
+        self.cost = before
+        return False
+
+    def run(self, deadline_time, max_steps=None):
+        """time.perf_counter() が deadline_time になるまで（または max_steps 手まで）改善を続ける。"""
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            if steps % CHECK_EVERY == 0 and time.perf_counter() >= deadline_time:
+                break
+            self.step()
+            steps += 1
+        return self.cost
+
+    def plan(self):
+        """今の表を通常のプラン（日ごとの割当リスト）にする。並びは優先度順。"""
+        order = sorted(range(self.n), key=lambda i: (self.tasks[i].get('priority', 99), i))
+        out = []
+        for d in range(self.days):
+            out.append([{'name': self.tasks[i]['name'], 'assigned': self.x[i][d],
+                         'time': first_study_plan.quanta_to_hours(self.x[i][d] * self.qt[i])}
+                        for i in order if self.x[i][d] > 0])
+        return out
+
+    def remaining(self):
+        return {t['name']: self.need[i] - self.total[i] for i, t in enumerate(self.tasks)}
+
+
+def solve(day_capacities, tasks, budget=1.0, start_date=None, test_date=None, engine=None, seed=0, steps=None,
+          greedy=None):
+    """予算 budget 秒でプランを作る。tasks の remaining は allocate_by_priority と同じく減らす。
+
+    steps を指定すると局所探索をその手数でも止める。budget=None なら時間では止めず（steps が必要）、
+    パラメータもすべて試すので、同じ入力・同じ seed なら結果は常に同じになる。
+    greedy は同じ入力の allocate_by_priority の結果 (プラン, 割当後の remaining のリスト) が手元にあれば渡す。
+
+    戻り値は {'plan', 'cost', 'greedy_cost', 'engine', 'steps'}。前提タスクの指定ミスは ValueError。
+    同じ名前のタスクが複数ある場合は（プランの項目からタスクを決められないので）貪欲法の結果を返す。
+    """
+    if budget is None and steps is None:
+        raise ValueError("budget か steps を指定してください")
+    started = time.perf_counter()
+    deadline_time = math.inf if budget is None else started + max(0.0, budget)
+    deadline = deadline_days(len(day_capacities), start_date, test_date)
+    base = [dict(t) for t in tasks]
+    if greedy is None:
+        greedy_tasks = [dict(t) for t in base]
+        greedy = first_study_plan.allocate_by_priority(list(day_capacities), greedy_tasks)
+        greedy_remaining = [t['remaining'] for t in greedy_tasks]
+    else:
+        greedy, greedy_remaining = greedy
+    engine = engine or choose_engine(len(tasks), len(day_capacities))
+    if engine not in ENGINES:
+        raise ValueError(f"不明な探索です: {engine}")
+    unique = len({t['name'] for t in base}) == len(base)
+    if (engine == 'greedy' or not unique or budget is not None and budget <= 0 or steps == 0
+            or time.perf_counter() >= deadline_time):
+        # 貪欲法だけで予算を使い切った場合も、表を作らずにそのまま返す
+        plan, cost, greedy_cost, steps = greedy, None, None, 0
+        engine = 'greedy'
+        done = [t.get('remaining', 0) - r for t, r in zip(base, greedy_remaining)]
+    else:
+        # 貪欲法のプランの表は、出発点の候補と greedy_cost の両方に使う（作り直さない）
+        search = LocalSearch(day_capacities, base, greedy, deadline, seed)
+        greedy_cost = search.cost
+        if engine == 'sweep+local':
+            # パラメータを振った割当の中から、同じ良さの基準で最良のものを出発点にする
+            # 予算の半分までに評価できた分だけ使い、残りは局所探索に回す
+            sweep_until = started + max(0.0, budget) / 2 if budget is not None else math.inf
+            for params in plan_pareto.sweep_params(day_capacities):
+                if time.perf_counter() >= sweep_until:
+                    break
+                candidate = plan_pareto.allocate_with_params(day_capacities, base, **params)
+                table = LocalSearch(day_capacities, base, candidate, deadline, seed)
+                if table.cost < search.cost:
+                    search = table
+        cost = search.run(deadline_time, steps)
+        plan, steps, done = search.plan(), search.steps, list(search.total)
+    # 割り当てた数はタスクの並び順で戻す（名前では戻さない）
+    for t, n in zip(tasks, done):
+        t['remaining'] = t.get('remaining', 0) - n
+    return {'plan': plan, 'cost': cost, 'greedy_cost': greedy_cost, 'engine': engine, 'steps': steps}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='時間の予算付きでプリセットのプランを作ります')
+    parser.add_argument('--budget', type=float, default=1.0, help='予算（秒）')
+    parser.add_argument('--engine', choices=ENGINES, default=None, help='探索（既定: 規模で自動選択）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', type=int, default=None, help='局所探索の手数でも止める')
+    args = parser.parse_args(argv)
+    subject, day_capacities, total_available, tasks = first_study_plan.collect_inputs()
+    total_needed = first_study_plan.compute_total_time(tasks)
+    result = solve(day_capacities, tasks, args.budget, first_study_plan.START_DATE_PRESET,
+                   first_study_plan.TEST_DATE_PRESET, args.engine, args.seed, args.steps)
+    first_study_plan.print_plan(subject, total_available, day_capacities, tasks, total_needed, result['plan'])
+    if result['cost'] is not None:
+        print(f"探索: {result['engine']} / {result['steps']} 手 / 良さ {result['greedy_cost']:.3f} -> {result['cost']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""多数のプランをまとめて生成するバッチ（中断しても続きから再開できる）
+
+使い方:
+    python src/batch_jobs.py specs.jsonl --out plans/batch
+    python src/batch_jobs.py specs.jsonl --out plans/batch --workers 8
+
+specs.jsonl は1行1件の JSON（first_study_plan.py のプリセットと同じ書式）:
+    {"id": "taro-数学", "subject": "数学", "day_capacities": [2, 3, 3], "time_per_item": 0.5,
+     "start_date": "2025-12-01", "test_date": "2025-12-08",
+     "tasks": [{"name": "教科書問題", "total": 27, "priority": 1, "difficulty": 1.0}]}
+   "budget"（秒、任意）を指定すると anytime_solver.py でその時間だけ改善したプランを作ります
+   （--budget で全件の既定値を指定できます）。
+   "rle": true（または --rle）で、結果を RLE 形式（Day Capacities RLE / Plan RLE セクション）で保存します。
+
+ - 結果は --out の下に <id>.csv（通常のプラン CSV）として保存します。
+ - 進み具合（完了した id・入力のハッシュ・結果の要約）は --out/.batch_checkpoint.json に
+   一時ファイル経由で置き換える形（途中で落ちても壊れない）で定期的に保存します。
+ - 再実行すると、入力が変わっておらず結果ファイルも残っている id は計算しません。
+   入力の内容（id 以外）が同じ別の id は、計算済みの結果をコピーして済ませます。
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from multiprocessing import Pool
+
+import anytime_solver
+import difficulty_calibration
+import first_study_plan
+
+CHECKPOINT_NAME = '.batch_checkpoint.json'
+CHECKPOINT_VERSION = 1
+# チェックポイントを書く間隔（件数・秒のどちらかに達したら書く）
+CHECKPOINT_EVERY = 50
+CHECKPOINT_SECONDS = 5.0
+
+
+def spec_hash(spec):
+    """結果に影響する入力（id 以外）のハッシュ。"""
+    body = {k: v for k, v in spec.items() if k != 'id'}
+    return hashlib.sha256(json.dumps(body, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def tasks_from_spec(spec):
+    # プリセットと同じ書式のタスクを割当用の dict にする（collect_inputs と同じ。較正表があれば使う）
+    time_per_item = float(spec.get('time_per_item', 0.5))
+    tasks = [{
+        "name": src["name"],
+        "remaining": int(src.get("total", 0)),
+        "total": int(src.get("total", 0)),
+        "time_per_item": float(src.get("time_per_item", time_per_item)),
+        "difficulty": float(src.get("difficulty", 1.0)),
+        "priority": int(src.get("priority", 99)),
+        "after": list(src.get("after", [])),
+    } for src in spec.get('tasks', [])]
+    difficulty_calibration.apply_to_tasks(tasks, spec.get('subject', ''))
+    return tasks
+
+
+def read_specs(path):
+    with open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            spec = json.loads(line)
+            if 'id' not in spec:
+                raise ValueError(f"{path}:{lineno}: id がありません")
+            yield spec
+
+
+def output_name(spec_id):
+    # id をファイル名に使えるようにする（区切り文字だけ置き換える）
+    return ''.join('_' if c in '/\\:*?"<>|' else c for c in str(spec_id)) + '.csv'
+
+
+def run_spec(spec, out_path):
+    """1件を計画して out_path に保存し、結果の要約を返す（ワーカープロセスで実行）。"""
+    tasks = tasks_from_spec(spec)
+    day_capacities = [float(c) for c in spec.get('day_capacities', [])]
+    try:
+        if spec.get('budget'):
+            plan = anytime_solver.solve(day_capacities, [dict(t) for t in tasks], float(spec['budget']),
+                                        spec.get('start_date'), spec.get('test_date'))['plan']
+        else:
+            plan = first_study_plan.allocate_by_priority(day_capacities, [dict(t) for t in tasks])
+    except ValueError as e:
+        return {'error': str(e)}
+    assigned = {}
+    for day_tasks in plan:
+        for it in day_tasks:
+            assigned[it['name']] = assigned.get(it['name'], 0) + it['assigned']
+    unassigned = sum(max(0, t['total'] - assigned.get(t['name'], 0)) for t in tasks)
+    total_needed = first_study_plan.compute_total_time(tasks)
+    # 保存は一時ファイルからの置き換えなので、途中で落ちても半端な結果ファイルは残らない
+    first_study_plan.write_plan_csv(out_path, spec.get('subject', ''), day_capacities, plan, total_needed,
+                                    start_date=spec.get('start_date'), test_date=spec.get('test_date'),
+                                    rle=spec.get('rle'))
+    return {'unassigned': unassigned, 'total_needed': round(total_needed, 2)}
+
+
+class Checkpoint:
+    """完了した id と、入力ハッシュ -> 結果 の対応を保持してアトミックに保存する。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        self.results = {}
+        self._dirty = 0
+        self._saved_at = time.monotonic()
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == CHECKPOINT_VERSION:
+            self.completed = data.get('completed', {})
+            self.results = data.get('results', {})
+
+    def record(self, spec_id, digest, output, summary):
+        self.completed[spec_id] = {'hash': digest, 'output': output, **summary}
+        if 'error' not in summary:
+            self.results.setdefault(digest, {'output': output, **summary})
+        self._dirty += 1
+        if self._dirty >= CHECKPOINT_EVERY or time.monotonic() - self._saved_at >= CHECKPOINT_SECONDS:
+            self.save()
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': CHECKPOINT_VERSION, 'completed': self.completed, 'results': self.results},
+                      f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dirty = 0
+        self._saved_at = time.monotonic()
+
+
+def run_batch(spec_path, out_dir, workers=None, checkpoint_path=None, budget=None, rle=False):
+    """バッチを実行（または再開）する。戻り値は {'computed', 'skipped', 'copied', 'errors'} の件数。
+
+    budget は budget を指定していない spec に使う改善の予算（秒）。rle=True なら rle を指定していない spec を RLE 形式で保存する。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    calibration = difficulty_calibration.table_version() if difficulty_calibration.default_table() else None
+    ckpt = Checkpoint(checkpoint_path or os.path.join(out_dir, CHECKPOINT_NAME))
+    counts = {'computed': 0, 'skipped': 0, 'copied': 0, 'errors': 0}
+    jobs = []
+    pending_hashes = {}
+    for spec in read_specs(spec_path):
+        if budget and 'budget' not in spec:
+            # 予算も結果に影響する入力なのでハッシュに含める
+            spec = dict(spec, budget=budget)
+        if rle and 'rle' not in spec:
+            # 保存形式も結果のファイルに影響するのでハッシュに含める
+            spec = dict(spec, rle=True)
+        if calibration:
+            # 較正表が変われば割当も変わるので、表の版もハッシュに含める
+            spec = dict(spec, calibration=calibration)
+        spec_id = str(spec['id'])
+        digest = spec_hash(spec)
+        out_path = os.path.join(out_dir, output_name(spec_id))
+        done = ckpt.completed.get(spec_id)
+        if done and done['hash'] == digest and ('error' in done or os.path.exists(out_path)):
+            counts['skipped'] += 1
+            continue
+        cached = ckpt.results.get(digest)
+        if cached and os.path.exists(os.path.join(out_dir, cached['output'])):
+            # 同じ入力の結果が既にあるのでコピーで済ませる
+            shutil.copyfile(os.path.join(out_dir, cached['output']), out_path)
+            summary = {k: v for k, v in cached.items() if k != 'output'}
+            ckpt.record(spec_id, digest, output_name(spec_id), summary)
+            counts['copied'] += 1
+            continue
+        if digest in pending_hashes:
+            # 今回の実行内で同じ入力が先に出てきた: その結果ができてからコピーする
+            pending_hashes[digest].append((spec_id, out_path))
+            continue
+        pending_hashes[digest] = []
+        jobs.append((spec_id, digest, spec, out_path))
+
+    try:
+        with Pool(workers) as pool:
+            results = pool.imap_unordered(_run_job, jobs, chunksize=8)
+            for spec_id, digest, out_path, summary in results:
+                failed = 'error' in summary
+                ckpt.record(spec_id, digest, os.path.basename(out_path), summary)
+                counts['errors' if failed else 'computed'] += 1
+                for dup_id, dup_path in pending_hashes.get(digest, []):
+                    if not failed:
+                        shutil.copyfile(out_path, dup_path)
+                    ckpt.record(dup_id, digest, os.path.basename(dup_path), summary)
+                    counts['errors' if failed else 'copied'] += 1
+    finally:
+        # 中断（Ctrl+C など）でもここまでの進み具合を残す
+        ckpt.save()
+    return counts
+
+
+def _run_job(args):
+    spec_id, digest, spec, out_path = args
+    return spec_id, digest, out_path, run_spec(spec, out_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='多数のプランをまとめて生成します（中断後は続きから再開）')
+    parser.add_argument('specs', help='1行1件の JSON（.jsonl）')
+    parser.add_argument('--out', required=True, help='結果の CSV を置くフォルダー')
+    parser.add_argument('--workers', type=int, default=None, help='並列プロセス数（既定: CPU 数）')
+    parser.add_argument('--budget', type=float, default=None, help='1件あたりの改善の予算（秒、既定: 貪欲法のみ）')
+    parser.add_argument('--rle', action='store_true', help='結果を RLE 形式で保存する')
+    parser.add_argument('--checkpoint', default=None, help=f'チェックポイントのパス（既定: <out>/{CHECKPOINT_NAME}）')
+    args = parser.parse_args(argv)
+    counts = run_batch(args.specs, args.out, args.workers, args.checkpoint, args.budget, args.rle)
+    print(f"計算 {counts['computed']} 件 / 完了済みで省略 {counts['skipped']} 件 / "
+          f"同じ入力の結果をコピー {counts['copied']} 件 / エラー {counts['errors']} 件")
+
+
+if __name__ == '__main__':
+    main()
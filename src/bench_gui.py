@@ -0,0 +1,343 @@
+"""PlannerGUI のボタン処理の応答時間を、画面なしで測るベンチマーク
+
+使い方:
+    python src/bench_gui.py                              # 既定の規模（200 タスク × 120 日）で各 10 回
+    python src/bench_gui.py --tasks 500 --days 200 --repeat 20
+    python src/bench_gui.py --json bench_gui.jsonl       # 結果を1行追記（回帰の追跡用）
+
+「プラン生成」（_generate_plan）・「CSV読み込み」（_load_csv_for_update）・「完了を適用して再計画」
+（_apply_today_replan）を、合成した大きな入力とあらかじめ決めたダイアログの応答で動かし、
+処理ごとの応答時間の分位点（p50 / p90 / p99 / 最大）と、出力欄への insert の回数・文字数、
+出たダイアログの数を表示します。
+ - 画面（DISPLAY や Xvfb などの仮想ディスプレイ）があれば本物の Tk で動かします
+ - 無ければ、plan_gui.py が使うウィジェットだけを真似た軽い代用品で動かします（--display stub で強制）。
+   この場合は Tk の描画の時間は含まれず、解析・割当・テキスト生成の時間だけを測ります
+ダイアログ（messagebox / filedialog / simpledialog）はすべて ScriptedDialogs に置き換え、
+完了数は既定値（その日の計画どおり）、次の日の利用可能時間は見込み（無ければ 3 時間）、保存の確認は「いいえ」で答えます。
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from datetime import date, datetime
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+HANDLERS = ('_generate_plan', '_load_csv_for_update', '_apply_today_replan')
+
+
+# -- ダイアログの代わり
+class ScriptedDialogs:
+    """messagebox / filedialog / simpledialog の代わりに、決めた応答を返して呼ばれた回数を数える。"""
+
+    def __init__(self, open_path=None, next_day_hours='3'):
+        self.open_path = open_path
+        self.next_day_hours = next_day_hours
+        self.calls = 0
+        self.log = []
+
+    def _record(self, kind, title, message):
+        self.calls += 1
+        self.log.append((kind, title, str(message)[:80]))
+
+    # messagebox
+    def showinfo(self, title=None, message=None, **kw):
+        self._record('showinfo', title, message)
+
+    def showwarning(self, title=None, message=None, **kw):
+        self._record('showwarning', title, message)
+
+    def showerror(self, title=None, message=None, **kw):
+        self._record('showerror', title, message)
+
+    def askyesno(self, title=None, message=None, **kw):
+        self._record('askyesno', title, message)
+        return False
+
+    # filedialog
+    def askopenfilename(self, **kw):
+        self._record('askopenfilename', None, '')
+        return self.open_path
+
+    def asksaveasfilename(self, **kw):
+        self._record('asksaveasfilename', None, '')
+        return ''
+
+    # simpledialog
+    def askstring(self, title, prompt, initialvalue=None, **kw):
+        self._record('askstring', title, prompt)
+        if initialvalue is not None:
+            return initialvalue
+        if title == '次の日入力':
+            return self.next_day_hours
+        # 完了数などは空欄（＝既定値）で答える
+        return ''
+
+    def askinteger(self, title, prompt, **kw):
+        self._record('askinteger', title, prompt)
+        return None
+
+
+# -- 画面が無いときの Tk の代用品（plan_gui.py が使う分だけ）
+class _StubWidget:
+    def __init__(self, *args, **kw):
+        pass
+
+    def __getattr__(self, name):
+        # pack / bind / config などは何もしない
+        return lambda *a, **kw: None
+
+
+class _StubEntry(_StubWidget):
+    def __init__(self, *args, **kw):
+        self._text = ''
+
+    def get(self):
+        return self._text
+
+    def insert(self, index, text):
+        self._text = str(text) + self._text if index == 0 else self._text + str(text)
+
+    def delete(self, first, last=None):
+        self._text = ''
+
+
+class _StubText(_StubWidget):
+    def __init__(self, *args, **kw):
+        self._chunks = []
+
+    def get(self, first='1.0', last='end'):
+        # Tk と同じく末尾に改行が付く
+        return ''.join(self._chunks) + '\n'
+
+    def insert(self, index, text, *tags):
+        if index == '1.0':
+            self._chunks.insert(0, str(text))
+        else:
+            self._chunks.append(str(text))
+
+    def delete(self, first, last=None):
+        self._chunks = []
+
+
+class _StubVar:
+    def __init__(self, value=None, **kw):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+
+class _StubTk(_StubWidget):
+    def __init__(self, *args, **kw):
+        self._after = 0
+
+    def after(self, ms, func=None, *args):
+        # 予約した処理（ライブプレビューの確認など）は実行しない
+        self._after += 1
+        return f"after#{self._after}"
+
+
+def _stub_tk_modules():
+    tk = types.ModuleType('tkinter')
+    tk.Tk = _StubTk
+    tk.Text = _StubText
+    tk.BooleanVar = _StubVar
+    tk.TclError = RuntimeError
+    ttk = types.ModuleType('tkinter.ttk')
+    for name in ('Notebook', 'Frame', 'Label', 'Button', 'Checkbutton'):
+        setattr(ttk, name, _StubWidget)
+    ttk.Entry = _StubEntry
+    scrolledtext = types.ModuleType('tkinter.scrolledtext')
+    scrolledtext.ScrolledText = _StubText
+    tk.ttk = ttk
+    tk.scrolledtext = scrolledtext
+    tk.filedialog = types.ModuleType('tkinter.filedialog')
+    tk.messagebox = types.ModuleType('tkinter.messagebox')
+    tk.simpledialog = types.ModuleType('tkinter.simpledialog')
+    return {'tkinter': tk, 'tkinter.ttk': ttk, 'tkinter.scrolledtext': scrolledtext,
+            'tkinter.filedialog': tk.filedialog, 'tkinter.messagebox': tk.messagebox,
+            'tkinter.simpledialog': tk.simpledialog}
+
+
+def _real_display_available():
+    try:
+        import tkinter
+        root = tkinter.Tk()
+    except Exception:
+        return False
+    root.destroy()
+    return True
+
+
+def load_gui(display='auto'):
+    """plan_gui を読み込む。戻り値は (モジュール, 'real' または 'stub')。"""
+    mode = display
+    if display == 'auto':
+        mode = 'real' if _real_display_available() else 'stub'
+    saved = {}
+    if mode == 'stub':
+        for name, mod in _stub_tk_modules().items():
+            saved[name] = sys.modules.get(name)
+            sys.modules[name] = mod
+    try:
+        spec = importlib.util.spec_from_file_location('plan_gui_bench', os.path.join(SRC_DIR, 'plan_gui.py'))
+        gui = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(gui)
+    finally:
+        for name, mod in saved.items():
+            if mod is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = mod
+    return gui, mode
+
+
+class _TkProxy:
+    # plan_gui の tk.simpledialog だけを差し替え、残りは元のモジュールに任せる
+    def __init__(self, tk, simpledialog):
+        self._tk = tk
+        self.simpledialog = simpledialog
+
+    def __getattr__(self, name):
+        return getattr(self._tk, name)
+
+
+class InsertCounter:
+    """ウィジェットの insert 呼び出しの回数と文字数を数える。"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chars = 0
+
+    def wrap(self, widget):
+        original = widget.insert
+
+        def insert(index, text, *args):
+            self.calls += 1
+            self.chars += len(str(text))
+            return original(index, text, *args)
+        widget.insert = insert
+
+
+# -- 合成データ
+def synthetic_inputs(n_tasks, n_days, seed=0):
+    """(日ごとの時間, タスク行のテキスト) を作る。タスクの一部に前提タスクを付ける。"""
+    rng = random.Random(seed)
+    caps = [rng.choice([1, 1.5, 2, 2.5, 3, 4, 6]) for _ in range(n_days)]
+    lines = []
+    for i in range(n_tasks):
+        line = f"課題{i:04d},{rng.randint(1, 12)},{rng.randint(1, 5)},{rng.choice([0.6, 1.0, 1.0, 1.4])}"
+        if i >= 10 and rng.random() < 0.1:
+            line += f",課題{rng.randrange(i):04d}"
+        lines.append(line)
+    return caps, '\n'.join(lines) + '\n'
+
+
+def write_synthetic_csv(gui, path, caps, tasks_text):
+    """GUI の入力と同じ規則で割り当てたプランを path に保存する。"""
+    tasks = gui.preview_mod.TaskLineCache().parse(tasks_text, 0.5, True)
+    total_needed = gui.first_mod.compute_total_time(tasks)
+    plan = gui.first_mod.allocate_by_priority(list(caps), [dict(t) for t in tasks])
+    gui.first_mod.write_plan_csv(path, '合成', caps, plan, total_needed, start_date=date.today().isoformat())
+
+
+def percentile(values, q):
+    """最近傍順位法の分位点（q は 0～100）。"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, int(-(-q * len(ordered) // 100)) - 1))
+    return ordered[k]
+
+
+def run_bench(n_tasks=200, n_days=120, repeat=10, display='auto', solver_steps=None, seed=0):
+    """各処理を repeat 回ずつ動かして結果の辞書を返す。"""
+    gui, mode = load_gui(display)
+    if solver_steps is not None:
+        gui.SOLVER_STEPS = solver_steps
+    dialogs = ScriptedDialogs()
+    gui.messagebox = dialogs
+    gui.filedialog = dialogs
+    gui.tk = _TkProxy(gui.tk, dialogs)
+    app = gui.PlannerGUI()
+    counter = InsertCounter()
+    for widget in (app.txt_out, app.txt_update):
+        counter.wrap(widget)
+
+    caps, tasks_text = synthetic_inputs(n_tasks, n_days, seed)
+    app.entry_subject.insert(0, '合成')
+    app.entry_time_per.insert(0, '0.5')
+    app.text_day_caps.insert('1.0', ','.join(f"{c:g}" for c in caps))
+    app.text_tasks.insert('1.0', tasks_text)
+    app.entry_today.insert(0, str(max(1, n_days // 3)))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        dialogs.open_path = os.path.join(tmp, 'synthetic.csv')
+        write_synthetic_csv(gui, dialogs.open_path, caps, tasks_text)
+        for handler in HANDLERS:
+            samples, inserts, chars, calls = [], 0, 0, 0
+            for _ in range(repeat):
+                if handler == '_apply_today_replan':
+                    # 毎回同じ版から再計画する（読み込みは計測しない）
+                    app._load_csv_for_update()
+                counter.calls = counter.chars = dialogs.calls = 0
+                started = time.perf_counter()
+                getattr(app, handler)()
+                samples.append((time.perf_counter() - started) * 1000)
+                inserts += counter.calls
+                chars += counter.chars
+                calls += dialogs.calls
+            results[handler] = {
+                'p50_ms': round(percentile(samples, 50), 2),
+                'p90_ms': round(percentile(samples, 90), 2),
+                'p99_ms': round(percentile(samples, 99), 2),
+                'max_ms': round(max(samples), 2),
+                'inserts': inserts // repeat,
+                'insert_chars': chars // repeat,
+                'dialogs': calls // repeat,
+            }
+    if mode == 'real':
+        app.destroy()
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'), 'display': mode, 'tasks': n_tasks,
+            'days': n_days, 'repeat': repeat, 'solver_steps': gui.SOLVER_STEPS, 'results': results}
+
+
+def format_results(report):
+    lines = [f"表示: {report['display']} / {report['tasks']} タスク × {report['days']} 日 / 各 {report['repeat']} 回",
+             f"{'処理':<22} {'p50':>9} {'p90':>9} {'p99':>9} {'最大':>9} {'insert':>7} {'文字数':>9} {'ダイアログ':>6}"]
+    for handler, r in report['results'].items():
+        lines.append(f"{handler:<22} {r['p50_ms']:>7.1f}ms {r['p90_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms {r['max_ms']:>7.1f}ms "
+                     f"{r['inserts']:>7} {r['insert_chars']:>9} {r['dialogs']:>6}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PlannerGUI のボタン処理の応答時間を画面なしで測ります')
+    parser.add_argument('--tasks', type=int, default=200, help='合成するタスク数')
+    parser.add_argument('--days', type=int, default=120, help='合成する日数')
+    parser.add_argument('--repeat', type=int, default=10, help='各処理を動かす回数')
+    parser.add_argument('--display', choices=('auto', 'real', 'stub'), default='auto',
+                        help='auto: 画面があれば本物の Tk、無ければ代用品')
+    parser.add_argument('--solver-steps', type=int, default=None,
+                        help='「プラン生成」の改善の手数（既定: plan_gui.SOLVER_STEPS）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='結果を1行の JSON として追記するファイル')
+    args = parser.parse_args(argv)
+    report = run_bench(args.tasks, args.days, args.repeat, args.display, args.solver_steps, args.seed)
+    print(format_results(report))
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""実績から生徒ごと・曜日ごとの「実際に勉強できた時間」を学び、先の日の利用可能時間を提案する
+
+使い方:
+    python src/capacity_forecast.py                          # 全生徒の曜日別の実績（時間）を表示
+    python src/capacity_forecast.py --student taro --start 2025-12-08 --days 7   # taro の 7 日分の提案
+
+手で入力する利用可能時間（text_day_caps / DAY_CAPACITIES_PRESET / 「次の日の利用可能時間」）は楽観的に
+なりがちで、そのたびに再計画が必要になります。このモジュールは受信箱（watch_actuals.py の inbox/）に
+たまった実績の全履歴と plans/ のプランから、日ごとの「実際に勉強した時間」を求めます。
+ - 実績行に hours があればその合計、無ければ 完了数 × そのプランでのタスクの1問あたり時間
+ - 日付はプランの start_date（CSV の最初の Day の日付。継続プランも同じ）から求めます（start_date の無いプランは対象外）
+ - 生徒は plans/ のサブフォルダー名（plans 直下は ""）です（plan_catalog.py と同じ）
+
+全生徒の観測を (生徒, 曜日, 実績時間, 予定時間) の列にまとめてから、生徒×7曜日 の平らな配列へ
+1回の走査で集計します。提案値は 生徒・曜日の平均を、件数が少ないうちはその生徒の全曜日の平均
+（生徒自身の実績が無ければ全生徒の同じ曜日の平均）に寄せたものです（SHRINK 件分の重み）。
+手入力の値があるときは、それを上限として小さい方を提案します（休みの日の 0 はそのまま）。
+集計結果は plans/ と受信箱のファイルの 更新時刻・サイズ が変わるまで使い回します（cached_forecast）。
+"""
+import argparse
+import csv
+import os
+from array import array
+from datetime import date, timedelta
+
+import done_task
+from plan_catalog import PLANS_DIR, scan_plans
+from watch_actuals import INBOX_NAME
+
+WEEKDAYS = ('月', '火', '水', '木', '金', '土', '日')
+# 件数の少ない曜日の平均を、どれだけ全体の平均に寄せるか（件数換算）
+SHRINK = 2.0
+
+# (plans_dir, inbox, shrink) -> (ファイルの状態, CapacityForecast)
+_cache = {}
+
+
+def default_inbox(plans_dir=PLANS_DIR):
+    return os.path.join(os.path.dirname(os.path.abspath(plans_dir)), INBOX_NAME)
+
+
+def student_of(plan, plans_dir=PLANS_DIR):
+    """プランのパス（plans/ からの相対または絶対）から生徒名を返す。plans/ の外なら None。"""
+    if os.path.isabs(plan):
+        plans_dir = os.path.abspath(plans_dir)
+        try:
+            if os.path.commonpath([os.path.abspath(plan), plans_dir]) != plans_dir:
+                return None
+        except ValueError:
+            return None
+        plan = os.path.relpath(plan, plans_dir)
+    return os.path.dirname(plan.replace('\\', '/'))
+
+
+def read_actuals(inbox):
+    """受信箱の全ファイルから {(plan, day): [(task, done, hours or None)]} を作る。"""
+    actuals = {}
+    if not os.path.isdir(inbox):
+        return actuals
+    for entry in sorted(os.scandir(inbox), key=lambda e: e.name):
+        if entry.name.startswith('.') or not entry.name.lower().endswith('.csv') or not entry.is_file():
+            continue
+        with open(entry.path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.reader(f):
+                if len(row) < 4:
+                    continue
+                try:
+                    key = (row[0].strip().replace('\\', '/'), int(row[1]))
+                    done = int(row[3])
+                    hours = float(row[4]) if len(row) > 4 and row[4].strip() else None
+                except ValueError:
+                    # ヘッダー行など
+                    continue
+                actuals.setdefault(key, []).append((row[2].strip(), done, hours))
+    return actuals
+
+
+def collect_columns(plans_dir=PLANS_DIR, inbox=None):
+    """観測を列ごとの配列にする。戻り値は (生徒名の一覧, 生徒番号, 曜日, 実績時間, 予定時間)。"""
+    actuals = read_actuals(inbox or default_inbox(plans_dir))
+    students = []
+    student_index = {}
+    col_student = array('i')
+    col_weekday = array('b')
+    col_real = array('d')
+    col_planned = array('d')
+    by_plan = {}
+    for (plan, day), entries in actuals.items():
+        by_plan.setdefault(plan, []).append((day, entries))
+    for plan, days in by_plan.items():
+        path = os.path.join(plans_dir, plan)
+        if not os.path.isfile(path):
+            continue
+        data = done_task.load_plan_csv(path)
+        try:
+            start = date.fromisoformat(data['meta'].get('start_date', ''))
+        except ValueError:
+            continue
+        # タスクの1問あたり時間（そのプランの割当から）
+        unit = {}
+        for r in data['plan_rows']:
+            if r['assigned'] > 0 and r['name'] not in unit:
+                unit[r['name']] = r['time'] / r['assigned']
+        caps = data['day_capacities']
+        student = student_of(plan, plans_dir)
+        if student not in student_index:
+            student_index[student] = len(students)
+            students.append(student)
+        for day, entries in days:
+            real = sum(h if h is not None else done * unit.get(task, 0.0) for task, done, h in entries)
+            col_student.append(student_index[student])
+            col_weekday.append(done_task.day_date(start, data['first_day'], day).weekday())
+            col_real.append(real)
+            col_planned.append(float(caps[day - 1]) if 0 < day <= len(caps) else 0.0)
+    return students, col_student, col_weekday, col_real, col_planned
+
+
+class CapacityForecast:
+    """生徒×曜日 の実績時間の平均（件数の少ない所は全体の平均に寄せる）。"""
+
+    def __init__(self, students, col_student, col_weekday, col_real, col_planned, shrink=SHRINK):
+        n = len(students)
+        self.students = list(students)
+        self.index = {s: i for i, s in enumerate(self.students)}
+        self.sum_real = array('d', bytes(8 * n * 7))
+        self.sum_planned = array('d', bytes(8 * n * 7))
+        self.count = array('i', bytes(4 * n * 7))
+        cohort_sum = [0.0] * 7
+        cohort_count = [0] * 7
+        # 1回の走査で 生徒×曜日 のセルに集計する
+        for s, w, real, planned in zip(col_student, col_weekday, col_real, col_planned):
+            cell = s * 7 + w
+            self.sum_real[cell] += real
+            self.sum_planned[cell] += planned
+            self.count[cell] += 1
+            cohort_sum[w] += real
+            cohort_count[w] += 1
+        total = sum(cohort_sum) / sum(cohort_count) if any(cohort_count) else 0.0
+        self.cohort = [cohort_sum[w] / cohort_count[w] if cohort_count[w] else total for w in range(7)]
+        self.mean = array('d', bytes(8 * n * 7))
+        for s in range(n):
+            cells = range(s * 7, s * 7 + 7)
+            obs = sum(self.count[c] for c in cells)
+            overall = sum(self.sum_real[c] for c in cells) / obs if obs else None
+            for w, c in enumerate(cells):
+                prior = self.cohort[w] if overall is None else overall
+                self.mean[c] = (self.sum_real[c] + shrink * prior) / (self.count[c] + shrink)
+
+    def weekday_hours(self, student):
+        """生徒の曜日別（月～日）の提案時間。知らない生徒は全生徒の平均。"""
+        s = self.index.get(student)
+        if s is None:
+            return list(self.cohort)
+        return list(self.mean[s * 7:s * 7 + 7])
+
+    def optimism(self, student):
+        """予定していた時間に対する実績の割合（1 未満なら予定が楽観的）。実績が無ければ None。"""
+        s = self.index.get(student)
+        if s is None:
+            return None
+        planned = sum(self.sum_planned[s * 7:s * 7 + 7])
+        return sum(self.sum_real[s * 7:s * 7 + 7]) / planned if planned > 0 else None
+
+    def capacities(self, student, start_date, days, typed=None):
+        """start_date から days 日分の提案（時間、0.5 刻み）。typed（手入力）があれば上限にする。"""
+        hours = self.weekday_hours(student)
+        out = []
+        for i in range(days):
+            h = round(hours[(start_date + timedelta(days=i)).weekday()] * 2) / 2
+            if typed is not None and i < len(typed):
+                h = min(h, float(typed[i]))
+            out.append(h)
+        return out
+
+
+def forecast(plans_dir=PLANS_DIR, inbox=None, shrink=SHRINK):
+    return CapacityForecast(*collect_columns(plans_dir, inbox), shrink=shrink)
+
+
+def _files_stamp(plans_dir, inbox):
+    # plans/ の全プランと受信箱の CSV の (名前, 更新時刻, サイズ)。中身を読まずに変更を見分ける
+    plans = tuple(sorted((rel, st.st_mtime_ns, st.st_size) for rel, st in scan_plans(plans_dir)))
+    entries = []
+    if os.path.isdir(inbox):
+        for entry in os.scandir(inbox):
+            if entry.name.lower().endswith('.csv') and entry.is_file():
+                st = entry.stat()
+                entries.append((entry.name, st.st_mtime_ns, st.st_size))
+    return plans, tuple(sorted(entries))
+
+
+def cached_forecast(plans_dir=PLANS_DIR, inbox=None, shrink=SHRINK):
+    """forecast と同じ結果。plans/ と受信箱のファイルが前回から変わっていなければ前回の集計を返す。"""
+    inbox = inbox or default_inbox(plans_dir)
+    key = (os.path.abspath(plans_dir), os.path.abspath(inbox), shrink)
+    stamp = _files_stamp(plans_dir, inbox)
+    hit = _cache.get(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    fc = forecast(plans_dir, inbox, shrink)
+    _cache[key] = (stamp, fc)
+    return fc
+
+
+def suggest_capacities(plan_path, meta, day, days, typed=None, plans_dir=PLANS_DIR, first_day=1):
+    """読み込んだプランの Day day から days 日分の提案。実績が全く無い／日付が分からなければ None。
+
+    day は CSV の Day 番号（継続プランでは通しの番号）、first_day はその CSV の最初の Day（done_task.first_plan_day）。
+    """
+    try:
+        start = done_task.day_date(date.fromisoformat(meta.get('start_date', '')), first_day, day)
+    except ValueError:
+        return None
+    # GUI の再計画のたびに呼ばれるので、全プラン・全実績の集計は変更があったときだけやり直す
+    fc = cached_forecast(plans_dir)
+    if not fc.students:
+        return None
+    return fc.capacities(student_of(plan_path, plans_dir), start, days, typed)
+
+
+def format_forecast(fc):
+    lines = [f"{'生徒':<12} " + ' '.join(f"{w:>5}" for w in WEEKDAYS) + '  実績/予定']
+    for student in fc.students:
+        ratio = fc.optimism(student)
+        lines.append(f"{student or '(直下)':<12} " + ' '.join(f"{h:>5.1f}" for h in fc.weekday_hours(student))
+                     + (f"  {ratio:>8.0%}" if ratio is not None else '        -'))
+    lines.append(f"{'(全体)':<12} " + ' '.join(f"{h:>5.1f}" for h in fc.cohort))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='実績から曜日ごとの利用可能時間を提案します')
+    parser.add_argument('--dir', default=PLANS_DIR, help='plans フォルダー')
+    parser.add_argument('--inbox', default=None, help='実績の受信箱（既定: plans フォルダーの隣の inbox）')
+    parser.add_argument('--student', default=None, help='提案する生徒（plans 直下は空文字）')
+    parser.add_argument('--start', default=None, help='提案の開始日 (YYYY-MM-DD、既定: 今日)')
+    parser.add_argument('--days', type=int, default=7, help='提案する日数')
+    args = parser.parse_args(argv)
+    fc = forecast(args.dir, args.inbox)
+    if args.student is None:
+        print(format_forecast(fc))
+        return
+    start = date.fromisoformat(args.start) if args.start else date.today()
+    caps = fc.capacities(args.student, start, args.days)
+    print(','.join(f"{h:g}" for h in caps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""共有の限られた資源（チューターの枠・実験室・過去問のコピーなど）を、多数の生徒でまとめて割り当てる
+
+使い方:
+    python src/cohort_resources.py cohort.json --out plans/cohort
+    python src/cohort_resources.py cohort.json --out plans/cohort --workers 8 --iterations 40
+
+cohort.json の書式（students の各要素は batch_jobs.py の spec と同じ書式）:
+    {"resources": {"チューター": [2, 2, 2, 0, 2, 0, 0], "過去問": 3},
+     "students": [
+       {"id": "taro", "subject": "数学", "day_capacities": [2, 3, 3, 3, 3, 8, 8], "time_per_item": 0.5,
+        "start_date": "2025-12-01",
+        "tasks": [{"name": "教科書問題", "total": 27, "priority": 1},
+                  {"name": "個別指導", "total": 3, "priority": 2, "difficulty": 2.0, "resources": {"チューター": 1}}]}]}
+ - resources は 資源名 -> 日ごとの数（Day1 から。足りない日は 0）または全日共通の数
+ - タスクの resources は 1問あたりに使う資源の数。Day 番号は全生徒で共通（同じ日付から始まる）とします
+
+allocate_by_priority で生徒ごとに別々に計画すると、共有の資源を使う問題が同じ日に集まって定員を超えます。
+ここでは資源の日ごとの「値段」で生徒どうしを調整します（ラグランジュ緩和の劣勾配法）。
+ 1. 値段を 0 から始め、各生徒のプランを値段のもとで並列に作る（生徒ごとの計算は互いに独立）。
+    生徒は、その日の値段（1問に使う資源 × 資源の値段）がタスクの価値（優先度の重み）を超える日には
+    そのタスクを割り当てず、ほかのタスクや後の日に回す
+ 2. 日ごとに資源の使用数を集計し、定員を超えた日は値段を上げ、余った日は下げる（0 未満にはしない）
+ 3. 超過が無くなるか iterations 回に達するまで繰り返し、超過の最も少なかった回のプランを使う
+ 4. それでも超過が残った場合は、超過した日に資源を使う生徒だけを、価値の高い順に
+    「ほかの生徒が使った残りの数」を上限にして計画し直す（修復）。これで必ず定員内に収まります
+資源を使わない生徒は allocate_by_priority の結果そのものです。
+"""
+import argparse
+import json
+import math
+import os
+from multiprocessing import Pool
+
+import batch_jobs
+import first_study_plan
+
+PRICE_ITERATIONS = 30
+# 値段の更新幅（1回目）。k 回目は PRICE_STEP / √k、超過数は定員で割ってから掛ける
+PRICE_STEP = 0.5
+# これより少ない生徒数なら並列化しない
+PARALLEL_MIN_STUDENTS = 8
+EPS = 1e-9
+
+
+def resource_caps(resources, days):
+    """資源名 -> 日ごとの定員（長さ days のリスト）。"""
+    caps = {}
+    for name, value in resources.items():
+        if isinstance(value, (int, float)):
+            caps[name] = [float(value)] * days
+        else:
+            values = [float(v) for v in value][:days]
+            caps[name] = values + [0.0] * (days - len(values))
+    return caps
+
+
+def task_values(tasks):
+    # 1問の価値: 生徒の中での優先度の順位の重み（anytime_solver.LocalSearch と同じ）
+    ranks = {p: i for i, p in enumerate(sorted({t.get('priority', 99) for t in tasks}))}
+    return [1.0 / (ranks[t.get('priority', 99)] + 1) for t in tasks]
+
+
+def student_from_spec(spec):
+    """batch_jobs の spec 書式の生徒を、割当用の dict にする。"""
+    tasks = batch_jobs.tasks_from_spec(spec)
+    usage = [{r: float(u) for r, u in (src.get('resources') or {}).items() if float(u) > 0}
+             for src in spec.get('tasks', [])]
+    return {'id': str(spec['id']), 'spec': spec, 'tasks': tasks, 'usage': usage,
+            'values': task_values(tasks), 'day_capacities': [float(c) for c in spec.get('day_capacities', [])]}
+
+
+def uses_resources(student):
+    return any(student['usage'])
+
+
+def plan_student(student, prices=None, quotas=None):
+    """1人分のプランを作る。
+
+    prices: 資源名 -> 日ごとの値段。値段の合計がタスクの価値を超える日にはそのタスクを割り当てない
+    quotas: 資源名 -> 日ごとにこの生徒が使ってよい数（修復で使う）
+    どちらも無く資源を使うタスクも無ければ allocate_by_priority と同じ。割当の規則（優先度 → 残数の順、
+    最低1問ルール、前提タスク）も allocate_by_priority と同じです。
+    """
+    tasks = [dict(t) for t in student['tasks']]
+    if not uses_resources(student):
+        return first_study_plan.allocate_by_priority(list(student['day_capacities']), tasks)
+    usage, values = student['usage'], student['values']
+    dependents, pending = first_study_plan._build_dependency_graph(tasks)
+    qt = [first_study_plan.task_quanta(t) for t in tasks]
+    plan = [[] for _ in student['day_capacities']]
+
+    for day, cap in enumerate(student['day_capacities']):
+        left = first_study_plan.to_quanta(cap)
+        quota_left = {r: q[day] for r, q in quotas.items()} if quotas else {}
+        # 値段が価値を超えるタスクはこの日は割り当てない
+        priced_out = set()
+        if prices:
+            for i, use in enumerate(usage):
+                if use and sum(u * prices[r][day] for r, u in use.items() if r in prices) > values[i] + EPS:
+                    priced_out.add(i)
+
+        def allowed(i):
+            # 資源の残りの上限で入る問題数
+            n = tasks[i]['remaining']
+            for r, u in usage[i].items():
+                if r in quota_left:
+                    n = min(n, int(quota_left[r] / u + EPS))
+            return n
+
+        def take(i, count):
+            nonlocal left
+            t = tasks[i]
+            t['remaining'] -= count
+            left -= count * qt[i]
+            for r, u in usage[i].items():
+                if r in quota_left:
+                    quota_left[r] -= count * u
+            plan[day].append({'name': t['name'], 'assigned': count, 'time': first_study_plan.quanta_to_hours(count * qt[i])})
+            released = False
+            if t['remaining'] <= 0:
+                for j in dependents[i]:
+                    pending[j] -= 1
+                    released = released or pending[j] == 0
+            return released
+
+        def candidates():
+            order = sorted(range(len(tasks)), key=lambda k: (tasks[k].get('priority', 99), -int(tasks[k].get('remaining', 0))))
+            return [i for i in order if tasks[i].get('remaining', 0) > 0 and qt[i] > 0
+                    and not pending[i] and i not in priced_out]
+
+        any_assigned_today = False
+        while True:
+            assigned_in_pass = False
+            for i in candidates():
+                if left >= qt[i]:
+                    count = min(left // qt[i], allowed(i))
+                    if count > 0:
+                        assigned_in_pass = any_assigned_today = True
+                        if take(i, count):
+                            # 解放された後続タスクも優先度順に並べ直す（allocate_with_prerequisites と同じ）
+                            break
+            # 最低1問ルール（資源の上限は守る）
+            if not assigned_in_pass and not any_assigned_today and left > 0:
+                for i in candidates():
+                    if allowed(i) >= 1:
+                        take(i, 1)
+                        assigned_in_pass = any_assigned_today = True
+                        break
+            if not assigned_in_pass:
+                break
+    return plan
+
+
+def plan_usage(student, plan):
+    """プランが使う資源: 資源名 -> {日の添字: 数}。"""
+    index = {t['name']: i for i, t in enumerate(student['tasks'])}
+    used = {}
+    for day, day_tasks in enumerate(plan):
+        for it in day_tasks:
+            for r, u in student['usage'][index[it['name']]].items():
+                cells = used.setdefault(r, {})
+                cells[day] = cells.get(day, 0.0) + u * it['assigned']
+    return used
+
+
+def plan_value(student, plan):
+    index = {t['name']: i for i, t in enumerate(student['tasks'])}
+    return sum(student['values'][index[it['name']]] * it['assigned'] for day_tasks in plan for it in day_tasks)
+
+
+def total_usage(usages, caps):
+    totals = {r: [0.0] * len(c) for r, c in caps.items()}
+    for used in usages:
+        for r, cells in used.items():
+            if r in totals:
+                for day, units in cells.items():
+                    if day < len(totals[r]):
+                        totals[r][day] += units
+    return totals
+
+
+def overbooked(totals, caps):
+    """定員を超えた (資源名, 日の添字) -> 超過数。"""
+    return {(r, day): used - caps[r][day] for r, values in totals.items()
+            for day, used in enumerate(values) if used > caps[r][day] + EPS}
+
+
+# プロセスプールのワーカーが持つ生徒の一覧（initializer で一度だけ受け取る）
+_STUDENTS = []
+
+
+def _init_worker(students):
+    global _STUDENTS
+    _STUDENTS = students
+
+
+def _plan_job(args):
+    index, prices = args
+    return plan_student(_STUDENTS[index], prices)
+
+
+def allocate_cohort(students, caps, iterations=PRICE_ITERATIONS, workers=None):
+    """全生徒をまとめて計画する。
+
+    戻り値は {'plans': 生徒 id -> プラン, 'prices': 最後の値段, 'iterations': 回数,
+             'over_independent': 別々に計画したときの超過, 'over_priced': 修復前の超過, 'repaired': 修復した生徒 id}
+    """
+    days = max([len(c) for c in caps.values()] + [0])
+    prices = {r: [0.0] * days for r in caps}
+    priced = [i for i, s in enumerate(students) if uses_resources(s)]
+    plans = [plan_student(s) if not uses_resources(s) else None for s in students]
+    best = None
+    over_independent = None
+    pool = None
+    if workers != 1 and len(priced) >= PARALLEL_MIN_STUDENTS:
+        pool = Pool(workers, initializer=_init_worker, initargs=(students,))
+    try:
+        for k in range(max(1, iterations)):
+            jobs = [(i, {r: prices[r] for r in set().union(*students[i]['usage']) if r in prices}) for i in priced]
+            if pool:
+                results = pool.map(_plan_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1))))
+            else:
+                results = [plan_student(students[i], p) for i, p in jobs]
+            for i, plan in zip(priced, results):
+                plans[i] = plan
+            usages = [plan_usage(students[i], plans[i]) for i in priced]
+            totals = total_usage(usages, caps)
+            over = overbooked(totals, caps)
+            if over_independent is None:
+                # 値段 0 の1回目 = 生徒ごとに別々に計画した場合
+                over_independent = over
+            score = (sum(over.values()), -sum(plan_value(students[i], plans[i]) for i in priced))
+            if best is None or score < best[0]:
+                best = (score, list(plans), over)
+            if not over:
+                break
+            # 劣勾配: 使用数 − 定員 の向きに値段を動かす
+            step = PRICE_STEP / math.sqrt(k + 1)
+            for r, values in totals.items():
+                row = prices[r]
+                for day, used in enumerate(values):
+                    cap = caps[r][day]
+                    row[day] = max(0.0, row[day] + step * (used - cap) / max(cap, 1.0))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    _, plans, over = best
+    repaired = repair(students, caps, plans, over) if over else []
+    return {'plans': {s['id']: plan for s, plan in zip(students, plans)}, 'prices': prices, 'iterations': k + 1,
+            'over_independent': over_independent, 'over_priced': over, 'repaired': repaired}
+
+
+def repair(students, caps, plans, over):
+    """超過した日に資源を使う生徒を、残りの数を上限にして順に計画し直す（plans を書き換える）。"""
+    usages = [plan_usage(s, p) if uses_resources(s) else {} for s, p in zip(students, plans)]
+    conflicting = [i for i, used in enumerate(usages)
+                   if any((r, day) in over for r, cells in used.items() for day in cells)]
+
+    def need(i):
+        # 超過した日に使っている問題の最大の価値（高い生徒から先に資源を取る）
+        index = {t['name']: k for k, t in enumerate(students[i]['tasks'])}
+        return max(students[i]['values'][index[it['name']]]
+                   for day, day_tasks in enumerate(plans[i]) for it in day_tasks
+                   if any((r, day) in over for r in students[i]['usage'][index[it['name']]]))
+
+    order = sorted(conflicting, key=lambda i: (-need(i), students[i]['id']))
+    # 超過の無い生徒の使用数から始め、計画し直した生徒の分を順に足す
+    pending = set(conflicting)
+    committed = total_usage([u for i, u in enumerate(usages) if i not in pending], caps)
+    for i in order:
+        quotas = {r: [max(0.0, c - used) for c, used in zip(caps[r], committed[r])]
+                  for r in set().union(*students[i]['usage']) if r in caps}
+        plans[i] = plan_student(students[i], quotas=quotas)
+        for r, cells in plan_usage(students[i], plans[i]).items():
+            if r in committed:
+                for day, units in cells.items():
+                    if day < len(committed[r]):
+                        committed[r][day] += units
+    return [students[i]['id'] for i in order]
+
+
+def read_cohort(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    students = [student_from_spec(spec) for spec in data.get('students', [])]
+    ids = [s['id'] for s in students]
+    if len(set(ids)) != len(ids):
+        raise ValueError('生徒の id が重複しています')
+    days = max([len(s['day_capacities']) for s in students] + [0])
+    caps = resource_caps(data.get('resources', {}), days)
+    for s in students:
+        for use in s['usage']:
+            unknown = set(use) - set(caps)
+            if unknown:
+                raise ValueError(f"{s['id']}: resources に無い資源です: {', '.join(sorted(unknown))}")
+    return students, caps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='共有の資源の定員を守って多数の生徒をまとめて計画します')
+    parser.add_argument('cohort', help='生徒と資源の JSON')
+    parser.add_argument('--out', required=True, help='生徒ごとのプラン CSV を置くフォルダー')
+    parser.add_argument('--iterations', type=int, default=PRICE_ITERATIONS, help='値段の調整の最大回数')
+    parser.add_argument('--workers', type=int, default=None, help='並列プロセス数（既定: CPU 数）')
+    args = parser.parse_args(argv)
+    students, caps = read_cohort(args.cohort)
+    result = allocate_cohort(students, caps, args.iterations, args.workers)
+
+    os.makedirs(args.out, exist_ok=True)
+    for s in students:
+        spec = s['spec']
+        plan = result['plans'][s['id']]
+        first_study_plan.write_plan_csv(os.path.join(args.out, batch_jobs.output_name(s['id'])), spec.get('subject', ''),
+                                        s['day_capacities'], plan, first_study_plan.compute_total_time(s['tasks']),
+                                        start_date=spec.get('start_date'), test_date=spec.get('test_date'))
+    totals = total_usage([plan_usage(s, result['plans'][s['id']]) for s in students], caps)
+    print(f"生徒 {len(students)} 人 / 値段の調整 {result['iterations']} 回 / 修復 {len(result['repaired'])} 人")
+    print(f"{'資源':<12}{'定員':>8}{'使用':>8}{'別々に計画した場合の超過':>16}")
+    for r in caps:
+        independent = sum(v for (name, _), v in result['over_independent'].items() if name == r)
+        print(f"{r:<12}{sum(caps[r]):>8.1f}{sum(totals[r]):>8.1f}{independent:>16.1f}")
+    print(f"プランを保存しました: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""全生徒のプランと実績から、タスクの種類ごとの「1問に実際にかかる時間」を求めて表にする（難易度の較正）
+
+使い方:
+    python src/difficulty_calibration.py              # plans/ と inbox/ から表を作って plans/.difficulty_calibration.json に保存
+    python src/difficulty_calibration.py --dry-run    # 保存せずに表示だけ
+    （表ができていれば、プラン生成・再計画は既定でこの表を使います）
+
+difficulty は TASKS_PRESET や GUI のタスク欄で手で決める倍率で、再計画では 1.0 に戻ってしまいます
+（1問あたり時間はプランの割当から推定するので、手で決めた見積もりのずれはそのまま残ります）。
+この表は、受信箱（watch_actuals.py の inbox/）の実績のうち hours 列のある行から、タスクの種類ごとに
+実際の1問あたり時間を求めたものです。種類は (科目, タスク名) の組で、全生徒で共通です。科目は
+プランの subject から " (継続)" を除いたもので、数学と英語の「教科書問題」のように同じ名前のタスクも
+科目が違えば別の種類です（表は 科目 -> タスク名 -> 推定値 の入れ子）。
+ - 事前の見積もり: plans/ の全プランでの予定の1問あたり時間（予定時間の合計 ÷ 予定数の合計）
+ - 実績: 実績の時間の合計 ÷ 完了数の合計。件数が少ないうちは事前の見積もりに寄せる（SHRINK 問分の重み）
+ - difficulty（表示用）: 実績 ÷ 事前の見積もり。1 より大きければ見積もりより時間がかかっている
+全プラン・全実績を (種類, 数, 時間) の列にまとめてから、種類ごとの平らな配列へ1回の走査で集計します。
+
+表の使われ方（first_study_plan.USE_DIFFICULTY_CALIBRATION が True のとき）:
+ - 新しいプラン（プリセット・GUI・batch_jobs.py など）: 表にあるタスクは 1問時間 × difficulty が表の時間になるよう
+   difficulty を置き換える
+ - 再計画（GUI・done_task.py・監視モード）: 表にあるタスクの残りは表の1問あたり時間で割り当て直す
+実績が MIN_ITEMS 問に満たない種類は表に入れません（手で決めた値のまま）。
+復習の行（「タスク名 (復習)」、review_schedule.py）は予定・実績とも数えません。
+科目の分からない呼び出し（科目を渡さない再計画など）には表を使いません。
+"""
+import argparse
+import json
+import os
+from array import array
+from datetime import datetime
+
+from first_study_plan import base_subject
+from plan_archive import PLANS_DIR
+
+TABLE_NAME = '.difficulty_calibration.json'
+# 2: 種類を (科目, タスク名) にした。以前の版（タスク名だけ）の表は読み込まない
+TABLE_VERSION = 2
+# 事前の見積もりに寄せる強さ（問題数換算）
+SHRINK = 5.0
+# 表に入れるのに必要な実績の問題数
+MIN_ITEMS = 5
+
+# 読み込んだ表のキャッシュ: パス -> (mtime_ns, 表)
+_cache = {}
+
+
+def table_path(plans_dir=PLANS_DIR):
+    return os.path.join(plans_dir, TABLE_NAME)
+
+
+def task_type(subject, name):
+    """表のキー (科目, タスク名)。科目は継続プランの " (継続)" を除いた名前。"""
+    return base_subject(str(subject or '').strip()), str(name).strip()
+
+
+def collect_columns(plans_dir=PLANS_DIR, inbox=None):
+    """予定と実績を列の配列にする。
+
+    戻り値は (種類 (科目, タスク名) の一覧, 予定の列 (種類, 予定数, 予定時間), 実績の列 (種類, 完了数, 実績時間))。
+    """
+    # 重いモジュール（プランの読み込み）は較正を作るときだけ読む
+    import capacity_forecast
+    import done_task
+    from plan_catalog import PlanCatalog
+    from review_schedule import is_review
+
+    types = []
+    type_index = {}
+
+    def index_of(subject, name):
+        key = task_type(subject, name)
+        if key not in type_index:
+            type_index[key] = len(types)
+            types.append(key)
+        return type_index[key]
+
+    plan_type, plan_items, plan_hours = array('i'), array('d'), array('d')
+    catalog = PlanCatalog(plans_dir)
+    catalog.refresh()
+    for rel in sorted(catalog.entries):
+        try:
+            data = done_task.load_plan_csv(os.path.join(plans_dir, rel))
+        except (OSError, UnicodeDecodeError):
+            continue
+        subject = data['meta'].get('subject', '')
+        for r in data['plan_rows']:
+            # 復習の行（1問の時間が通常より短い）は較正に使わない
+            if r['assigned'] > 0 and str(r['name']).strip() and not is_review(r['name']):
+                plan_type.append(index_of(subject, r['name']))
+                plan_items.append(r['assigned'])
+                plan_hours.append(r['time'])
+
+    act_type, act_items, act_hours = array('i'), array('d'), array('d')
+    actuals = capacity_forecast.read_actuals(inbox or capacity_forecast.default_inbox(plans_dir))
+    # 実績の科目は、実績が指すプランの subject
+    subjects = {}
+    for (plan, _), entries in actuals.items():
+        if plan not in subjects:
+            try:
+                subjects[plan] = done_task.read_plan_meta(os.path.join(plans_dir, plan)).get('subject', '')
+            except (OSError, UnicodeDecodeError):
+                subjects[plan] = None
+        if subjects[plan] is None:
+            continue
+        for task, done, hours in entries:
+            if hours is not None and done > 0 and str(task).strip() and not is_review(task):
+                act_type.append(index_of(subjects[plan], task))
+                act_items.append(done)
+                act_hours.append(hours)
+    return types, (plan_type, plan_items, plan_hours), (act_type, act_items, act_hours)
+
+
+def fit(types, planned, actual, shrink=SHRINK, min_items=MIN_ITEMS):
+    """列から表（科目 -> タスク名 -> 推定値の dict）を作る。"""
+    n = len(types)
+    sums = {key: array('d', bytes(8 * n)) for key in ('plan_items', 'plan_hours', 'items', 'hours')}
+    counts = array('i', bytes(4 * n))
+    # 予定・実績それぞれ1回の走査で種類ごとのセルに集計する
+    for k, items, hours in zip(*planned):
+        sums['plan_items'][k] += items
+        sums['plan_hours'][k] += hours
+    for k, items, hours in zip(*actual):
+        sums['items'][k] += items
+        sums['hours'][k] += hours
+        counts[k] += 1
+    table = {}
+    for k, (subject, name) in enumerate(types):
+        items = sums['items'][k]
+        if items < min_items:
+            continue
+        observed = sums['hours'][k] / items
+        prior = sums['plan_hours'][k] / sums['plan_items'][k] if sums['plan_items'][k] else observed
+        estimate = (sums['hours'][k] + shrink * prior) / (items + shrink)
+        table.setdefault(subject, {})[name] = {
+            'time_per_item': round(estimate, 4),
+            'planned_time_per_item': round(prior, 4),
+            'difficulty': round(estimate / prior, 3) if prior > 0 else 1.0,
+            'items': int(items),
+            'samples': counts[k],
+        }
+    return table
+
+
+def calibrate(plans_dir=PLANS_DIR, inbox=None, shrink=SHRINK, min_items=MIN_ITEMS):
+    return fit(*collect_columns(plans_dir, inbox), shrink=shrink, min_items=min_items)
+
+
+def save_table(table, path=None):
+    path = path or table_path()
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': TABLE_VERSION, 'generated_at': datetime.now().isoformat(timespec='seconds'),
+                   'tasks': table}, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_table(path=None):
+    """保存した表（科目 -> タスク名 -> 推定値）。無い・読めない場合は空。ファイルが変わるまではキャッシュを返す。"""
+    path = path or table_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    table = data.get('tasks', {}) if data.get('version') == TABLE_VERSION else {}
+    _cache[path] = (mtime, table)
+    return table
+
+
+def default_table():
+    """プラン生成・再計画が既定で使う表（first_study_plan.USE_DIFFICULTY_CALIBRATION が False なら空）。"""
+    import first_study_plan
+    if not getattr(first_study_plan, 'USE_DIFFICULTY_CALIBRATION', True):
+        return {}
+    return load_table()
+
+
+def table_version(path=None):
+    """表の更新を区別する値（batch_jobs の入力ハッシュ用）。表が無ければ None。"""
+    try:
+        st = os.stat(path or table_path())
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def lookup(table, subject, name):
+    """表の (科目, タスク名) の推定値。無ければ None。"""
+    subject, name = task_type(subject, name)
+    return table.get(subject, {}).get(name)
+
+
+def calibrated_time(table, subject, name, default):
+    """表にあるタスクなら表の1問あたり時間、無ければ default。"""
+    entry = lookup(table, subject, name)
+    return float(entry['time_per_item']) if entry else default
+
+
+def apply_to_tasks(tasks, subject, table=None):
+    """科目 subject の割当用のタスクの difficulty を、1問時間 × difficulty が表の時間になるよう置き換える。
+
+    table を省略すると default_table()。戻り値は置き換えたタスク名のリスト。
+    """
+    if table is None:
+        table = default_table()
+    applied = []
+    if not table:
+        return applied
+    for t in tasks:
+        entry = lookup(table, subject, t['name'])
+        if not entry:
+            continue
+        hours = float(entry['time_per_item'])
+        if t.get('time_per_item', 0) > 0:
+            t['difficulty'] = hours / t['time_per_item']
+        else:
+            t['time_per_item'], t['difficulty'] = hours, 1.0
+        applied.append(t['name'])
+    return applied
+
+
+def format_table(table):
+    lines = [f"{'科目':<10}{'タスク':<16}{'見積(h/問)':>11}{'実績(h/問)':>11}{'倍率':>7}{'問題数':>8}"]
+    for subject in sorted(table):
+        tasks = table[subject]
+        for name in sorted(tasks, key=lambda k: -tasks[k]['items']):
+            e = tasks[name]
+            lines.append(f"{subject or '(無題)':<10}{name:<16}{e['planned_time_per_item']:>11.2f}{e['time_per_item']:>11.2f}"
+                         f"{e['difficulty']:>7.2f}{e['items']:>8}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プランと実績からタスクごとの1問あたり時間を較正します')
+    parser.add_argument('--dir', default=PLANS_DIR, help='plans フォルダー')
+    parser.add_argument('--inbox', default=None, help='実績の受信箱（既定: plans フォルダーの隣の inbox）')
+    parser.add_argument('--shrink', type=float, default=SHRINK, help='見積もりに寄せる強さ（問題数換算）')
+    parser.add_argument('--min-items', type=int, default=MIN_ITEMS, help='表に入れるのに必要な実績の問題数')
+    parser.add_argument('--dry-run', action='store_true', help='保存せずに表示だけする')
+    args = parser.parse_args(argv)
+    table = calibrate(args.dir, args.inbox, args.shrink, args.min_items)
+    print(format_table(table))
+    if not args.dry_run:
+        save_table(table, table_path(args.dir))
+        print(f"保存しました: {table_path(args.dir)}（{sum(len(tasks) for tasks in table.values())} 種類）")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,13 +6,19 @@
  - 今日行った各タスクの実績（完了数）を入力
  - 残りタスクを元に、残りの日数に対する再計画を作成して表示・保存
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 import csv
+import heapq
 import os
 import sys
 from datetime import datetime, timedelta
 import importlib.util
 
+import plan_archive
+import plan_store
+from plan_ledger import PlanLedger
+from review_schedule import is_review
+
 """study_plan.py を同ディレクトリのファイルパスから確実にロードする。
 通常のモジュール検索に依存せず、スクリプト直実行でも安定して動くようにする。
 """
@@ -36,98 +42,231 @@ spec.loader.exec_module(module)
 allocate_by_priority = getattr(module, 'allocate_by_priority')
 prompt_and_save = getattr(module, 'prompt_and_save')
 print_plan = getattr(module, 'print_plan')
+to_quanta = getattr(module, 'to_quanta')
+quanta_to_hours = getattr(module, 'quanta_to_hours')
+task_quanta = getattr(module, 'task_quanta')
+compute_total_time = getattr(module, 'compute_total_time')
+write_plan_csv = getattr(module, 'write_plan_csv')
 
 
-def load_plan_csv(path: str) -> Dict[str, Any]:
-    """CSV（本ツールの出力形式）を読み込み、メタ／日別容量／プラン行を返す。"""
+def iter_plan_csv(path: str) -> Iterator[Tuple[str, Any]]:
+    """CSV（本ツールの出力形式）を先頭から逐次読み、(種別, 値) を返すジェネレータ。
+
+    ('meta', dict) → ('day_capacities', list) → ('plan', 行 dict) ... の順に返す。
+    ファイル全体をメモリに載せないため、大量のプランを集計する処理に使う。
+    アーカイブの参照ファイル（meta に plan_ref がある）の場合は、メタ情報は参照ファイルから、
+    日別容量とプランは参照先の本体から読む。
+    """
     with open(path, newline='', encoding='utf-8') as f:
         reader = csv.reader(f)
-        rows = [r for r in reader]
+        meta, row = _read_meta_block(reader)
+        yield 'meta', meta
+        object_path = plan_archive.resolve(path, meta)
+        if object_path is None:
+            yield from _iter_sections(reader, row)
+            return
+    with open(object_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        _, row = _read_meta_block(reader)
+        yield from _iter_sections(reader, row)
 
-    i = 0
-    meta = {}
-    # メタ読み取り（先頭〜空行）
-    while i < len(rows) and rows[i]:
-        r = rows[i]
-        if len(r) >= 2:
-            meta[r[0]] = r[1]
-        i += 1
 
+def _read_meta_block(reader):
+    # メタ読み取り（先頭〜空行）。戻り値はメタ情報と、空行の次の行
+    meta = {}
+    row = next(reader, None)
+    while row:
+        if len(row) >= 2:
+            meta[row[0]] = row[1]
+        row = next(reader, None)
     # 空行を飛ばす
-    while i < len(rows) and not rows[i]:
-        i += 1
+    while row is not None and not row:
+        row = next(reader, None)
+    return meta, row
 
-    # Day Capacities セクション
+
+def _iter_sections(reader, row):
+    # Day Capacities セクション以降（row は空行の次の行）
     day_capacities = []
-    if i < len(rows) and rows[i] and rows[i][0].strip() == 'Day Capacities':
-        i += 1  # ヘッダ行
-        # 次行は列名 "Day", "AvailableHours"
-        i += 1
+    if row and row[0].strip() == 'Day Capacities':
+        next(reader, None)  # 列名 "Day", "AvailableHours"
+        row = next(reader, None)
         # CSV の Day 列は絶対番号になっている場合があるため、一旦辞書に格納してから
         # 1..max_day までの配列に整形する。
         tmp = {}
         max_day = 0
-        while i < len(rows) and rows[i]:
-            r = rows[i]
+        while row:
             try:
-                day_num = int(r[0])
-                hours = float(r[1])
+                day_num = int(row[0])
+                hours = float(row[1])
                 tmp[day_num] = hours
                 if day_num > max_day:
                     max_day = day_num
             except Exception:
                 pass
-            i += 1
+            row = next(reader, None)
         if max_day > 0:
             # 1..max_day の長さのリストを作り、未指定日は 0.0 を入れる
             day_capacities = [0.0] * max_day
             for dn, h in tmp.items():
                 if 1 <= dn <= max_day:
                     day_capacities[dn - 1] = h
-
-    # 空行を飛ばす
-    while i < len(rows) and not rows[i]:
-        i += 1
+        # 空行を飛ばす
+        while row is not None and not row:
+            row = next(reader, None)
+    elif row and row[0].strip() == 'Day Capacities RLE':
+        next(reader, None)  # 列名 "Day", "ToDay", "Every", "AvailableHours"
+        tmp = {}
+        for start, end, step, item in _read_runs(reader):
+            try:
+                hours = float(item[0])
+            except (ValueError, IndexError):
+                continue
+            for dn in range(start, end + 1, step):
+                tmp[dn] = hours
+        max_day = max(tmp, default=0)
+        if max_day > 0:
+            day_capacities = [0.0] * max_day
+            for dn, h in tmp.items():
+                if 1 <= dn <= max_day:
+                    day_capacities[dn - 1] = h
+        row = next(reader, None)
+        while row is not None and not row:
+            row = next(reader, None)
+    yield 'day_capacities', day_capacities
 
     # Plan セクション
-    plan_rows = []
-    if i < len(rows) and rows[i] and rows[i][0].strip() == 'Plan':
-        i += 1  # ヘッダ行
-        # 列名行
-        i += 1
-        while i < len(rows) and rows[i]:
-            r = rows[i]
+    if row and row[0].strip() == 'Plan':
+        next(reader, None)  # 列名行
+        row = next(reader, None)
+        while row:
             # 期待: Day, Task, Assigned, Time(hours)
             try:
-                day = int(r[0])
+                day = int(row[0])
             except Exception:
-                i += 1
+                row = next(reader, None)
                 continue
-            name = r[1]
+            name = row[1]
             assigned = 0
             try:
-                assigned = int(r[2]) if r[2] != '' else 0
+                assigned = int(row[2]) if row[2] != '' else 0
             except Exception:
                 assigned = 0
             time_h = 0.0
             try:
-                time_h = float(r[3]) if r[3] != '' else 0.0
+                time_h = float(row[3]) if row[3] != '' else 0.0
             except Exception:
                 time_h = 0.0
 
-            plan_rows.append({"day": day, "name": name, "assigned": assigned, "time": time_h})
-            i += 1
+            yield 'plan', {"day": day, "name": name, "assigned": assigned, "time": time_h}
+            row = next(reader, None)
+    elif row and row[0].strip() == 'Plan RLE':
+        next(reader, None)  # 列名行
+        yield from _iter_plan_runs(reader)
+
+
+def _read_runs(reader):
+    # RLE のセクション（Day, ToDay, Every, 項目...）の区間を1行ずつ (開始日, 終了日, 間隔, 項目の列) で返す
+    row = next(reader, None)
+    while row:
+        try:
+            yield int(row[0]), int(row[1]), max(1, int(row[2])), row[3:]
+        except (ValueError, IndexError):
+            pass
+        row = next(reader, None)
+
+
+def _iter_plan_runs(reader):
+    # Plan RLE セクション（Day, ToDay, Every, Task, Assigned, Time(hours)）を1日ずつ展開しながら返す。
+    # 1日分は、その日を含む区間をファイルの順に並べたもの（first_study_plan.day_runs を参照）。
+    # 区間は開始日順に並んでいるので、(次に現れる日, ファイル内の順番) のヒープで、開始日が来た区間から順に展開する。
+    heap = []
+    index = 0
+    row = next(reader, None)
+    while row or heap:
+        run = None
+        if row:
+            try:
+                start, end, step = int(row[0]), int(row[1]), max(1, int(row[2]))
+                run = (start, index, end, step, row[3], int(row[4]) if row[4] != '' else 0,
+                       float(row[5]) if row[5] != '' else 0.0)
+            except (ValueError, IndexError):
+                pass
+            row = next(reader, None)
+            if run is None:
+                continue
+        while heap and (run is None or heap[0][0] < run[0]):
+            day, i, end, step, name, assigned, time_h = heapq.heappop(heap)
+            if day + step <= end:
+                heapq.heappush(heap, (day + step, i, end, step, name, assigned, time_h))
+            yield 'plan', {"day": day, "name": name, "assigned": assigned, "time": time_h}
+        if run is not None:
+            heapq.heappush(heap, run)
+            index += 1
+
+
+def load_plan_csv(path: str) -> Dict[str, Any]:
+    """CSV（本ツールの出力形式）を読み込み、メタ／日別容量／プラン行と、読み込んだ時点の版を返す。"""
+    # 版は中身より先に読む（読んでいる間に書き換えられたら、保存時に競合として検出される）
+    version = plan_store.read_version(path)
+    meta = {}
+    day_capacities = []
+    plan_rows = []
+    for kind, value in iter_plan_csv(path):
+        if kind == 'meta':
+            meta = value
+        elif kind == 'day_capacities':
+            day_capacities = value
+        else:
+            plan_rows.append(value)
+    return {"meta": meta, "day_capacities": day_capacities, "plan_rows": plan_rows, "version": version,
+            "first_day": first_plan_day(plan_rows)}
+
+
+def first_plan_day(plan_rows: List[Dict[str, Any]]) -> int:
+    """CSV の最初の Day 番号（継続プランは start_day、通常は 1）。空の日の行も数える。"""
+    return min((r["day"] for r in plan_rows), default=1)
+
 
-    return {"meta": meta, "day_capacities": day_capacities, "plan_rows": plan_rows}
+def day_date(start_date, first_day: int, day: int):
+    """Day day の日付。start_date は CSV の最初の Day（first_day）の日付（継続プランも同じ）。"""
+    return start_date + timedelta(days=day - first_day)
+
+
+def day1_start_date(start_date: str, first_day: int) -> str:
+    """Day 1 から書き直すときの start_date（ISO 文字列）。読めない値や first_day が 1 ならそのまま返す。"""
+    if not start_date or first_day == 1:
+        return start_date
+    try:
+        return day_date(datetime.fromisoformat(start_date).date(), first_day, 1).isoformat()
+    except ValueError:
+        return start_date
+
+
+def read_plan_meta(path: str) -> Dict[str, str]:
+    """CSV 先頭のメタ部分（最初の空行まで）だけを読み取って返す。Plan 以降は読まない。"""
+    meta = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for r in csv.reader(f):
+            if not r:
+                break
+            if len(r) >= 2:
+                meta[r[0]] = r[1]
+    return meta
 
 
 def aggregate_tasks_from_plan(plan_rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    """Plan 行からタスクごとの合計割当や 1問当たり時間を推定して返す。"""
+    """Plan 行からタスクごとの合計割当や 1問当たり時間を推定して返す。
+
+    CSV の時間は小数2桁の時間表記なので、1問あたり時間は量子単位（分）に丸め直してから
+    平均する。これにより再計画を繰り返しても丸め誤差が積み重ならない。
+    復習の行（review_schedule.is_review）はタスクに含めない（再計画では pin_reviews で元の日に残す）。
+    """
     tasks = {}
     for r in plan_rows:
         name = r["name"]
         # 空文字（以前は '(休憩/学習無し)' を使っていたケースもある）をスキップする
-        if not str(name).strip():
+        if not str(name).strip() or is_review(name):
             continue
         assigned = int(r.get("assigned", 0))
         time_h = float(r.get("time", 0.0))
@@ -135,18 +274,161 @@ def aggregate_tasks_from_plan(plan_rows: List[Dict[str, Any]]) -> Dict[str, Dict
             tasks[name] = {"total_assigned": 0, "time_per_item_samples": [], "first_day": r["day"]}
         tasks[name]["total_assigned"] += assigned
         if assigned > 0:
-            tasks[name]["time_per_item_samples"].append(time_h / assigned)
+            tasks[name]["time_per_item_samples"].append(to_quanta(time_h) / assigned)
         # first_day を最小化
         tasks[name]["first_day"] = min(tasks[name]["first_day"], r["day"])
 
-    # 平均で time_per_item を決定
+    # 平均（量子単位に丸める）で time_per_item を決定
     for name, info in tasks.items():
         samples = info["time_per_item_samples"]
-        time_per_item = (sum(samples) / len(samples)) if samples else 1.0
+        time_per_item = quanta_to_hours(round(sum(samples) / len(samples))) if samples else 1.0
         info["time_per_item"] = time_per_item
     return tasks
 
 
+def pin_reviews(plan_rows: List[Dict[str, Any]], caps: List[float], start_day: int) -> Tuple[List[float], Dict[int, list]]:
+    """Day start_day からの caps の日に予定済みの復習を取り出し、その時間を除いた容量と 日 -> 復習 を返す。
+
+    復習は通常のタスクとして割り当て直さず、予定していた日にそのまま残す（with_reviews で戻す）。
+    """
+    reviews = {}
+    for r in plan_rows:
+        if start_day <= r["day"] < start_day + len(caps) and is_review(r["name"]):
+            reviews.setdefault(r["day"], []).append({"name": r["name"], "assigned": r["assigned"], "time": r["time"]})
+    free = []
+    for i, cap in enumerate(caps):
+        used = sum(to_quanta(it["time"]) for it in reviews.get(start_day + i, []))
+        free.append(quanta_to_hours(max(0, to_quanta(float(cap)) - used)))
+    return free, reviews
+
+
+def with_reviews(plan: List[List[Dict[str, Any]]], reviews: Dict[int, list], start_day: int) -> List[List[Dict[str, Any]]]:
+    """pin_reviews で取り出した復習を、割当の各日の後ろに戻す（review_schedule と同じ並び）。"""
+    return [day_tasks + reviews.get(start_day + i, []) for i, day_tasks in enumerate(plan)]
+
+
+def replan_plan_rows(plan_rows: List[Dict[str, Any]], day_capacities: List[float], today: int,
+                     done_today: Dict[str, int], next_caps: List[float] = None,
+                     ledger: PlanLedger = None, calibration: Dict[str, Any] = None,
+                     subject: str = None) -> Dict[str, Any]:
+    """今日の完了数を反映して今日より後を再計画する（対話なし、GUI の再計画と同じ規則）。
+
+    - next_caps を省略すると元の day_capacities の Day today+1 以降を使う
+    - 再計画するのは Day today+1 ～ today+len(next_caps)。それより後の元の日程はそのまま残す
+    - 戻り値の rows / day_capacities は Day1 からの通しのプラン（保存用）
+    - ledger（plan_rows の版の PlanLedger）を渡すと、過去の日について記録・修正済みの実績の差も
+      残り数に反映し、結果を新しい版として ledger に取り込む（plan_ledger.py を参照）
+    - subject（プランの科目）を渡すと、calibration（difficulty_calibration の表）にある (科目, タスク) の残りは
+      表の1問あたり時間で割り当て直す。calibration を省略すると保存された較正表を使う
+      （first_study_plan.USE_DIFFICULTY_CALIBRATION が False なら使わない）。subject が None なら表は使わない
+    - 再計画する日に予定済みの復習（「タスク名 (復習)」）は割り当て直さず、その日に残す（容量はその分減らす）
+    """
+    if next_caps is None:
+        next_caps = list(day_capacities[today:])
+    if not next_caps:
+        raise ValueError("再計画する日がありません（next_caps が空です）")
+    cutoff_day = today + len(next_caps)
+
+    tasks_info = aggregate_tasks_from_plan(plan_rows)
+    if subject is None:
+        calibration = {}
+    elif calibration is None:
+        import difficulty_calibration
+        calibration = difficulty_calibration.default_table()
+    # 予定数の区間和は台帳（タスクごとの Fenwick 木）で求める
+    work = ledger if ledger is not None else PlanLedger.from_rows(plan_rows, cutoff_day)
+    tasks_alloc = []
+    for name, info in tasks_info.items():
+        key = str(name).strip()
+        if key in work.planned and today <= work.days:
+            work.set_actual(key, today, int(done_today.get(key, 0)))
+        # 残り = (今日の計画 + 未来の割当) − 今日の完了（＋ 過去の実績の修正で増減した分）
+        rem = work.remaining(key, today, cutoff_day)
+        tasks_alloc.append({
+            "name": key,
+            "remaining": int(rem),
+            "total": int(rem),
+            "time_per_item": _calibrated_time(calibration, subject, key, float(info["time_per_item"])),
+            "difficulty": 1.0,
+            "priority": int(info["first_day"]),
+        })
+    requested = {t["name"]: t["remaining"] for t in tasks_alloc}
+    free_caps, reviews = pin_reviews(plan_rows, next_caps, today + 1)
+    plan = with_reviews(allocate_by_priority(free_caps, tasks_alloc), reviews, today + 1)
+
+    # 再計画範囲より後の元の日程をそのまま後ろにつなげる
+    max_day = max([cutoff_day] + [r["day"] for r in plan_rows])
+    later = {}
+    for r in plan_rows:
+        if r["day"] > cutoff_day and str(r["name"]).strip():
+            later.setdefault(r["day"], []).append({"name": r["name"], "assigned": r["assigned"], "time": r["time"]})
+    combined_plan = list(plan)
+    for day in range(cutoff_day + 1, max_day + 1):
+        combined_plan.append(later.get(day, []))
+
+    start_day = today + 1
+    total_days = max(len(day_capacities), start_day + len(combined_plan) - 1)
+    full_caps = [0.0] * total_days
+    for i in range(total_days):
+        if today < i + 1 <= cutoff_day:
+            full_caps[i] = float(next_caps[i - today])
+        elif i < len(day_capacities):
+            full_caps[i] = float(day_capacities[i])
+
+    rows = [r for r in plan_rows if r["day"] <= today]
+    for i, day_tasks in enumerate(combined_plan, start=start_day):
+        if not day_tasks:
+            rows.append({"day": i, "name": "", "assigned": 0, "time": 0.0})
+        for it in day_tasks:
+            rows.append({"day": i, "name": it["name"], "assigned": it["assigned"], "time": it["time"]})
+    if ledger is not None:
+        ledger.rebase(rows, today)
+
+    return {
+        "plan": plan,
+        "combined_plan": combined_plan,
+        "start_day": start_day,
+        "next_caps": list(next_caps),
+        "unassigned": {t["name"]: t["remaining"] for t in tasks_alloc if t["remaining"] > 0},
+        "requested": requested,
+        "rows": rows,
+        "day_capacities": full_caps,
+        "total_needed": quanta_to_hours(sum(to_quanta(it["time"]) for day_tasks in combined_plan for it in day_tasks)),
+    }
+
+
+def _calibrated_time(calibration, subject, name, default):
+    # 較正表に無いタスクは、プランの割当から推定した1問あたり時間のまま
+    if not calibration:
+        return default
+    import difficulty_calibration
+    return difficulty_calibration.calibrated_time(calibration, subject, name, default)
+
+
+def plan_from_rows(plan_rows: List[Dict[str, Any]], days: int) -> List[List[Dict[str, Any]]]:
+    """Day1 からの通しのプラン行を、write_plan_csv に渡せる日ごとのリストにする。"""
+    days = max([days] + [r["day"] for r in plan_rows])
+    plan = [[] for _ in range(days)]
+    for r in plan_rows:
+        if str(r["name"]).strip() and r["day"] >= 1:
+            plan[r["day"] - 1].append({"name": r["name"], "assigned": r["assigned"], "time": r["time"]})
+    return plan
+
+
+def check_feasibility(day_capacities: List[float], tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """必要時間と利用可能時間を比べ、実際に割り当てた場合の未割当数も返す（tasks は変更しない）。"""
+    tasks_copy = [dict(t, remaining=int(t.get("remaining", t.get("total", 0)))) for t in tasks]
+    total_needed = quanta_to_hours(sum(t["remaining"] * task_quanta(t) for t in tasks_copy))
+    allocate_by_priority(day_capacities, tasks_copy)
+    unassigned = {t["name"]: t["remaining"] for t in tasks_copy if t["remaining"] > 0}
+    return {
+        "total_available": float(sum(day_capacities)),
+        "total_needed": float(total_needed),
+        "unassigned": unassigned,
+        "feasible": not unassigned,
+    }
+
+
 def prompt_float(prompt: str, default: float = None) -> float:
     while True:
         s = input(prompt).strip()
@@ -176,6 +458,7 @@ def run():
     meta = data["meta"]
     day_capacities = data["day_capacities"]
     plan_rows = data["plan_rows"]
+    file_first_day = data["first_day"]
     subject = meta.get("subject", "(無題)")
     # start_date/test_date をメタから取得（ISO 日付文字列 -> datetime.date）
     start_date = None
@@ -200,6 +483,9 @@ def run():
             day_capacities.append(h)
 
     tasks_info = aggregate_tasks_from_plan(plan_rows)
+    # 較正表にあるタスクの残りは、実績から求めた1問あたり時間で再計画する
+    import difficulty_calibration
+    calibration = difficulty_calibration.default_table()
 
     # どの日を「今日」とするか
     max_day = max((r["day"] for r in plan_rows), default=len(day_capacities))
@@ -212,13 +498,15 @@ def run():
         today = 1
 
     # 各タスクについて提案値（その日の割当）を求め、ユーザーに完了数を入力してもらう
+    # 日ごとの予定数の区間和は台帳（タスクごとの Fenwick 木）で求める
+    ledger = PlanLedger.from_rows(plan_rows, len(day_capacities))
     completed_by_task = {}
     for name, info in tasks_info.items():
         total_assigned = info["total_assigned"]
-        # prev, today, future assigned
-        prev = sum(r["assigned"] for r in plan_rows if r["name"] == name and r["day"] < today)
-        today_assigned = sum(r["assigned"] for r in plan_rows if r["name"] == name and r["day"] == today)
-        future = sum(r["assigned"] for r in plan_rows if r["name"] == name and r["day"] > today)
+        # prev, today assigned
+        key = str(name).strip()
+        prev = ledger.planned_before(key, today)
+        today_assigned = ledger.planned_count(key, today, today)
         suggested = min(total_assigned - prev, today_assigned)
         if suggested < 0:
             suggested = 0
@@ -244,12 +532,12 @@ def run():
     remaining_tasks = []
     for name, info in tasks_info.items():
         total_assigned = info["total_assigned"]
-        prev = sum(r["assigned"] for r in plan_rows if r["name"] == name and r["day"] < today)
+        prev = completed_by_task.get(name, {}).get("prev_done", 0)
         done_today = completed_by_task.get(name, {}).get("done_today", 0)
         remaining = total_assigned - prev - done_today
         if remaining < 0:
             remaining = 0
-        time_per_item = info.get("time_per_item", 1.0)
+        time_per_item = _calibrated_time(calibration, subject, name, info.get("time_per_item", 1.0))
         first_day = info.get("first_day", today)
         # 優先度は最初に割り当てられた日が早いものを高優先度に
         priority = first_day
@@ -268,9 +556,13 @@ def run():
     else:
         print("CSV に残りの計画日がありません。新たに日数を入力してください。")
         nd = int(prompt_float("何日先まで計画しますか？ (整数): ", 7))
+        # 既定値は過去の実績から見込んだ曜日ごとの時間（実績が無ければ 2 時間）
+        import capacity_forecast
+        suggested = capacity_forecast.suggest_capacities(csv_file, meta, today + 1, nd, plans_dir=plans_dir,
+                                                       first_day=file_first_day) or [2.0] * nd
         next_day_caps = []
         for i in range(nd):
-            h = prompt_float(f"Day {i+1} の利用可能時間 (時間): ", 2.0)
+            h = prompt_float(f"Day {i+1} の利用可能時間 (時間): ", suggested[i])
             next_day_caps.append(h)
 
     # allocate
@@ -286,10 +578,11 @@ def run():
             "priority": t["priority"],
         })
 
-    total_needed = sum(t["remaining"] * t["time_per_item"] * t.get("difficulty", 1.0) for t in tasks_for_alloc)
-    plan = allocate_by_priority(next_day_caps, tasks_for_alloc)
-
     start_day = today + 1
+    # 予定済みの復習は割り当て直さず、その日に残す
+    free_caps, reviews = pin_reviews(plan_rows, next_day_caps, start_day)
+    total_needed = compute_total_time(tasks_for_alloc) + sum(it["time"] for its in reviews.values() for it in its)
+    plan = with_reviews(allocate_by_priority(free_caps, tasks_for_alloc), reviews, start_day)
 
     print('\n=== 再計画結果 ===')
     # Day 表示を元の絶対日付番号に合わせて表示するヘルパー
@@ -306,12 +599,12 @@ def run():
         for i, h in enumerate(day_caps, start=0):
             label = f"Day {start_day_num + i}"
             if base_date is not None:
-                day_date = base_date + timedelta(days=(start_day_num + i - 1))
+                this_date = day_date(base_date, file_first_day, start_day_num + i)
                 # 表示を m/d にして、テスト日までの残日数を付記 (Windows では '%-m' が無効なため安全にフォーマット)
-                date_str = f"{day_date.month}/{day_date.day}"
+                date_str = f"{this_date.month}/{this_date.day}"
                 rem = ''
                 if test_date is not None:
-                    days_left = (test_date - day_date).days
+                    days_left = (test_date - this_date).days
                     rem = f"　テストまで残り{days_left}日"
                 label = f"{label} ({date_str}{rem})"
             print(f"  {label}: {h:.2f} 時間")
@@ -325,11 +618,11 @@ def run():
         for i, day_tasks in enumerate(plan_list, start=0):
             label = f"Day {start_day_num + i}"
             if base_date is not None:
-                day_date = base_date + timedelta(days=(start_day_num + i - 1))
-                date_str = f"{day_date.month}/{day_date.day}"
+                this_date = day_date(base_date, file_first_day, start_day_num + i)
+                date_str = f"{this_date.month}/{this_date.day}"
                 rem = ''
                 if test_date is not None:
-                    days_left = (test_date - day_date).days
+                    days_left = (test_date - this_date).days
                     rem = f"　テストまで残り{days_left}日"
                 label = f"{label} ({date_str}{rem})"
             print(f"{label}:")
@@ -361,42 +654,24 @@ def run():
             basename = safe
 
         path = os.path.join(plans_dir, basename)
-        if os.path.exists(path):
+        # 上書きを確認した時点の版（無ければ None）。保存までに他で書き換えられたら上書きしない
+        expected = plan_store.read_version(path)
+        if expected is not None:
             ans = input(f"{path} は既に存在します。上書きしますか？(y/n): ").strip().lower()
             if ans != 'y':
                 print("保存をキャンセルしました。")
                 return
 
         # CSV 書き出し（Day 番号は start_day をオフセットして出力）
-        with open(path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(["subject", subject + ' (継続)'])
-            writer.writerow(["generated_at", datetime.now().isoformat()])
-            writer.writerow(["total_available", f"{sum(next_day_caps):.2f}"])
-            writer.writerow(["total_needed", f"{total_needed:.2f}"])
-            # 新しい開始日をメタに含める（元 start_date があればそれをオフセット）
-            if start_date is not None:
-                new_start_date = start_date + timedelta(days=(start_day - 1))
-                writer.writerow(["start_date", new_start_date.isoformat()])
-            if test_date is not None:
-                writer.writerow(["test_date", test_date.isoformat()])
-            writer.writerow([])
-
-            writer.writerow(["Day Capacities"])
-            writer.writerow(["Day", "AvailableHours"])
-            for i, h in enumerate(next_day_caps, start=0):
-                writer.writerow([start_day + i, f"{h:.2f}"])
-            writer.writerow([])
-
-            writer.writerow(["Plan"])
-            writer.writerow(["Day", "Task", "Assigned", "Time(hours)"])
-            for i, day_tasks in enumerate(plan, start=0):
-                if not day_tasks:
-                    # 割当がない日の CSV 行ではタスク名を空文字で出力する
-                    writer.writerow([start_day + i, "", "", ""])
-                else:
-                    for it in day_tasks:
-                        writer.writerow([start_day + i, it["name"], it["assigned"], f"{it['time']:.2f}"])
+        # 新しい開始日（Day start_day の日付）をメタに含める
+        new_start_date = day_date(start_date, file_first_day, start_day).isoformat() if start_date is not None else None
+        try:
+            write_plan_csv(path, subject + ' (継続)', next_day_caps, plan, total_needed,
+                           start_date=new_start_date, test_date=test_date.isoformat() if test_date is not None else None,
+                           start_day=start_day, expected=expected)
+        except plan_store.PlanConflict as e:
+            print(f"{e}。保存をキャンセルしました。")
+            return
 
         print(f"プランを保存しました: {path}")
 
@@ -6,12 +6,14 @@
  - 優先度の高いタスクから、各日ごとに可能な問題数を割り当てます
 """
 
-from math import floor
+import heapq
 import json
-import csv
+import math
 import os
 from datetime import datetime
 
+import plan_store
+
 # --- オプション: ファイル内で値を定義して対話入力をスキップできます ---
 # 例:
 # SUBJECT_PRESET = "数学"
@@ -19,8 +21,9 @@ from datetime import datetime
 # COMMON_TIME_PER_ITEM_PRESET = 0.5  # 全タスク共通の1問あたり時間
 # TASKS_PRESET = [
 #     {"name": "教科書問題", "total": 10, "priority": 1, "difficulty": 1.0},
-#     {"name": "過去問", "total": 5, "priority": 2, "difficulty": 1.2},
+#     {"name": "過去問", "total": 5, "priority": 2, "difficulty": 1.2, "after": ["教科書問題"]},
 # ]
+# "after" には前提タスク名のリストを指定できます（前提がすべて終わるまで割り当てません）。
 # デフォルトでは None。編集して値を入れると対話入力をスキップします。
 SUBJECT_PRESET = "例)数学"
 DAY_CAPACITIES_PRESET = [2.0,3.0,3.0,3.0,3.0,8.0,8.0]
@@ -35,7 +38,25 @@ TASKS_PRESET = [
 # ここに日付文字列を設定すると CSV に保存され、他ツールで利用できます。
 START_DATE_PRESET = "2025-12-01"
 TEST_DATE_PRESET = "2025-12-08"
+# 時間計算の最小単位（分）。割当・集計は内部でこの単位の整数で行い、
+# 表示・CSV のときだけ時間（hours）に戻します。浮動小数の誤差が再計画のたびに
+# 積み重なることを防ぎ、同じ入力からは常に同じ結果が得られます。
+TIME_QUANTUM_MINUTES = 1
+# 復習（間隔反復）の間隔（日）。例: (1, 3, 7) にすると、割り当てた問題を 1・3・7 日の間隔で
+# 「タスク名 (復習)」として復習に入れます（review_schedule.py を参照）。None なら復習は入れません。
+REVIEW_INTERVALS_PRESET = None
+# True にすると CSV の日別容量とプランを「Day Capacities RLE」「Plan RLE」セクション（同じ内容が毎日・1日おき・
+# 毎週のように一定の間隔で続く日をまとめて1行）で保存します。長期間のプランほど小さく・速く読めます。
+# 読み込みは両方の形式に対応しています（この形式に対応する前の版のツールは RLE のファイルを読めません）。
+PLAN_CSV_RLE = False
+# RLE で1つの区間にまとめる日の間隔の上限（7 なら毎週の繰り返しまで）
+RLE_MAX_STEP = 7
+# True なら、difficulty_calibration.py で作った較正表（plans/.difficulty_calibration.json）にあるタスクは
+# 実績から求めた1問あたり時間で計画・再計画します（表が無ければ何もしません）。手で決めた difficulty を使うなら False。
+USE_DIFFICULTY_CALIBRATION = True
 # ------------------------------------------------------------------
+# 継続プラン（done_task.py の再計画）の科目名に付く印
+CONTINUED_SUFFIX = ' (継続)'
 
 
 def prompt_float(prompt, default=None):
@@ -79,20 +100,77 @@ def collect_inputs():
             "time_per_item": common_time_per_item,
             "difficulty": float(src.get("difficulty", 1.0)),
             "priority": int(src.get("priority", 99)),
+            "after": list(src.get("after", [])),
         })
+    # 実績から較正した1問あたり時間があればそれを使う（difficulty_calibration.py を参照）
+    import difficulty_calibration
+    calibrated = difficulty_calibration.apply_to_tasks(tasks, subject)
+    if calibrated:
+        print(f"較正した1問あたり時間を使います: {', '.join(calibrated)}")
 
     print(f"プリセットを使用します: 科目={subject}, 合計時間={total_available:.2f} 時間, 日数={len(day_hours)}")
     return subject, day_hours, total_available, tasks
 
 
+# 量子単位への換算で、浮動小数の誤差（0.5 時間 → 30.000000000000004 分など）とみなす幅
+QUANTA_EPS = 1e-9
+
+
+def to_quanta(hours):
+    # 時間（hours, float）を TIME_QUANTUM_MINUTES 単位の整数に丸める（0.5 は常に切り上げ。
+    # round() の偶数丸めだと 7.5 → 8、22.5 → 22 のように向きがそろわない）
+    return math.floor(float(hours) * 60 / TIME_QUANTUM_MINUTES + 0.5 + QUANTA_EPS)
+
+
+def quanta_to_hours(quanta):
+    return quanta * TIME_QUANTUM_MINUTES / 60
+
+
+def quantize_hours(hours):
+    # 時間を量子単位に丸めた値（hours）を返す
+    return quanta_to_hours(to_quanta(hours))
+
+
+def task_quanta(task):
+    # 1問あたりの所要時間（1問時間 × 難易度）を量子単位の整数で返す。
+    # 見積もりより短く数えないよう切り上げ、正の時間は最低 1 量子にする（0 にすると割り当てられなくなる）
+    q = float(task.get("time_per_item", 0)) * task.get("difficulty", 1.0) * 60 / TIME_QUANTUM_MINUTES
+    if q <= 0:
+        return 0
+    return max(1, math.ceil(q - QUANTA_EPS))
+
+
 def compute_total_time(tasks):
-    total = 0.0
+    total = 0
     for t in tasks:
-        total += t["total"] * t["time_per_item"] * t["difficulty"]
-    return total
+        total += t["total"] * task_quanta(t)
+    return quanta_to_hours(total)
+
+
+def base_subject(subject):
+    # 継続プランは科目名に " (継続)" が付く（繰り返し付くこともある）
+    while subject.endswith(CONTINUED_SUFFIX):
+        subject = subject[:-len(CONTINUED_SUFFIX)]
+    return subject
+
+
+def deadline_days(days, start_date=None, test_date=None):
+    # テスト日の前日までを計画対象とする（start_date が Day1）
+    if start_date is None or test_date is None:
+        return days
+    try:
+        start = datetime.fromisoformat(str(start_date)).date()
+        test = datetime.fromisoformat(str(test_date)).date()
+    except ValueError:
+        return days
+    return max(0, min(days, (test - start).days))
 
 
 def allocate_by_priority(day_capacities, tasks):
+    # 前提タスクが指定されている場合は依存関係を考慮した割当に切り替える
+    if any(_prerequisites(t) for t in tasks):
+        return allocate_with_prerequisites(day_capacities, tasks)
+
     # 日ごとに埋めていく方式：各日について利用可能時間を使い切るよう
     # 優先度順（数値が小さいほど高優先度と扱う）にタスクを割り当てます。
     # 同一優先度内では残数が多いものを先に割り当てることで、重要な大きなタスク
@@ -102,7 +180,8 @@ def allocate_by_priority(day_capacities, tasks):
 
     # 各日を先頭から処理していく
     for day in range(days):
-        remaining_time = float(day_capacities[day])
+        # 残時間は量子単位の整数で扱う
+        remaining_time = to_quanta(day_capacities[day])
         any_assigned_today = False
 
         # その日の割当ループ：毎パスで優先度順に並べ替えて割当を試みる
@@ -115,21 +194,21 @@ def allocate_by_priority(day_capacities, tasks):
             for t in tasks_sorted:
                 if t.get("remaining", 0) <= 0:
                     continue
-                time_per = t.get("time_per_item", 0) * t.get("difficulty", 1.0)
+                time_per = task_quanta(t)
                 if time_per <= 0:
                     # 所要時間が不正ならスキップ
                     continue
 
                 # その日の残時間に何問入るか
                 if remaining_time >= time_per:
-                    max_items = int(floor(remaining_time / time_per))
+                    max_items = remaining_time // time_per
                     assign = min(max_items, t["remaining"])
                     if assign <= 0:
                         continue
                     # 割当
                     t["remaining"] -= assign
                     remaining_time -= assign * time_per
-                    plan[day].append({"name": t["name"], "assigned": assign, "time": assign * time_per})
+                    plan[day].append({"name": t["name"], "assigned": assign, "time": quanta_to_hours(assign * time_per)})
                     assigned_in_pass = True
                     any_assigned_today = True
                 # 余裕がない場合は次のタスクを試す
@@ -144,13 +223,13 @@ def allocate_by_priority(day_capacities, tasks):
                     for t in tasks_sorted:
                         if t.get("remaining", 0) <= 0:
                             continue
-                        time_per = t.get("time_per_item", 0) * t.get("difficulty", 1.0)
+                        time_per = task_quanta(t)
                         if time_per <= 0:
                             continue
                         # 1問割り当て（残時間が足りなくても強制割当）
                         t["remaining"] -= 1
                         remaining_time -= time_per
-                        plan[day].append({"name": t["name"], "assigned": 1, "time": time_per})
+                        plan[day].append({"name": t["name"], "assigned": 1, "time": quanta_to_hours(time_per)})
                         any_assigned_today = True
                         assigned_in_pass = True
                         break
@@ -162,6 +241,144 @@ def allocate_by_priority(day_capacities, tasks):
     return plan
 
 
+def _prerequisites(task):
+    # "after" は前提タスク名のリスト（文字列1つでも可）
+    after = task.get("after") or []
+    if isinstance(after, str):
+        after = [after]
+    return [str(a).strip() for a in after if str(a).strip()]
+
+
+def _build_dependency_graph(tasks):
+    # タスク名 -> インデックス、各タスクの後続リスト、未完了の前提数を作る
+    index = {}
+    for idx, t in enumerate(tasks):
+        if t["name"] in index:
+            raise ValueError(f"タスク名が重複しています: {t['name']}")
+        index[t["name"]] = idx
+
+    dependents = [[] for _ in tasks]
+    pending = [0] * len(tasks)
+    for idx, t in enumerate(tasks):
+        for pre in _prerequisites(t):
+            if pre not in index:
+                raise ValueError(f"前提タスク '{pre}' が見つかりません（{t['name']}）")
+            dependents[index[pre]].append(idx)
+            # 既に完了している前提は数えない
+            if tasks[index[pre]].get("remaining", 0) > 0:
+                # 1問あたり時間が 0 以下の前提は割り当てられず、いつまでも完了しない
+                if task_quanta(tasks[index[pre]]) <= 0:
+                    raise ValueError(f"前提タスク '{pre}' の1問あたり時間が 0 以下のため完了できません（{t['name']}）")
+                pending[idx] += 1
+
+    # 循環チェック（Kahn 法）: 全ノードを取り出せなければ循環がある
+    indeg = [len(_prerequisites(t)) for t in tasks]
+    queue = [i for i, d in enumerate(indeg) if d == 0]
+    seen = 0
+    while queue:
+        i = queue.pop()
+        seen += 1
+        for j in dependents[i]:
+            indeg[j] -= 1
+            if indeg[j] == 0:
+                queue.append(j)
+    if seen != len(tasks):
+        cyclic = [tasks[i]["name"] for i, d in enumerate(indeg) if d > 0]
+        raise ValueError("前提タスクが循環しています: " + ", ".join(cyclic))
+
+    return dependents, pending
+
+
+def allocate_with_prerequisites(day_capacities, tasks):
+    # 前提タスク（"after"）がすべて完了するまで後続タスクを解放しない割当。
+    # 解放済みタスクだけを優先度ヒープ（ready set）に保持し、タスク完了時に後続の
+    # 未完了前提数を減らして解放する。毎パスで全タスクをソート／走査しないため、
+    # 数千件の依存付きタスクでも日数×割当回数×log(タスク数) 程度で済みます。
+    # 割当規則（優先度→残数の順、最低1問ルール）は allocate_by_priority と同じです。
+    days = len(day_capacities)
+    plan = [[] for _ in range(days)]
+    dependents, pending = _build_dependency_graph(tasks)
+
+    time_per_of = task_quanta
+
+    def key_of(idx):
+        t = tasks[idx]
+        return (t.get("priority", 99), -int(t.get("remaining", 0)), idx)
+
+    valid = [time_per_of(t) > 0 for t in tasks]
+    if not any(valid):
+        return plan
+    min_time_per = min(time_per_of(t) for t, ok in zip(tasks, valid) if ok)
+
+    ready = []
+
+    def release(idx):
+        if valid[idx] and tasks[idx].get("remaining", 0) > 0:
+            heapq.heappush(ready, key_of(idx))
+
+    def complete(idx):
+        # 完了したタスクの後続について未完了前提数を減らし、0 になったら解放
+        for j in dependents[idx]:
+            pending[j] -= 1
+            if pending[j] == 0:
+                release(j)
+
+    for idx in range(len(tasks)):
+        if pending[idx] == 0:
+            release(idx)
+
+    for day in range(days):
+        remaining_time = to_quanta(day_capacities[day])
+        any_assigned_today = False
+        # その日に入りきらなかった／途中まで割り当てたタスクは翌日にヒープへ戻す
+        deferred = []
+
+        while ready and remaining_time >= min_time_per:
+            idx = heapq.heappop(ready)[-1]
+            t = tasks[idx]
+            time_per = time_per_of(t)
+            if remaining_time < time_per:
+                deferred.append(idx)
+                continue
+            assign = min(remaining_time // time_per, t["remaining"])
+            t["remaining"] -= assign
+            remaining_time -= assign * time_per
+            plan[day].append({"name": t["name"], "assigned": assign, "time": quanta_to_hours(assign * time_per)})
+            any_assigned_today = True
+            if t["remaining"] <= 0:
+                complete(idx)
+            else:
+                deferred.append(idx)
+
+        # 最低1問ルール: 何も割り当てられず時間が少し残っている場合は最優先の1問を強制割当
+        if (not any_assigned_today) and remaining_time > 0:
+            candidates = deferred + [k[-1] for k in ready]
+            if candidates:
+                idx = min(candidates, key=key_of)
+                t = tasks[idx]
+                time_per = time_per_of(t)
+                t["remaining"] -= 1
+                remaining_time -= time_per
+                plan[day].append({"name": t["name"], "assigned": 1, "time": quanta_to_hours(time_per)})
+                if t["remaining"] <= 0:
+                    if idx in deferred:
+                        deferred.remove(idx)
+                    else:
+                        ready = [k for k in ready if k[-1] != idx]
+                        heapq.heapify(ready)
+                    complete(idx)
+                elif idx not in deferred:
+                    # ヒープ内のキー（残数）が変わったので入れ直す
+                    ready = [k for k in ready if k[-1] != idx]
+                    heapq.heapify(ready)
+                    deferred.append(idx)
+
+        for idx in deferred:
+            heapq.heappush(ready, key_of(idx))
+
+    return plan
+
+
 def print_plan(subject, total_available, day_capacities, tasks, total_needed, plan):
     days = len(day_capacities)
     print('\n' + '='*40)
@@ -196,7 +413,7 @@ def print_plan(subject, total_available, day_capacities, tasks, total_needed, pl
     if remaining:
         print("割り当て後に残ったタスク:")
         for t in remaining:
-            est = t["remaining"] * t["time_per_item"] * t["difficulty"]
+            est = quanta_to_hours(t["remaining"] * task_quanta(t))
             print(f"  - {t['name']}: 残り {t['remaining']} 問（推定 {est:.2f} 時間）")
         print('\n利用可能時間内に収めるには、問題数を減らすか、1問あたりの時間/難易度を見直してください。')
 
@@ -217,48 +434,126 @@ def _export_plan_json(path, subject, day_capacities, plan):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def _export_plan_csv(path, subject, day_capacities, tasks, total_needed, plan):
-    # CSV にメタ情報、日別容量、プラン、最後に人間向けレポート行をまとめて書く
-    with open(path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        # メタ情報
-        writer.writerow(["subject", subject])
-        writer.writerow(["generated_at", datetime.now().isoformat()])
-        writer.writerow(["total_available", f"{sum(day_capacities):.2f}"])
-        writer.writerow(["total_needed", f"{total_needed:.2f}"])
-        # 日付メタ（オプション）
-        try:
-            if START_DATE_PRESET is not None:
-                writer.writerow(["start_date", str(START_DATE_PRESET)])
-        except NameError:
-            pass
-        try:
-            if TEST_DATE_PRESET is not None:
-                writer.writerow(["test_date", str(TEST_DATE_PRESET)])
-        except NameError:
-            pass
-        writer.writerow([])
-
-        # 日別容量セクション
-        writer.writerow(["Day Capacities"])
-        writer.writerow(["Day", "AvailableHours"])
-        for i, h in enumerate(day_capacities, start=1):
-            writer.writerow([i, f"{h:.2f}"])
-        writer.writerow([])
-
-        # プラン本体
-        writer.writerow(["Plan"])
-        writer.writerow(["Day", "Task", "Assigned", "Time(hours)"])
-        for i, day_tasks in enumerate(plan, start=1):
-            if not day_tasks:
-                # 以前は空日の行でプレースホルダを書いていたが、現在はタスク名を空文字で出力する
-                writer.writerow([i, "", "", ""])
-            else:
-                for it in day_tasks:
-                    writer.writerow([i, it["name"], it["assigned"], f"{it['time']:.2f}"])
-        writer.writerow([])
+def day_runs(day_items, start_day=1, max_step=RLE_MAX_STEP):
+    # 日ごとの項目の列（day_items[i] は Day start_day+i の項目のタプルのリスト）を、
+    # 「Day から ToDay まで Every 日おきに同じ項目」の区間 [開始日, 終了日, 間隔, *項目] にまとめる。
+    # 読み手（done_task._iter_plan_runs）は、その日を含む区間をファイルの順に並べて1日分を復元するので、
+    # 区間を延ばすのは、その日の先頭から同じ順に並ぶ間だけにする（日の中の順序も保つ）。
+    # 間隔は2回目に現れた日で決まり、max_step 日より離れたら別の区間にする。戻り値は開始日順。
+    runs = []
+    open_runs = []
+    for day, items in enumerate(day_items, start=start_day):
+        matched = []
+        pos = 0
+        i = 0
+        while i < len(items):
+            j = pos
+            while j < len(open_runs):
+                run = open_runs[j]
+                step = day - run[1] if run[0] == run[1] else run[2]
+                if run[1] + step == day and step <= max_step and tuple(run[3:]) == items[i]:
+                    break
+                j += 1
+            if j == len(open_runs):
+                break
+            run = open_runs[j]
+            run[2] = day - run[1]
+            run[1] = day
+            matched.append(id(run))
+            pos = j + 1
+            i += 1
+        for item in items[i:]:
+            run = [day, day, 1, *item]
+            runs.append(run)
+            open_runs.append(run)
+            matched.append(id(run))
+        # この日を飛ばした区間は閉じる（間隔の決まっていない区間は max_step 日まで待つ）
+        matched = set(matched)
+        open_runs = [r for r in open_runs if id(r) in matched
+                     or (r[0] == r[1] and day - r[1] < max_step)
+                     or (r[0] != r[1] and r[1] + r[2] > day)]
+    return runs
+
+
+def plan_csv_rows(subject, day_capacities, plan, total_needed, start_date=None, test_date=None, start_day=1,
+                  rle=None):
+    # 本ツールの CSV 形式（メタ → Day Capacities → Plan）の行を順に返す。
+    # start_day を指定すると Day 番号をその日からの絶対番号で出力する（継続プラン用）。
+    # rle=True なら日別容量とプランを RLE のセクションで書く（None は PLAN_CSV_RLE に従う）。
+    if rle is None:
+        rle = PLAN_CSV_RLE
+    # メタ情報
+    yield ["subject", subject]
+    yield ["generated_at", datetime.now().isoformat()]
+    yield ["total_available", f"{sum(day_capacities):.2f}"]
+    yield ["total_needed", f"{total_needed:.2f}"]
+    # 日付メタ（オプション）
+    if start_date is not None:
+        yield ["start_date", str(start_date)]
+    if test_date is not None:
+        yield ["test_date", str(test_date)]
+    if rle:
+        # 読み込んで保存し直すツールが同じ形式を保てるように印を残す
+        yield ["plan_encoding", "rle"]
+    yield []
+
+    # 日別容量セクション
+    if rle:
+        yield ["Day Capacities RLE"]
+        yield ["Day", "ToDay", "Every", "AvailableHours"]
+        yield from day_runs([[(f"{h:.2f}",)] for h in day_capacities], start_day)
+    else:
+        yield ["Day Capacities"]
+        yield ["Day", "AvailableHours"]
+        for i, h in enumerate(day_capacities, start=start_day):
+            yield [i, f"{h:.2f}"]
+    yield []
+
+    # プラン本体
+    if rle:
+        yield ["Plan RLE"]
+        yield ["Day", "ToDay", "Every", "Task", "Assigned", "Time(hours)"]
+        # 空日は Task を空文字にした区間にする（従来の形式の空日の行と同じ）
+        yield from day_runs([[(it["name"], it["assigned"], f"{it['time']:.2f}") for it in day_tasks] or [("", "", "")]
+                             for day_tasks in plan], start_day)
+        yield []
+        return
+    yield ["Plan"]
+    yield ["Day", "Task", "Assigned", "Time(hours)"]
+    for i, day_tasks in enumerate(plan, start=start_day):
+        if not day_tasks:
+            # 以前は空日の行でプレースホルダを書いていたが、現在はタスク名を空文字で出力する
+            yield [i, "", "", ""]
+        else:
+            for it in day_tasks:
+                yield [i, it["name"], it["assigned"], f"{it['time']:.2f}"]
+    yield []
 
-        # (Remaining セクションは不要のため出力しない)
+    # (Remaining セクションは不要のため出力しない)
+
+
+def write_plan_csv(path, subject, day_capacities, plan, total_needed, start_date=None, test_date=None, start_day=1,
+                   expected=plan_store.ANY, rle=None):
+    # 共通の保存処理。plans/ の中に保存する場合は同じ内容の本体を1つだけ持ち、
+    # path には本体への参照ファイルを書く（plan_archive.py を参照）。
+    # 書き込みはプランごとのロックを取って一時ファイルから置き換える。expected に読み込んだときの版を
+    # 渡すと、その後に他で書き換えられていた場合は plan_store.PlanConflict になる（plan_store.py を参照）。
+    # 戻り値は保存後の版。rle は plan_csv_rows を参照。
+    rows = plan_csv_rows(subject, day_capacities, plan, total_needed, start_date, test_date, start_day, rle)
+    return plan_store.write_rows(path, rows, expected)
+
+
+def _export_plan_csv(path, subject, day_capacities, tasks, total_needed, plan):
+    # CSV にメタ情報、日別容量、プランをまとめて書く（日付メタはプリセットから）
+    try:
+        start_date = START_DATE_PRESET
+    except NameError:
+        start_date = None
+    try:
+        test_date = TEST_DATE_PRESET
+    except NameError:
+        test_date = None
+    write_plan_csv(path, subject, day_capacities, plan, total_needed, start_date=start_date, test_date=test_date)
     
 
 def _export_plan_txt(path, subject, day_capacities, tasks, total_needed, plan):
@@ -293,7 +588,7 @@ def _export_plan_txt(path, subject, day_capacities, tasks, total_needed, plan):
     if remaining:
         lines.append("割り当て後に残ったタスク:")
         for t in remaining:
-            est = t["remaining"] * t["time_per_item"] * t["difficulty"]
+            est = quanta_to_hours(t["remaining"] * task_quanta(t))
             lines.append(f"  - {t['name']}: 残り {t['remaining']} 問（推定 {est:.2f} 時間）")
         lines.append('\n利用可能時間内に収めるには、問題数を減らすか、1問あたりの時間/難易度を見直してください。')
 
@@ -332,7 +627,13 @@ def prompt_and_save(subject, day_capacities, plan, tasks, total_needed):
 def main():
     subject, day_capacities, total_available, tasks = collect_inputs()
     total_needed = compute_total_time(tasks)
-    plan = allocate_by_priority(day_capacities, tasks)
+    if REVIEW_INTERVALS_PRESET:
+        # 復習込みの割当（テスト日の前日までに入る復習だけを予定する）
+        import review_schedule
+        deadline = deadline_days(len(day_capacities), START_DATE_PRESET, TEST_DATE_PRESET)
+        plan = review_schedule.allocate_with_reviews(day_capacities, tasks, REVIEW_INTERVALS_PRESET, deadline=deadline)
+    else:
+        plan = allocate_by_priority(day_capacities, tasks)
     print_plan(subject, total_available, day_capacities, tasks, total_needed, plan)
     # 生成したプランを保存するか確認（テキストレポートも自動で作成されます）
     prompt_and_save(subject, day_capacities, plan, tasks, total_needed)
@@ -0,0 +1,225 @@
+"""複数科目をまとめて計画するスクリプト（1日の学習可能時間を全科目で共有）
+
+使い方:
+ - `python multi_subject_plan.py` で実行
+ - ファイル内の SUBJECTS_PRESET / DAY_CAPACITIES_PRESET を編集して使います
+ - 各日の共有容量を「残り必要時間 ÷ テストまでの残日数」（必要ペース）に比例して科目に配分し、
+   科目内では優先度順（allocate_by_priority と同じ規則）に割り当てます
+ - 配分しきれなかった端数時間はテスト日が近い科目から順に回します
+ - 結果は科目ごとに通常のプラン CSV（Day Capacities は科目に配分された時間）として保存します
+"""
+import heapq
+import os
+from datetime import datetime
+
+import difficulty_calibration
+import first_study_plan
+
+# --- プリセット（first_study_plan.py と同じ書式のタスクを科目ごとに並べる） ---
+START_DATE_PRESET = "2025-12-01"
+DAY_CAPACITIES_PRESET = [3.0, 4.0, 4.0, 4.0, 4.0, 10.0, 10.0, 3.0, 3.0]
+COMMON_TIME_PER_ITEM_PRESET = 0.5
+SUBJECTS_PRESET = [
+    {
+        "subject": "例)数学",
+        "test_date": "2025-12-08",
+        "tasks": [
+            {"name": "例)教科書問題", "total": 27, "priority": 1, "difficulty": 1.0},
+            {"name": "例)過去問", "total": 2, "priority": 2, "difficulty": 4.0, "after": ["例)教科書問題"]},
+        ],
+    },
+    {
+        "subject": "例)英語",
+        "test_date": "2025-12-10",
+        "tasks": [
+            {"name": "例)英単語", "total": 40, "priority": 1, "difficulty": 0.5},
+            {"name": "例)長文読解", "total": 8, "priority": 2, "difficulty": 2.0},
+        ],
+    },
+]
+# ------------------------------------------------------------------
+
+
+class _SubjectState:
+    """科目ごとの割当状態（解放済みタスクの優先度ヒープと前提管理）。"""
+
+    def __init__(self, subject, tasks, deadline):
+        self.subject = subject
+        self.tasks = tasks
+        self.deadline = deadline
+        self.dependents, self.pending = first_study_plan._build_dependency_graph(tasks)
+        # 時間はすべて量子単位（first_study_plan.TIME_QUANTUM_MINUTES）の整数
+        self.time_per = [first_study_plan.task_quanta(t) for t in tasks]
+        valid = [tp for tp in self.time_per if tp > 0]
+        self.min_time_per = min(valid) if valid else None
+        self.remaining_quanta = sum(t["remaining"] * tp for t, tp in zip(tasks, self.time_per) if tp > 0)
+        self.ready = []
+        self.deferred = []
+        for idx in range(len(tasks)):
+            if self.pending[idx] == 0:
+                self._release(idx)
+
+    def _key(self, idx):
+        t = self.tasks[idx]
+        return (t.get("priority", 99), -int(t.get("remaining", 0)), idx)
+
+    def _release(self, idx):
+        if self.time_per[idx] > 0 and self.tasks[idx].get("remaining", 0) > 0:
+            heapq.heappush(self.ready, self._key(idx))
+
+    def _assign(self, idx, count, day_tasks):
+        t = self.tasks[idx]
+        time_used = count * self.time_per[idx]
+        t["remaining"] -= count
+        self.remaining_quanta -= time_used
+        day_tasks.append({"name": t["name"], "assigned": count, "time": first_study_plan.quanta_to_hours(time_used)})
+        if t["remaining"] <= 0:
+            for j in self.dependents[idx]:
+                self.pending[j] -= 1
+                if self.pending[j] == 0:
+                    self._release(j)
+        return time_used
+
+    def active(self, day):
+        return day < self.deadline and self.remaining_quanta > 0 and self.min_time_per is not None
+
+    def fill(self, budget, day_tasks):
+        # 予算内に入る分だけ優先度順に割り当て、使った時間を返す
+        self.end_day()
+        used = 0
+        while self.ready and budget - used >= self.min_time_per:
+            idx = heapq.heappop(self.ready)[-1]
+            tp = self.time_per[idx]
+            if budget - used < tp:
+                self.deferred.append(idx)
+                continue
+            count = min((budget - used) // tp, self.tasks[idx]["remaining"])
+            used += self._assign(idx, count, day_tasks)
+            if self.tasks[idx]["remaining"] > 0:
+                self.deferred.append(idx)
+        return used
+
+    def force_one(self, day_tasks):
+        # 最低1問ルール（その日に全科目で何も割り当てられなかった場合のみ使う）
+        candidates = self.deferred + [k[-1] for k in self.ready]
+        if not candidates:
+            return 0
+        idx = min(candidates, key=self._key)
+        self.ready = [k for k in self.ready if k[-1] != idx]
+        heapq.heapify(self.ready)
+        if idx in self.deferred:
+            self.deferred.remove(idx)
+        used = self._assign(idx, 1, day_tasks)
+        if self.tasks[idx]["remaining"] > 0:
+            self.deferred.append(idx)
+        return used
+
+    def end_day(self):
+        for idx in self.deferred:
+            heapq.heappush(self.ready, self._key(idx))
+        self.deferred = []
+
+
+def allocate_joint(day_capacities, subjects):
+    """共有の日別容量で全科目を一度に割り当てる。
+
+    subjects: [{"subject": 名前, "tasks": 割当用タスク（remaining を持つ）, "deadline": 計画可能日数}]
+    戻り値: 科目名 -> {"plan": 日別割当, "day_capacities": 科目に配分した時間}
+    """
+    days = len(day_capacities)
+    states = [_SubjectState(s["subject"], s["tasks"], s.get("deadline", days)) for s in subjects]
+    results = {st.subject: {"plan": [[] for _ in range(days)], "day_capacities": [0] * days} for st in states}
+
+    for day in range(days):
+        cap = first_study_plan.to_quanta(day_capacities[day])
+        active = [st for st in states if st.active(day)]
+        if not active or cap <= 0:
+            continue
+
+        # 必要ペース（残り時間 / 残日数）に比例して配分する
+        rates = [st.remaining_quanta / (st.deadline - day) for st in active]
+        total_rate = sum(rates)
+        used_total = 0
+        for st, rate in zip(active, rates):
+            share = int(cap * rate / total_rate)
+            used = st.fill(share, results[st.subject]["plan"][day])
+            results[st.subject]["day_capacities"][day] += used
+            used_total += used
+
+        # 端数で余った時間はテスト日が近い科目から順に使う
+        for st in sorted(active, key=lambda x: (x.deadline, -x.remaining_quanta)):
+            left = cap - used_total
+            if st.min_time_per is None or left < st.min_time_per:
+                continue
+            used = st.fill(left, results[st.subject]["plan"][day])
+            results[st.subject]["day_capacities"][day] += used
+            used_total += used
+
+        if used_total == 0 and cap > 0:
+            st = min(active, key=lambda x: (x.deadline, -x.remaining_quanta))
+            used = st.force_one(results[st.subject]["plan"][day])
+            results[st.subject]["day_capacities"][day] += used
+
+        for st in active:
+            st.end_day()
+
+    for res in results.values():
+        res["day_capacities"] = [first_study_plan.quanta_to_hours(q) for q in res["day_capacities"]]
+    return results
+
+
+def collect_subjects(time_per_item, start_date, days):
+    subjects = []
+    for src in SUBJECTS_PRESET:
+        tasks = []
+        for t in src["tasks"]:
+            tasks.append({
+                "name": t["name"],
+                "remaining": int(t.get("total", 0)),
+                "total": int(t.get("total", 0)),
+                "time_per_item": float(t.get("time_per_item", time_per_item)),
+                "difficulty": float(t.get("difficulty", 1.0)),
+                "priority": int(t.get("priority", 99)),
+                "after": list(t.get("after", [])),
+            })
+        difficulty_calibration.apply_to_tasks(tasks, src["subject"])
+        subjects.append({
+            "subject": src["subject"],
+            "test_date": src.get("test_date"),
+            "tasks": tasks,
+            "deadline": first_study_plan.deadline_days(days, start_date, src.get("test_date")),
+        })
+    return subjects
+
+
+def main():
+    day_capacities = list(DAY_CAPACITIES_PRESET)
+    subjects = collect_subjects(COMMON_TIME_PER_ITEM_PRESET, START_DATE_PRESET, len(day_capacities))
+    needed = {s["subject"]: first_study_plan.compute_total_time(s["tasks"]) for s in subjects}
+    results = allocate_joint(day_capacities, subjects)
+
+    print(f"共有容量: 合計 {sum(day_capacities):.2f} 時間 / {len(day_capacities)} 日, 科目数 {len(subjects)}")
+    print(f"{'科目':<12}{'必要(h)':>10}{'配分(h)':>10}{'未割当(問)':>12}")
+    for s in subjects:
+        res = results[s["subject"]]
+        left = sum(t["remaining"] for t in s["tasks"])
+        print(f"{s['subject']:<12}{needed[s['subject']]:>10.2f}{sum(res['day_capacities']):>10.2f}{left:>12}")
+
+    save = input("科目ごとのプランを plans/ に保存しますか？ (y/n, デフォルト y): ").strip().lower()
+    if save not in ('', 'y'):
+        return
+    plans_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'plans'))
+    os.makedirs(plans_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    bad = set(list('/\\:*?"<>|'))
+    for s in subjects:
+        res = results[s["subject"]]
+        safe = ''.join(ch for ch in s["subject"] if ch not in bad)
+        path = os.path.join(plans_dir, f"study_plan_{safe}_{stamp}.csv")
+        first_study_plan.write_plan_csv(path, s["subject"], res["day_capacities"], res["plan"], needed[s["subject"]],
+                                        start_date=START_DATE_PRESET, test_date=s.get("test_date"))
+        print(f"プランを保存しました: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""plans/ 以下の全プラン（継続プランを含む）を集計して、科目・タスクごとの状況を表にするコマンド
+
+使い方:
+    python src/plan_analytics.py                  # plans/ 全体を集計
+    python src/plan_analytics.py --workers 8 --tasks
+
+集計内容:
+ - 計画消化率: あるプランの次の版（再計画）との差から、「前の版で予定していた分のうち、
+   遅れとして次の版に繰り越されなかった割合」を推定
+ - 残数の増加（バックログ増）: 再計画した日以降の残り問題数が、前の版の予定よりどれだけ増えたか
+ - 容量利用率: 各プランの割当時間 ÷ 日別容量の合計
+
+各ファイルはワーカープロセスで1行ずつストリーム処理して小さな要約だけを返し、
+集計側は (生徒, 科目) ごとに直前の版の要約だけを保持するため、メモリは全行数に比例しません。
+版の並び順はカタログ（メタ情報の索引）の generated_at から決めます。
+"""
+import argparse
+import os
+from multiprocessing import Pool
+
+import done_task
+from first_study_plan import base_subject
+from plan_catalog import PLANS_DIR, PlanCatalog
+from review_schedule import is_review
+
+
+def summarize_file(path):
+    """1ファイルをストリーム処理して、日別・タスク別の割当数などの要約を返す。"""
+    capacity = 0.0
+    planned_hours = 0.0
+    by_day = {}
+    first_day = None
+    for kind, value in done_task.iter_plan_csv(path):
+        if kind == 'day_capacities':
+            capacity = sum(value)
+        elif kind == 'plan':
+            # 継続プランは Day start_day から始まる（空の日の行も含めて最初の Day を覚える）
+            if first_day is None or value["day"] < first_day:
+                first_day = value["day"]
+            name = str(value["name"]).strip()
+            if not name:
+                continue
+            planned_hours += value["time"]
+            # 復習の行は容量利用率には入れるが、タスクの消化・繰り越しの集計には入れない
+            if is_review(name):
+                continue
+            items = by_day.setdefault(value["day"], {})
+            items[name] = items.get(name, 0) + value["assigned"]
+    return {"path": path, "capacity": capacity, "planned_hours": planned_hours, "by_day": by_day,
+            "first_day": first_day}
+
+
+def _summarize_job(path):
+    # 読めない・壊れた・集計中に消えたファイルは、全体を止めずにエラーとして返す
+    try:
+        return summarize_file(path), None
+    except (OSError, ValueError, UnicodeDecodeError) as e:
+        return None, str(e)
+
+
+def _first_changed_day(prev, cur, first_day=None):
+    """2つの版で割当が異なる最初の日（= 再計画を始めた日）。同一なら None。
+
+    継続プランには first_day より前の日が無いので、その日は前の版と同じ（変わっていない）とみなす。
+
+    >>> prev = {1: {'A': 2}, 2: {'A': 2}, 3: {'A': 2}, 4: {'A': 2}, 5: {'A': 2}}
+    >>> _first_changed_day(prev, {3: {'A': 2}, 4: {'A': 2}, 5: {'A': 2}}, 3) is None
+    True
+    >>> _first_changed_day(prev, {3: {'A': 2}, 4: {'A': 3}, 5: {'A': 2}}, 3)
+    4
+    """
+    if first_day is None:
+        first_day = min(cur, default=1)
+    days = sorted(d for d in set(prev) | set(cur) if d >= first_day)
+    for d in days:
+        if prev.get(d, {}) != cur.get(d, {}):
+            return d
+    return None
+
+
+def _items_between(by_day, lo, hi=None):
+    # [lo, hi) の日に予定されたタスク別問題数
+    out = {}
+    for d, items in by_day.items():
+        if d >= lo and (hi is None or d < hi):
+            for name, n in items.items():
+                out[name] = out.get(name, 0) + n
+    return out
+
+
+class CohortStats:
+    """ファイル要約を順に受け取り、科目・タスク別の集計値を更新する。"""
+
+    def __init__(self):
+        self.subjects = {}
+        self.tasks = {}
+        self.last = {}
+        # 集計できなかったファイル [(パス, 理由)]
+        self.errors = []
+
+    def _bucket(self, table, key):
+        return table.setdefault(key, {"files": 0, "students": set(), "due": 0, "carried": 0,
+                                      "backlog_growth": 0, "capacity": 0.0, "planned_hours": 0.0})
+
+    def add(self, entry, summary):
+        subject = base_subject(entry["subject"]) or '(無題)'
+        chain = (entry["student"], subject)
+        sb = self._bucket(self.subjects, subject)
+        sb["files"] += 1
+        sb["students"].add(entry["student"])
+        sb["capacity"] += summary["capacity"]
+        sb["planned_hours"] += summary["planned_hours"]
+
+        by_day = summary["by_day"]
+        start = min(by_day) if by_day else 1
+        prev = self.last.get(chain)
+        if prev is not None:
+            k = _first_changed_day(prev["by_day"], by_day, summary.get("first_day"))
+            if k is None:
+                # 内容が同じ版は集計せず、直前の版の起点を引き継ぐ
+                start = prev["start"]
+            else:
+                due = _items_between(prev["by_day"], prev["start"], k)
+                before = _items_between(prev["by_day"], k)
+                after = _items_between(by_day, k)
+                for name in set(due) | set(before) | set(after):
+                    growth = after.get(name, 0) - before.get(name, 0)
+                    carried = min(max(growth, 0), due.get(name, 0))
+                    for bucket in (sb, self._bucket(self.tasks, (subject, name))):
+                        bucket["due"] += due.get(name, 0)
+                        bucket["carried"] += carried
+                        bucket["backlog_growth"] += growth
+                start = k
+        for name in {n for items in by_day.values() for n in items}:
+            tb = self._bucket(self.tasks, (subject, name))
+            tb["files"] += 1
+            tb["students"].add(entry["student"])
+        # 次の版との比較に必要な分だけ保持する
+        self.last[chain] = {"by_day": by_day, "start": start}
+
+
+def _ratio(num, den):
+    return f"{num / den * 100:6.1f}%" if den else "    - "
+
+
+def format_table(stats, with_tasks=False):
+    lines = [f"{'科目':<14}{'ファイル':>8}{'生徒':>6}{'消化率':>9}{'残数増':>8}{'容量利用率':>11}"]
+    for subject in sorted(stats.subjects):
+        b = stats.subjects[subject]
+        lines.append(f"{subject:<14}{b['files']:>8}{len(b['students']):>6}{_ratio(b['due'] - b['carried'], b['due']):>9}"
+                     f"{b['backlog_growth']:>8}{_ratio(b['planned_hours'], b['capacity']):>11}")
+    if with_tasks:
+        lines.append('')
+        lines.append(f"{'科目':<14}{'タスク':<16}{'ファイル':>8}{'消化率':>9}{'残数増':>8}")
+        for (subject, name) in sorted(stats.tasks):
+            b = stats.tasks[(subject, name)]
+            lines.append(f"{subject:<14}{name:<16}{b['files']:>8}{_ratio(b['due'] - b['carried'], b['due']):>9}{b['backlog_growth']:>8}")
+    return '\n'.join(lines)
+
+
+def analyze(plans_dir=PLANS_DIR, workers=None):
+    catalog = PlanCatalog(plans_dir)
+    catalog.refresh()
+    # 同じ生徒・科目の版が generated_at 順に並ぶようにしてから並列に要約する
+    entries = sorted(catalog.entries.values(),
+                     key=lambda e: (e["student"], base_subject(e["subject"]), e["generated_at"], e["path"]))
+    paths = [os.path.join(catalog.plans_dir, e["path"]) for e in entries]
+    stats = CohortStats()
+    with Pool(workers) as pool:
+        for entry, (summary, err) in zip(entries, pool.imap(_summarize_job, paths, chunksize=16)):
+            if err:
+                stats.errors.append((entry["path"], err))
+            else:
+                stats.add(entry, summary)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='plans/ 全体の計画消化率・残数増・容量利用率を集計します')
+    parser.add_argument('--dir', default=PLANS_DIR, help='plans フォルダー')
+    parser.add_argument('--workers', type=int, default=None, help='並列プロセス数（既定: CPU 数）')
+    parser.add_argument('--tasks', action='store_true', help='タスク別の表も出力する')
+    args = parser.parse_args(argv)
+    stats = analyze(args.dir, args.workers)
+    for path, err in stats.errors:
+        print(f"エラー（集計から除外）: {path}: {err}")
+    print(format_table(stats, args.tasks))
+
+
+if __name__ == '__main__':
+    main()
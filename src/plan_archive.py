@@ -0,0 +1,233 @@
+"""plans/ の保存内容を重複なく持つためのアーカイブ（内容アドレス方式）
+
+plans/ 以下に保存するプラン CSV は、generated_at を除いた内容のハッシュ（SHA-256）を名前にして
+plans/.objects/<ハッシュ>.csv に一度だけ保存し、指定したファイル名には次のような小さな参照ファイルを書きます。
+
+    subject,数学
+    generated_at,2025-12-01T10:00:00
+    total_available,30.00
+    total_needed,28.50
+    start_date,2025-12-01
+    plan_ref,<ハッシュ>
+
+参照ファイルの先頭は通常の CSV と同じメタ部分なので、メタ情報だけを読む処理（カタログなど）は
+そのまま動きます。done_task.iter_plan_csv / load_plan_csv は plan_ref をたどって本体を読みます。
+同じ内容を何度保存しても本体は1つなので、plans/ の容量や走査・バックアップの時間は
+保存回数ではなく内容の種類の数に比例します。plans/ の外に保存する場合は従来どおりの CSV を書きます。
+
+使い方:
+    python src/plan_archive.py --stats      # 保存件数・本体の数・容量
+    python src/plan_archive.py --migrate    # 既存の通常 CSV を参照ファイルに置き換える
+    python src/plan_archive.py --gc         # どこからも参照されない本体を削除
+"""
+import argparse
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+
+PLANS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'plans'))
+OBJECTS_NAME = '.objects'
+REF_KEY = 'plan_ref'
+# 内容のハッシュに含めないメタ情報
+VOLATILE_KEYS = ('generated_at',)
+# gc はこれより新しく保存・再利用された本体を消さない（保存中で、まだ参照ファイルが書かれていないかもしれない）
+GC_GRACE_SECONDS = 600.0
+
+
+def objects_dir(plans_dir=PLANS_DIR):
+    return os.path.join(plans_dir, OBJECTS_NAME)
+
+
+def object_path(digest, plans_dir=PLANS_DIR):
+    return os.path.join(objects_dir(plans_dir), digest + '.csv')
+
+
+def _within(path, plans_dir):
+    path = os.path.abspath(path)
+    try:
+        inside = os.path.commonpath([path, plans_dir]) == plans_dir
+    except ValueError:
+        # Windows で別ドライブの場合
+        return False
+    return inside and OBJECTS_NAME not in path.split(os.sep)
+
+
+def _to_text(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
+
+
+def _split_meta(rows):
+    # 先頭の空行までがメタ部分
+    rows = list(rows)
+    end = rows.index([]) if [] in rows else len(rows)
+    return rows[:end], rows[end:]
+
+
+def _write_atomic(path, text):
+    # 一時ファイル名はプロセス・スレッドごとに分け、同時に書いても混ざらないようにする
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def store_object(rows, plans_dir=PLANS_DIR):
+    """generated_at を除いた内容を本体として保存し、ハッシュを返す。
+
+    既にあれば書き直さずに更新時刻だけを新しくする（gc が猶予の間は消さないように）。
+    """
+    text = _to_text(r for r in rows if not (r and r[0] in VOLATILE_KEYS))
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    path = object_path(digest, plans_dir)
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            # ちょうど gc に消された
+            pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(path, text)
+    return digest
+
+
+def write_rows(path, rows, plans_dir=PLANS_DIR):
+    """プラン CSV の行を保存する。plans_dir の中なら本体＋参照ファイル、外なら通常の CSV。"""
+    rows = list(rows)
+    plans_dir = os.path.abspath(plans_dir)
+    if not _within(path, plans_dir):
+        _write_atomic(path, _to_text(rows))
+        return None
+    digest = store_object(rows, plans_dir)
+    meta, _ = _split_meta(rows)
+    _write_atomic(path, _to_text(meta + [[REF_KEY, digest]]))
+    return digest
+
+
+def resolve(path, meta, plans_dir=None):
+    """参照ファイルのメタ情報から本体のパスを返す（参照でなければ None）。"""
+    digest = meta.get(REF_KEY)
+    if not digest:
+        return None
+    if plans_dir is None:
+        # 参照ファイルは plans/ の下（サブフォルダー可）にあるので、.objects を上にたどって探す
+        d = os.path.dirname(os.path.abspath(path))
+        while True:
+            if os.path.isdir(objects_dir(d)):
+                plans_dir = d
+                break
+            parent = os.path.dirname(d)
+            if parent == d:
+                plans_dir = PLANS_DIR
+                break
+            d = parent
+    return object_path(digest, plans_dir)
+
+
+def _plan_files(plans_dir):
+    for root, dirs, files in os.walk(plans_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if not name.startswith('.') and name.lower().endswith('.csv'):
+                yield os.path.join(root, name)
+
+
+def _read_meta(path):
+    meta = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row:
+                break
+            if len(row) >= 2:
+                meta[row[0]] = row[1]
+    return meta
+
+
+def stats(plans_dir=PLANS_DIR):
+    saves = refs = 0
+    save_bytes = 0
+    for path in _plan_files(plans_dir):
+        saves += 1
+        save_bytes += os.path.getsize(path)
+        if REF_KEY in _read_meta(path):
+            refs += 1
+    objs = os.listdir(objects_dir(plans_dir)) if os.path.isdir(objects_dir(plans_dir)) else []
+    obj_bytes = sum(os.path.getsize(os.path.join(objects_dir(plans_dir), n)) for n in objs)
+    return {'saves': saves, 'refs': refs, 'objects': len(objs), 'bytes': save_bytes + obj_bytes}
+
+
+def migrate(plans_dir=PLANS_DIR):
+    """通常の CSV を本体＋参照ファイルに置き換える。戻り値は置き換えた件数。"""
+    count = 0
+    for path in _plan_files(plans_dir):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        meta, _ = _split_meta(rows)
+        if any(r and r[0] == REF_KEY for r in meta):
+            continue
+        write_rows(path, rows, plans_dir)
+        count += 1
+    return count
+
+
+def gc(plans_dir=PLANS_DIR, grace=GC_GRACE_SECONDS):
+    """どの参照ファイルからも使われていない本体を削除し、削除した件数を返す。
+
+    保存は 本体 → 参照ファイル の順に書くので、grace 秒以内に保存・再利用された本体は参照が無くても残す。
+    """
+    # 参照を集める前の時刻で区切る（集めている間に保存されたものは必ず猶予に入る）
+    cutoff = time.time() - grace
+    used = set()
+    for path in _plan_files(plans_dir):
+        digest = _read_meta(path).get(REF_KEY)
+        if digest:
+            used.add(digest + '.csv')
+    removed = 0
+    if os.path.isdir(objects_dir(plans_dir)):
+        for name in os.listdir(objects_dir(plans_dir)):
+            if not name.endswith('.csv') or name in used:
+                continue
+            path = os.path.join(objects_dir(plans_dir), name)
+            trash = f"{path}.{os.getpid()}.gc"
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                # 脇へ移してから時刻を見直す。その間に store_object が再利用していたら戻す
+                # （移した後なら store_object は本体が無いので書き直す）
+                os.replace(path, trash)
+                if os.path.getmtime(trash) >= cutoff:
+                    os.replace(trash, path)
+                    continue
+                os.remove(trash)
+            except FileNotFoundError:
+                continue
+            removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='plans/ のプランを内容ごとに1つだけ保存するアーカイブの管理')
+    parser.add_argument('--dir', default=PLANS_DIR, help='plans フォルダー')
+    parser.add_argument('--stats', action='store_true', help='保存件数・本体の数・容量を表示')
+    parser.add_argument('--migrate', action='store_true', help='既存の通常 CSV を参照ファイルに置き換える')
+    parser.add_argument('--gc', action='store_true', help='参照されていない本体を削除')
+    args = parser.parse_args(argv)
+    plans_dir = os.path.abspath(args.dir)
+    if args.migrate:
+        print(f"参照ファイルに置き換え: {migrate(plans_dir)} 件")
+    if args.gc:
+        print(f"削除した本体: {gc(plans_dir)} 件")
+    if args.stats or not (args.migrate or args.gc):
+        s = stats(plans_dir)
+        print(f"保存 {s['saves']} 件（うち参照 {s['refs']} 件）/ 本体 {s['objects']} 件 / 合計 {s['bytes'] / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""plans/ フォルダーのプラン一覧（カタログ）をメタ情報だけから作るユーティリティ
+
+使い方:
+    python src/plan_catalog.py                     # 一覧表示
+    python src/plan_catalog.py --subject 数学       # 科目名（部分一致）で絞り込み
+    python src/plan_catalog.py --student taro --since 2025-12-01
+
+各 CSV は先頭のメタ部分（subject / generated_at / start_date / test_date / total_*）だけを読み、
+結果を plans/.catalog.json に「パス・更新時刻・サイズ」付きで保存します。次回からは
+変更のあったファイルだけを読み直すため、数千件のプランでも一覧表示はほぼ即時です。
+サブフォルダー（例: plans/<生徒名>/）は生徒ごとの置き場として扱います。
+"""
+import argparse
+import json
+import os
+
+import done_task
+
+PLANS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'plans'))
+INDEX_NAME = '.catalog.json'
+INDEX_VERSION = 1
+META_KEYS = ('subject', 'generated_at', 'start_date', 'test_date', 'total_available', 'total_needed')
+
+
+def scan_plans(plans_dir=PLANS_DIR):
+    """plans/ 以下の CSV の (plans/ からの相対パス, os.stat の結果) を順に返す。"""
+    plans_dir = os.path.abspath(plans_dir)
+    # 隠しフォルダー／隠しファイル（索引自体など）は対象外
+    for root, dirs, files in os.walk(plans_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name.startswith('.') or not name.lower().endswith('.csv'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield os.path.relpath(path, plans_dir).replace(os.sep, '/'), st
+
+
+class PlanCatalog:
+    """plans/ 以下の CSV をメタ情報で索引化する。"""
+
+    def __init__(self, plans_dir=PLANS_DIR, index_path=None):
+        self.plans_dir = os.path.abspath(plans_dir)
+        self.index_path = index_path or os.path.join(self.plans_dir, INDEX_NAME)
+        self.entries = {}
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.entries = data.get('entries', {})
+
+    def _save_index(self):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def _scan(self):
+        return scan_plans(self.plans_dir)
+
+    def refresh(self):
+        """変更のあったファイルだけ読み直す。戻り値は (追加, 更新, 削除) の件数。"""
+        added = updated = 0
+        seen = set()
+        for rel, st in self._scan():
+            seen.add(rel)
+            old = self.entries.get(rel)
+            if old and old['mtime_ns'] == st.st_mtime_ns and old['size'] == st.st_size:
+                continue
+            try:
+                meta = done_task.read_plan_meta(os.path.join(self.plans_dir, rel))
+            except (OSError, UnicodeDecodeError):
+                meta = {}
+            entry = {k: meta.get(k, '') for k in META_KEYS}
+            student = os.path.dirname(rel)
+            entry.update({'path': rel, 'student': student, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size})
+            if old:
+                updated += 1
+            else:
+                added += 1
+            self.entries[rel] = entry
+        removed = [rel for rel in self.entries if rel not in seen]
+        for rel in removed:
+            del self.entries[rel]
+        if added or updated or removed:
+            self._save_index()
+        return added, updated, len(removed)
+
+    def find(self, subject=None, student=None, since=None, until=None):
+        """条件に合うエントリを generated_at の新しい順で返す。since/until は start_date で比較。"""
+        out = []
+        for e in self.entries.values():
+            if subject and subject not in e['subject']:
+                continue
+            if student is not None and e['student'] != student:
+                continue
+            if since and (not e['start_date'] or e['start_date'] < since):
+                continue
+            if until and (not e['start_date'] or e['start_date'] > until):
+                continue
+            out.append(e)
+        out.sort(key=lambda e: e['generated_at'], reverse=True)
+        return out
+
+
+def format_entries(entries):
+    lines = [f"{'生成日時':<20} {'科目':<14} {'開始':<10} {'テスト':<10} {'必要h':>7} {'可能h':>7}  パス"]
+    for e in entries:
+        lines.append(f"{e['generated_at'][:19]:<20} {e['subject']:<14} {e['start_date']:<10} {e['test_date']:<10} "
+                     f"{e['total_needed']:>7} {e['total_available']:>7}  {e['path']}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='plans/ のプラン一覧を表示します')
+    parser.add_argument('--dir', default=PLANS_DIR, help='plans フォルダー')
+    parser.add_argument('--subject', default=None, help='科目名（部分一致）')
+    parser.add_argument('--student', default=None, help='生徒フォルダー名（plans 直下は空文字）')
+    parser.add_argument('--since', default=None, help='開始日がこの日以降 (YYYY-MM-DD)')
+    parser.add_argument('--until', default=None, help='開始日がこの日以前 (YYYY-MM-DD)')
+    args = parser.parse_args(argv)
+
+    catalog = PlanCatalog(args.dir)
+    added, updated, removed = catalog.refresh()
+    entries = catalog.find(args.subject, args.student, args.since, args.until)
+    print(format_entries(entries))
+    print(f"\n{len(entries)} 件（索引の更新: 追加 {added} / 更新 {updated} / 削除 {removed}）")
+
+
+if __name__ == '__main__':
+    main()
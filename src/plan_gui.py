@@ -6,6 +6,7 @@
 注意: この GUI は `first_study_plan.py` と `done_task.py` の関数を動的にロードして利用します。
 """
 import os
+import sys
 import csv
 import importlib.util
 from datetime import datetime, timedelta
@@ -24,12 +25,32 @@ def load_module(name, filename):
         return None
     spec = importlib.util.spec_from_file_location(name, path)
     mod = importlib.util.module_from_spec(spec)
+    # 他のモジュールの import やプロセスプールへの受け渡し（pickle）でも同じモジュールを使うよう登録する
+    sys.modules[name] = mod
     spec.loader.exec_module(mod)
     return mod
 
 
 first_mod = load_module('first_study_plan', 'first_study_plan.py')
 done_mod = load_module('done_task', 'done_task.py')
+catalog_mod = load_module('plan_catalog', 'plan_catalog.py')
+sensitivity_mod = load_module('plan_sensitivity', 'plan_sensitivity.py')
+history_mod = load_module('plan_history', 'plan_history.py')
+preview_mod = load_module('plan_preview', 'plan_preview.py')
+pareto_mod = load_module('plan_pareto', 'plan_pareto.py')
+forecast_mod = load_module('capacity_forecast', 'capacity_forecast.py')
+solver_mod = load_module('anytime_solver', 'anytime_solver.py')
+store_mod = load_module('plan_store', 'plan_store.py')
+ledger_mod = load_module('plan_ledger', 'plan_ledger.py')
+calib_mod = load_module('difficulty_calibration', 'difficulty_calibration.py')
+
+# ライブプレビュー: 最後の入力からこの時間（ミリ秒）待ってから再計算する
+PREVIEW_DELAY_MS = 300
+PREVIEW_POLL_MS = 30
+# 「プラン生成」とライブプレビューで貪欲法の結果を改善する局所探索の手数と種。0 なら貪欲法のまま
+# （時間では止めないので、同じ入力なら機械の速さや負荷に関係なく同じプランになる）
+SOLVER_STEPS = 2000
+SOLVER_SEED = 0
 
 
 class PlannerGUI(tk.Tk):
@@ -78,13 +99,18 @@ class PlannerGUI(tk.Tk):
         self.text_day_caps = tk.Text(left, height=4)
         self.text_day_caps.pack(fill='x')
 
-        ttk.Label(left, text='タスク (1行1件: 名前,合計問題数,優先順位,問題コスト)').pack(anchor='w')
+        ttk.Label(left, text='タスク (1行1件: 名前,合計問題数,優先順位,問題コスト[,前提タスク;...])').pack(anchor='w')
         self.text_tasks = tk.Text(left, height=8)
         self.text_tasks.pack(fill='x')
 
         ttk.Button(left, text='プリセット読み込み', command=self._load_presets).pack(fill='x', pady=4)
         ttk.Button(left, text='プラン生成', command=self._generate_plan).pack(fill='x')
         ttk.Button(left, text='プラン保存 (CSV)', command=self._save_generated_plan).pack(fill='x', pady=4)
+        ttk.Button(left, text='感度分析', command=self._show_sensitivity).pack(fill='x')
+        ttk.Button(left, text='候補を比較', command=self._choose_pareto_plan).pack(fill='x', pady=4)
+        self.var_live = tk.BooleanVar(value=False)
+        ttk.Checkbutton(left, text='ライブプレビュー（入力中に自動で再計算）', variable=self.var_live,
+                        command=self._schedule_preview).pack(anchor='w', pady=4)
 
         # 右側: プラン出力
         ttk.Label(right, text='プラン出力').pack(anchor='w')
@@ -95,6 +121,17 @@ class PlannerGUI(tk.Tk):
         self.generated = None
         self.generated_meta = None
 
+        # ライブプレビュー: 行ごとの解析キャッシュ・再計算スレッド・入力の世代番号
+        self.task_lines = preview_mod.TaskLineCache()
+        self.calibrated = []
+        self.preview_worker = None
+        self.preview_job = None
+        self.preview_generation = 0
+        self.preview_polling = False
+        for w in (self.entry_subject, self.entry_start, self.entry_test, self.entry_time_per,
+                  self.text_day_caps, self.text_tasks):
+            w.bind('<KeyRelease>', self._schedule_preview, add='+')
+
     def _load_presets(self):
         if not first_mod:
             messagebox.showerror('エラー', 'first_study_plan.py が見つかりません')
@@ -117,10 +154,14 @@ class PlannerGUI(tk.Tk):
         self.text_day_caps.delete('1.0', 'end'); self.text_day_caps.insert('1.0', ','.join(str(x) for x in caps))
         self.text_tasks.delete('1.0', 'end')
         for t in tasks:
-            line = f"{t.get('name')},{t.get('total')},{t.get('priority')},{t.get('difficulty')}\n"
+            line = f"{t.get('name')},{t.get('total')},{t.get('priority')},{t.get('difficulty')}"
+            after = t.get('after') or []
+            if after:
+                line += ',' + ';'.join(after)
+            line += '\n'
             self.text_tasks.insert('end', line)
 
-    def _parse_inputs(self):
+    def _parse_inputs(self, strict=True):
         subject = self.entry_subject.get().strip()
         start_date = self.entry_start.get().strip() or None
         test_date = self.entry_test.get().strip() or None
@@ -128,24 +169,11 @@ class PlannerGUI(tk.Tk):
             time_per = float(self.entry_time_per.get().strip())
         except Exception:
             time_per = 0.0
-        caps_s = self.text_day_caps.get('1.0', 'end').strip()
-        day_caps = []
-        if caps_s:
-            for part in caps_s.replace('\n',',').split(','):
-                part = part.strip()
-                if not part: continue
-                try:
-                    day_caps.append(float(part))
-                except Exception:
-                    pass
-        tasks = []
-        for line in self.text_tasks.get('1.0','end').splitlines():
-            if not line.strip(): continue
-            parts = [p.strip() for p in line.split(',')]
-            if len(parts) < 4:
-                continue
-            name, total, priority, difficulty = parts[0], int(parts[1]), int(parts[2]), float(parts[3])
-            tasks.append({'name': name, 'remaining': total, 'total': total, 'time_per_item': time_per, 'difficulty': difficulty, 'priority': priority})
+        day_caps = preview_mod.parse_day_caps(self.text_day_caps.get('1.0', 'end'))
+        # タスク欄は変更された行だけを解析し直す（5列目は任意の前提タスク名、セミコロン区切り）
+        tasks = self.task_lines.parse(self.text_tasks.get('1.0','end'), time_per, strict=strict)
+        # 較正表（difficulty_calibration.py）にあるタスクは、実績から求めた1問あたり時間にする
+        self.calibrated = calib_mod.apply_to_tasks(tasks, subject) if calib_mod else []
         return subject, start_date, test_date, day_caps, tasks
 
     def _generate_plan(self):
@@ -158,8 +186,15 @@ class PlannerGUI(tk.Tk):
             # copy tasks for mutation
             import copy
             tasks_copy = copy.deepcopy(tasks)
-            plan = first_mod.allocate_by_priority(day_caps, tasks_copy)
-            total_needed = sum(t['total'] * t['time_per_item'] * t.get('difficulty',1.0) for t in tasks)
+            try:
+                # 貪欲法の結果を SOLVER_STEPS 手の局所探索で改善する（ライブプレビューと同じ）
+                plan = solver_mod.solve(day_caps, tasks_copy, None, start_date, test_date, seed=SOLVER_SEED,
+                                        steps=SOLVER_STEPS)['plan']
+            except ValueError as e:
+                # 前提タスクの指定ミス（存在しない名前・循環など）
+                messagebox.showerror('エラー', str(e))
+                return
+            total_needed = first_mod.compute_total_time(tasks)
         else:
             messagebox.showerror('エラー', '割当関数が見つかりません')
             return
@@ -184,15 +219,20 @@ class PlannerGUI(tk.Tk):
             warning_msg += "\n\n各日の勉強時間を増やすか、タスクの優先度・難易度を調整してください。"
             messagebox.showwarning('時間不足', warning_msg)
 
-        # show
-        self.txt_out.delete('1.0','end')
-        self.txt_out.insert('end', f"科目: {subject}\n開始: {start_date}\nテスト: {test_date}\n\n")
         # show (original line-by-line per day)
         self.generated = plan
         self.generated_meta = {'subject': subject, 'start_date': start_date, 'test_date': test_date, 'day_caps': day_caps, 'tasks': tasks, 'total_needed': total_needed}
+        note = f"較正した1問あたり時間を使用: {', '.join(self.calibrated)}" if self.calibrated else None
+        self._show_generated(note)
+
+    def _show_generated(self, note=None):
+        meta = self.generated_meta
+        subject, start_date, test_date = meta['subject'], meta['start_date'], meta['test_date']
         self.txt_out.delete('1.0','end')
         self.txt_out.insert('end', f"科目: {subject}\n開始: {start_date}\nテスト: {test_date}\n\n")
-        for i, day_tasks in enumerate(plan, start=1):
+        if note:
+            self.txt_out.insert('end', note + '\n\n')
+        for i, day_tasks in enumerate(self.generated, start=1):
             label = f"Day {i}"
             if start_date:
                 try:
@@ -210,6 +250,115 @@ class PlannerGUI(tk.Tk):
                     self.txt_out.insert('end', f"  - {it['name']} を {it['assigned']} 問 合計 {it['time']:.2f} 時間\n")
             self.txt_out.insert('end','\n')
 
+    # -- ライブプレビュー
+    def _schedule_preview(self, event=None):
+        # キー入力のたびに呼ばれる。最後の入力から PREVIEW_DELAY_MS 経ってから1回だけ再計算する
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+            self.preview_job = None
+        if self.var_live.get() and first_mod and preview_mod:
+            self.preview_job = self.after(PREVIEW_DELAY_MS, self._start_preview)
+
+    def _start_preview(self):
+        self.preview_job = None
+        # ウィジェットの読み取りはメインスレッドで行い、割当だけを再計算スレッドに渡す
+        subject, start_date, test_date, day_caps, tasks = self._parse_inputs(strict=False)
+        if not tasks or not day_caps:
+            return
+        if self.preview_worker is None:
+            self.preview_worker = preview_mod.PreviewWorker(finish=self._finish_preview)
+        self.preview_generation += 1
+        meta = {'subject': subject, 'start_date': start_date, 'test_date': test_date, 'day_caps': day_caps,
+                'tasks': tasks, 'bad_lines': list(self.task_lines.bad_lines)}
+        self.preview_worker.submit(self.preview_generation, day_caps, tasks, meta)
+        if not self.preview_polling:
+            self.preview_polling = True
+            self.after(PREVIEW_POLL_MS, self._poll_preview)
+
+    @staticmethod
+    def _finish_preview(day_caps, tasks, result, meta):
+        # 再計算スレッドで呼ばれる（ウィジェットには触らない）。「プラン生成」と同じ局所探索をかける
+        work = [dict(t) for t in tasks]
+        solved = solver_mod.solve(day_caps, work, None, meta['start_date'], meta['test_date'], seed=SOLVER_SEED,
+                                  steps=SOLVER_STEPS, greedy=(result['plan'], result['remaining']))
+        return dict(result, plan=solved['plan'], remaining=[t['remaining'] for t in work],
+                    unassigned={t['name']: t['remaining'] for t in work if t['remaining'] > 0})
+
+    def _poll_preview(self):
+        got = self.preview_worker.poll()
+        if got is None or got[0] != self.preview_generation:
+            # 計算中、または途中で新しい入力があった（古い結果は表示しない）
+            self.after(PREVIEW_POLL_MS, self._poll_preview)
+            return
+        self.preview_polling = False
+        _, result, meta = got
+        if not self.var_live.get():
+            return
+        bad_lines = meta.pop('bad_lines')
+        if isinstance(result, Exception):
+            # 前提タスクの指定ミスは入力途中でもよくあるので、ダイアログを出さず出力欄に表示する
+            # （それ以外の例外も表示して、次の入力でまた再計算する）
+            self.txt_out.delete('1.0','end')
+            if isinstance(result, ValueError):
+                self.txt_out.insert('end', f"（プレビュー）エラー: {result}\n")
+            else:
+                self.txt_out.insert('end', f"（プレビュー）計算に失敗しました: {type(result).__name__}: {result}\n")
+            return
+        meta['total_needed'] = result['total_needed']
+        self.generated = result['plan']
+        self.generated_meta = meta
+        notes = ['（プレビュー）']
+        if bad_lines:
+            notes.append('読み取れないタスク行: ' + ', '.join(str(n) for n in bad_lines))
+        if result['unassigned']:
+            notes.append('未割当: ' + ', '.join(f"{name} {n}問" for name, n in result['unassigned'].items()))
+        self._show_generated('\n'.join(notes))
+
+    def _show_sensitivity(self):
+        # 生成済みプランについて、どの日の +1 時間／どのタスクの難易度低下が未割当を最も減らすかを表示
+        if not self.generated or not self.generated_meta:
+            messagebox.showwarning('警告', '先にプランを生成してください')
+            return
+        if not sensitivity_mod:
+            messagebox.showerror('エラー', 'plan_sensitivity.py が見つかりません')
+            return
+        meta = self.generated_meta
+        report = sensitivity_mod.sensitivity_report(meta['day_caps'], meta['tasks'])
+        self.txt_out.insert('end', '--- 感度分析 ---\n' + sensitivity_mod.format_report(report) + '\n')
+        self.txt_out.see('end')
+
+    def _choose_pareto_plan(self):
+        # 優先遅れ・負荷のばらつき・未完了のトレードオフが異なる候補を並べ、選んだものを生成結果にする
+        if not pareto_mod:
+            messagebox.showerror('エラー', 'plan_pareto.py が見つかりません')
+            return
+        subject, start_date, test_date, day_caps, tasks = self._parse_inputs()
+        if not tasks or not day_caps:
+            messagebox.showwarning('警告', '日数とタスクを入力してください')
+            return
+        self.config(cursor='watch'); self.update_idletasks()
+        try:
+            front = pareto_mod.pareto_plans(day_caps, tasks, start_date, test_date)
+        except ValueError as e:
+            messagebox.showerror('エラー', str(e))
+            return
+        finally:
+            self.config(cursor='')
+        table = pareto_mod.format_front(front)
+        self.txt_out.delete('1.0','end')
+        self.txt_out.insert('end', '--- 候補（どれも他の候補に全項目で劣らないもの） ---\n' + table + '\n')
+        s = tk.simpledialog.askinteger('候補の選択', f"採用する候補の番号を入力してください（1～{len(front)}）\n\n{table}",
+                                       minvalue=1, maxvalue=len(front))
+        if s is None:
+            return
+        chosen = front[s - 1]
+        self.generated = chosen['plan']
+        self.generated_meta = {'subject': subject, 'start_date': start_date, 'test_date': test_date, 'day_caps': day_caps,
+                               'tasks': tasks, 'total_needed': first_mod.compute_total_time(tasks)}
+        lateness, spread, unfinished = chosen['objectives']
+        self._show_generated(f"候補 {s}: {pareto_mod.describe(chosen['params'])}\n"
+                             f"優先遅れ {lateness:.2f} / 負荷のばらつき {spread:.2f} 時間 / 未完了 {unfinished} 問")
+
     def _save_generated_plan(self):
         if not self.generated or not self.generated_meta:
             messagebox.showwarning('警告', '先にプランを生成してください')
@@ -217,34 +366,10 @@ class PlannerGUI(tk.Tk):
         fname = filedialog.asksaveasfilename(initialdir=PLANS_DIR, defaultextension='.csv', filetypes=[('CSVファイル','*.csv')])
         if not fname:
             return
-        # write CSV similar to first_study_plan format, include start_date/test_date
+        # first_study_plan と同じ形式で保存する（plans/ の中なら同じ内容は1つだけ保存され、参照ファイルになる）
         meta = self.generated_meta
-        plan = self.generated
-        with open(fname, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['subject', meta['subject']])
-            writer.writerow(['generated_at', datetime.now().isoformat()])
-            writer.writerow(['total_available', f"{sum(meta['day_caps']):.2f}"])
-            writer.writerow(['total_needed', f"{meta['total_needed']:.2f}"])
-            if meta.get('start_date'):
-                writer.writerow(['start_date', meta['start_date']])
-            if meta.get('test_date'):
-                writer.writerow(['test_date', meta['test_date']])
-            writer.writerow([])
-            writer.writerow(['Day Capacities'])
-            writer.writerow(['Day','AvailableHours'])
-            for i,h in enumerate(meta['day_caps'], start=1):
-                writer.writerow([i, f"{h:.2f}"])
-            writer.writerow([])
-            writer.writerow(['Plan'])
-            writer.writerow(['Day','Task','Assigned','Time(hours)'])
-            for i, day_tasks in enumerate(plan, start=1):
-                if not day_tasks:
-                    # 割当がない日はタスク名を空文字で CSV に出力する
-                    writer.writerow([i, '', '', ''])
-                else:
-                    for it in day_tasks:
-                        writer.writerow([i, it['name'], it['assigned'], f"{it['time']:.2f}"])
+        first_mod.write_plan_csv(fname, meta['subject'], meta['day_caps'], self.generated, meta['total_needed'],
+                                 start_date=meta.get('start_date') or None, test_date=meta.get('test_date') or None)
         messagebox.showinfo('保存完了', f'プランを保存しました: {fname}')
 
     # -- update tab
@@ -253,16 +378,40 @@ class PlannerGUI(tk.Tk):
         top = ttk.Frame(frm)
         top.pack(fill='x', padx=8, pady=8)
         ttk.Button(top, text='CSV読み込み', command=self._load_csv_for_update).pack(side='left')
+        ttk.Button(top, text='プラン一覧', command=self._show_catalog).pack(side='left', padx=6)
         ttk.Label(top, text='完了した日 (Day#)').pack(side='left', padx=6)
         self.entry_today = ttk.Entry(top, width=6)
         self.entry_today.pack(side='left')
         ttk.Button(top, text='完了を適用して再計画', command=self._apply_today_replan).pack(side='left', padx=6)
+        ttk.Button(top, text='過去の実績を修正', command=self._correct_actual).pack(side='left')
+        ttk.Button(top, text='元に戻す', command=self._undo_replan).pack(side='left', padx=6)
+        ttk.Button(top, text='やり直す', command=self._redo_replan).pack(side='left', padx=6)
+        ttk.Button(top, text='版の比較', command=self._diff_versions).pack(side='left')
 
         self.txt_update = scrolledtext.ScrolledText(frm)
         self.txt_update.pack(fill='both', expand=True, padx=8, pady=8)
         # internal
+        self.loaded_path = None
+        self.loaded_version = None
         self.loaded_meta = None
         self.loaded_plan_rows = None
+        self.loaded_first_day = 1
+        self.history = None
+        # 予定数・実績の台帳（タスクごとの Fenwick 木）と、最後に再計画した Day
+        self.ledger = None
+        self.last_today = None
+
+    def _show_catalog(self):
+        # plans/ の一覧をメタ情報（索引キャッシュ）から表示する
+        if not catalog_mod:
+            messagebox.showerror('エラー', 'plan_catalog.py が見つかりません')
+            return
+        catalog = catalog_mod.PlanCatalog(PLANS_DIR)
+        catalog.refresh()
+        entries = catalog.find()
+        self.txt_update.delete('1.0', 'end')
+        self.txt_update.insert('end', f"plans/ のプラン一覧（{len(entries)} 件）:\n\n")
+        self.txt_update.insert('end', catalog_mod.format_entries(entries) + '\n')
 
     def _load_csv_for_update(self):
         fpath = filedialog.askopenfilename(initialdir=PLANS_DIR, filetypes=[('CSVファイル','*.csv')])
@@ -322,10 +471,19 @@ class PlannerGUI(tk.Tk):
                     i+=1
             plan_data={'meta':meta,'day_capacities':day_caps,'plan_rows':plan_rows}
 
+        self.loaded_path = fpath
+        # 読み込んだ時点の版。同じファイルへ保存するとき、他で更新されていないかの確認に使う
+        self.loaded_version = plan_data.get('version') or store_mod.read_version(fpath)
         self.loaded_meta = plan_data['meta']
         self.loaded_plan_rows = plan_data['plan_rows']
+        # start_date はファイルの最初の Day の日付（継続プランは Day 1 ではない）
+        self.loaded_first_day = done_mod.first_plan_day(self.loaded_plan_rows)
         # store day capacities as well for later saving/再計画保存時に利用
         self.loaded_day_caps = plan_data.get('day_capacities', [])
+        # 読み込んだ内容を履歴の最初の版にする
+        self.history = history_mod.PlanHistory()
+        self.history.push(f"読み込み: {os.path.basename(fpath)}", self.loaded_plan_rows, self.loaded_day_caps, self.loaded_meta)
+        self._reset_ledger()
         # print summary
         self.txt_update.delete('1.0','end')
         self.txt_update.insert('end', f"読み込み: {os.path.basename(fpath)}\nメタ情報: {self.loaded_meta}\n\n")
@@ -363,29 +521,29 @@ class PlannerGUI(tk.Tk):
             today = int(self.entry_today.get().strip() or '1')
         except Exception:
             today = 1
-        # aggregate tasks
+        # 完了数を聞くタスクの一覧（1問あたり時間などの集計は done_task.replan_plan_rows が行う）
         tasks = {}
         for r in self.loaded_plan_rows:
             # 空文字のタスク名行は集計対象外
             raw_name = r.get('name', '')
             if not str(raw_name).strip(): continue
+            # 復習の行は再計画で元の日に残すので、完了数は聞かない
+            if done_mod.is_review(raw_name): continue
             # タスク名を正規化してキーとして使う（空白を統一）
             n_key = str(raw_name).strip()
-            info = tasks.setdefault(n_key, {'total_assigned':0, 'time_per_item_samples':[], 'first_day':r['day']})
+            info = tasks.setdefault(n_key, {'total_assigned':0, 'first_day':r['day']})
             info['total_assigned'] += r['assigned']
-            if r['assigned']>0:
-                info['time_per_item_samples'].append(r['time']/r['assigned'] if r['assigned'] else 0)
             info['first_day'] = min(info['first_day'], r['day'])
 
         # prompt user for done_today values via simple dialog loop
         # ダイアログの提示順を安定させるため、明示的に優先度（first_day）→名前順でソートして表示する
         ordered = sorted(tasks.items(), key=lambda kv: (kv[1].get('first_day', 0), kv[0]))
+        ledger = self.ledger
         done_today = {}
         for name, info in ordered:
-            # name は既に正規化済み（tasks 辞書作成時に strip 済み）
-            prev = sum(int(r.get('assigned', 0)) for r in self.loaded_plan_rows if str(r.get('name', '')).strip() == name and int(r.get('day', 0)) < today)
-            today_assigned = sum(int(r.get('assigned', 0)) for r in self.loaded_plan_rows if str(r.get('name', '')).strip() == name and int(r.get('day', 0)) == today)
-            future_assigned = sum(int(r.get('assigned', 0)) for r in self.loaded_plan_rows if str(r.get('name', '')).strip() == name and int(r.get('day', 0)) > today)
+            # name は既に正規化済み（tasks 辞書作成時に strip 済み）。予定数は台帳から O(log 日数) で求める
+            prev = ledger.planned_before(name, today)
+            today_assigned = ledger.planned_count(name, today, today)
             
             # デフォルトは今日の計画数（全部やった想定）
             suggested = today_assigned
@@ -424,7 +582,19 @@ class PlannerGUI(tk.Tk):
 
         # 次の日の利用可能時間を入力してもらう（1日分のみ）
         # それ以降の日は元CSVの day_capacities を使用
-        s = tk.simpledialog.askstring('次の日入力', f'次の日（Day {today+1}）の利用可能時間を入力してください（例:3）:')
+        # 既定値は過去の実績から見込んだ時間（元CSVの値を上限にする）
+        orig_caps = getattr(self, 'loaded_day_caps', []) or []
+        typed = [orig_caps[today]] if today < len(orig_caps) else None
+        try:
+            suggested = forecast_mod.suggest_capacities(self.loaded_path, self.loaded_meta, today + 1, 1, typed,
+                                                        first_day=self.loaded_first_day)
+        except (OSError, ValueError):
+            suggested = None
+        prompt = f'次の日（Day {today+1}）の利用可能時間を入力してください（例:3）:'
+        if suggested:
+            prompt += f'\n（これまでの実績からの見込み: {suggested[0]:g} 時間）'
+        s = tk.simpledialog.askstring('次の日入力', prompt,
+                                      initialvalue=f'{suggested[0]:g}' if suggested else None)
         if s is None: return
         try:
             next_day_cap = float(s.strip())
@@ -433,7 +603,6 @@ class PlannerGUI(tk.Tk):
             return
         
         # 元CSVの day_capacities から次の日以降を取得
-        orig_caps = getattr(self, 'loaded_day_caps', []) or []
         # next_caps = [次の日の入力値] + [元CSVの残りの日]
         next_caps = [next_day_cap]
         if today < len(orig_caps):
@@ -452,13 +621,11 @@ class PlannerGUI(tk.Tk):
         for name, info in ordered:
             # name は既に正規化済み
             # 過去+今日: today 以前（today を含む）- これらは固定
-            past_and_today_rows = [(r.get('day'), r.get('assigned')) for r in self.loaded_plan_rows if str(r.get('name', '')).strip() == name and int(r.get('day', 0)) <= today]
-            past_and_today = sum(int(assigned) for day, assigned in past_and_today_rows)
+            past_and_today = ledger.planned_count(name, 1, today)
             # 今日の計画: today の割当
-            today_plan = sum(int(r.get('assigned', 0)) for r in self.loaded_plan_rows if str(r.get('name', '')).strip() == name and int(r.get('day', 0)) == today)
+            today_plan = ledger.planned_count(name, today, today)
             # 再計画ウィンドウ（未来）: today より後から cutoff_day まで
-            future_rows = [(r.get('day'), r.get('assigned')) for r in self.loaded_plan_rows if str(r.get('name', '')).strip() == name and today < int(r.get('day', 0)) <= cutoff_day]
-            future_plan = sum(int(assigned) for day, assigned in future_rows)
+            future_plan = ledger.planned_count(name, today + 1, cutoff_day)
             done = done_today.get(name, 0)  # 正規化済みキーで取得
             # 残り計算: (今日の計画 + 未来) - 今日の完了
             # 計画外完了の場合、未来から差し引く
@@ -473,48 +640,20 @@ class PlannerGUI(tk.Tk):
         # GUI の出力欄に表示
         self.txt_update.insert('end', '\n'.join(debug_lines) + '\n\n')
 
-        # build remaining tasks: (今日の計画 + 未来の割当) - 完了数 を再計画する
-        # ユーザーが入力した今日の完了数を差し引く。これにより、完了数は入力したタスク内でのみ反映され、
-        # 他タスクへ影響が出ないようにする。計画外完了の場合、未来の割当から差し引く。
-        remaining_tasks=[]
-        for name,info in tasks.items():
-            # name は既に正規化済み（tasks 辞書作成時に strip 済み）
-            # 今日の計画: today の割当
-            today_plan = sum(r['assigned'] for r in self.loaded_plan_rows if str(r.get('name','')).strip()==name and r['day']==today)
-            # 未来の割当: today より後
-            future_plan = sum(r['assigned'] for r in self.loaded_plan_rows if str(r.get('name','')).strip()==name and today < r['day'] <= cutoff_day)
-            # ユーザー入力分はそのタスク内で差し引く（正規化済みキーで取得）
-            done = done_today.get(name, 0)
-            # 残り = (今日の計画 + 未来の割当) - 完了数
-            rem = today_plan + future_plan - done
-            if rem < 0: rem = 0
-            tpi = (sum(info['time_per_item_samples'])/len(info['time_per_item_samples'])) if info['time_per_item_samples'] else 1.0
-            remaining_tasks.append({'name':name,'remaining':int(rem),'time_per_item':float(tpi),'difficulty':1.0,'priority':int(info['first_day'])})
-
-        # allocate using first_mod.allocate_by_priority
-        tasks_alloc = []
-        for t in remaining_tasks:
-            tasks_alloc.append({'name':t['name'],'remaining':t['remaining'],'total':t['remaining'],'time_per_item':t['time_per_item'],'difficulty':t['difficulty'],'priority':t['priority']})
-        if first_mod and hasattr(first_mod, 'allocate_by_priority'):
-            plan = first_mod.allocate_by_priority(next_caps, tasks_alloc)
-        else:
+        # 残り = (今日の計画 + 未来の割当) - 完了数 を再計画する（done_task.replan_plan_rows と共通の規則）。
+        # 完了数は入力したタスク内でのみ差し引き、計画外完了の場合は未来の割当から差し引く。
+        if not (done_mod and hasattr(done_mod, 'replan_plan_rows')):
             messagebox.showerror('エラー','割当関数が見つかりません')
             return
+        # 台帳を渡すと、修正済みの過去の実績の差も残り数に入り、結果が台帳の新しい版になる
+        result = done_mod.replan_plan_rows(self.loaded_plan_rows, orig_caps, today, done_today, next_caps, ledger,
+                                           subject=self.loaded_meta.get('subject', ''))
+        self.last_today = today
+        combined_plan = result['combined_plan']
+        start_day = result['start_day']
 
         # 割り当て後、残タスクがある場合は警告を出す
-        total_assigned = {}
-        for day_tasks in plan:
-            for task in day_tasks:
-                task_name = task['name']
-                total_assigned[task_name] = total_assigned.get(task_name, 0) + task['assigned']
-        
-        unfinished_tasks = []
-        for t in tasks_alloc:
-            assigned_count = total_assigned.get(t['name'], 0)
-            if assigned_count < t['remaining']:
-                remaining_count = t['remaining'] - assigned_count
-                unfinished_tasks.append(f"  {t['name']}: {remaining_count}問が未割当")
-        
+        unfinished_tasks = [f"  {name}: {count}問が未割当" for name, count in result['unassigned'].items()]
         if unfinished_tasks:
             warning_msg = "⚠️ 警告: 時間内にすべてのタスクを割り当てられませんでした。\n\n"
             warning_msg += "未割当のタスク:\n" + '\n'.join(unfinished_tasks)
@@ -522,175 +661,159 @@ class PlannerGUI(tk.Tk):
             self.txt_update.insert('end', '\n' + warning_msg + '\n\n')
             messagebox.showwarning('時間不足', warning_msg)
 
-        # render replan + remaining original future days in calendar view
-        try:
-            if self.loaded_meta.get('start_date'):
-                base_date = datetime.fromisoformat(self.loaded_meta.get('start_date')).date()
-                # 再計画は today の次の日から始まる（today は完了済み）
-                start_day = today + 1
-                new_start = (base_date + timedelta(days=(today))).isoformat()
-            else:
-                new_start = None
-                start_day = today + 1
-        except Exception:
-            new_start = None
-            start_day = today + 1
-
-        header_meta = (self.loaded_meta.get('subject','(無題)'), new_start or self.loaded_meta.get('start_date'), self.loaded_meta.get('test_date'))
-
-        # collect future days from loaded_plan_rows where day > cutoff_day and append after replan
-        cutoff_day = today + len(next_caps)
-        future_days_map = {}
-        max_future_day = cutoff_day
-        for r in self.loaded_plan_rows:
-            try:
-                d = int(r.get('day', 0))
-            except Exception:
-                continue
-            if d > cutoff_day:
-                max_future_day = max(max_future_day, d)
-                future_days_map.setdefault(d, []).append({'name': r.get('name'), 'assigned': int(r.get('assigned',0)), 'time': float(r.get('time',0.0))})
-
-        future_plan = []
-        if future_days_map:
-            for daynum in range(cutoff_day+1, max_future_day+1):
-                day_tasks = future_days_map.get(daynum, [])
-                # 空のタスク名（以前の '(休憩/学習無し)' を含む）を除外する
-                filtered = [t for t in day_tasks if t.get('name') and t.get('name').strip() != '']
-                if filtered:
-                    conv = [{'name': t['name'], 'assigned': t['assigned'], 'time': t['time']} for t in filtered]
-                else:
-                    conv = []
-                future_plan.append(conv)
-
-        combined_plan = []
-        combined_plan.extend(plan)
-        if future_plan:
-            combined_plan.extend(future_plan)
+        # 再計画結果を履歴に積み、以降の再計画はこの版を起点にする
+        self.history.push(f"Day {today} の完了を反映", result['rows'], result['day_capacities'], self.loaded_meta)
+        self._use_current_version()
 
         # print combined plan in original (per-day) format
         # デバッグサマリは既に表示済みなので、削除せずに追記する
         self.txt_update.insert('end', f"\n再計画（開始 Day {start_day}）:\n\n")
-        # base date for label calculation
+        self._insert_days(combined_plan, start_day)
+
+        # ask to save
+        if messagebox.askyesno('保存確認','この再計画を保存しますか？'):
+            fname = filedialog.asksaveasfilename(initialdir=PLANS_DIR, defaultextension='.csv', filetypes=[('CSVファイル','*.csv')])
+            if fname and self._write_version_csv(fname, self.history.current(), result['total_needed']):
+                messagebox.showinfo('保存完了', f'プランを保存しました: {fname}')
+
+    def _insert_days(self, day_plans, start_day):
+        # 日ごとの割当を「Day n (m/d):」形式で出力欄に追記する
         base_for_print = None
-        if new_start:
+        if self.loaded_meta.get('start_date'):
             try:
-                base_for_print = datetime.fromisoformat(new_start).date()
+                base_for_print = datetime.fromisoformat(self.loaded_meta.get('start_date')).date()
             except Exception:
                 base_for_print = None
-        for idx, day_tasks in enumerate(combined_plan, start=start_day):
+        for idx, day_tasks in enumerate(day_plans, start=start_day):
             label = f"Day {idx}"
             if base_for_print:
-                try:
-                    d = base_for_print + timedelta(days=(idx - start_day))
-                    label += f" ({d.month}/{d.day})"
-                except Exception:
-                    pass
+                d = done_mod.day_date(base_for_print, self.loaded_first_day, idx)
+                label += f" ({d.month}/{d.day})"
             self.txt_update.insert('end', f"{label}:\n")
-            if not day_tasks:
-                # 空日はプレースホルダを出さない
-                pass
-            else:
-                for it in day_tasks:
-                    self.txt_update.insert('end', f"  - {it['name']} を {it['assigned']} 問 合計 {it['time']:.2f} 時間\n")
+            # 空日はプレースホルダを出さない
+            for it in day_tasks:
+                self.txt_update.insert('end', f"  - {it['name']} を {it['assigned']} 問 合計 {it['time']:.2f} 時間\n")
             self.txt_update.insert('end','\n')
 
-        # ask to save
-        if messagebox.askyesno('保存確認','この再計画を保存しますか？'):
-            fname = filedialog.asksaveasfilename(initialdir=PLANS_DIR, defaultextension='.csv', filetypes=[('CSVファイル','*.csv')])
-            if fname:
-                with open(fname,'w',newline='',encoding='utf-8') as f:
-                    w = csv.writer(f)
-                    # header meta
-                    w.writerow(['subject', self.loaded_meta.get('subject','(無題)')])
-                    w.writerow(['generated_at', datetime.now().isoformat()])
-
-                    # Build full day capacities array: ensure we include original loaded days and any new days from combined_plan
-                    orig_caps = getattr(self, 'loaded_day_caps', []) or []
-                    combined_len = start_day + len(combined_plan) - 1
-                    total_days = max(len(orig_caps), combined_len)
-                    full_day_caps = [0.0] * total_days
-                    for idx in range(total_days):
-                        if idx < len(orig_caps):
-                            full_day_caps[idx] = orig_caps[idx]
-                        else:
-                            full_day_caps[idx] = 0.0
-
-                    total_available = sum(full_day_caps)
-                    # total_needed: sum of hours in the combined_plan
-                    combined_total_time = 0.0
-                    for day_tasks in combined_plan:
-                        for it in day_tasks:
-                            combined_total_time += float(it.get('time', 0.0))
-
-                    w.writerow(['total_available', f"{total_available:.2f}"])
-                    w.writerow(['total_needed', f"{combined_total_time:.2f}"])
-
-                    # preserve start_date/test_date if present; update start_date to the original start if available
-                    try:
-                        if self.loaded_meta.get('start_date'):
-                            # keep original start_date
-                            w.writerow(['start_date', self.loaded_meta.get('start_date')])
-                    except Exception:
-                        pass
-                    if self.loaded_meta.get('test_date'):
-                        w.writerow(['test_date', self.loaded_meta.get('test_date')])
-
-                    w.writerow([])
-                    w.writerow(['Day Capacities'])
-                    w.writerow(['Day','AvailableHours'])
-                    for i, h in enumerate(full_day_caps, start=1):
-                        w.writerow([i, f"{h:.2f}"])
-
-                    # Plan: write rows for day=1..total_days, combining past original rows and new combined_plan
-                    w.writerow([])
-                    w.writerow(['Plan'])
-                    w.writerow(['Day','Task','Assigned','Time(hours)'])
-
-                    # Build map of original plan rows by day
-                    orig_map = {}
-                    for r in self.loaded_plan_rows:
-                        try:
-                            d = int(r.get('day', 0))
-                        except Exception:
-                            continue
-                        orig_map.setdefault(d, []).append(r)
-
-                    for day in range(1, total_days+1):
-                        if day <= today:
-                            # past days and today (completed): write original rows (if any)
-                            rows = orig_map.get(day, [])
-                            if not rows:
-                                w.writerow([day, '', '', ''])
-                            else:
-                                for rr in rows:
-                                    name = rr.get('name','') or ''
-                                    assigned = int(rr.get('assigned',0)) if rr.get('assigned', '')!='' else ''
-                                    timeh = float(rr.get('time',0.0)) if rr.get('time', '')!='' else ''
-                                    w.writerow([day, name, assigned, f"{timeh:.2f}" if timeh!='' else ''])
-                        else:
-                            # future/replanned days (after today)
-                            if start_day <= day < start_day + len(combined_plan):
-                                rel = day - start_day
-                                day_tasks = combined_plan[rel]
-                                if not day_tasks:
-                                    w.writerow([day, '', '', ''])
-                                else:
-                                    for it in day_tasks:
-                                        w.writerow([day, it.get('name',''), it.get('assigned',0), f"{it.get('time',0.0):.2f}"])
-                            else:
-                                # if original had tasks for this day, write them; otherwise empty
-                                rows = orig_map.get(day, [])
-                                if not rows:
-                                    w.writerow([day, '', '', ''])
-                                else:
-                                    for rr in rows:
-                                        name = rr.get('name','') or ''
-                                        assigned = int(rr.get('assigned',0)) if rr.get('assigned', '')!='' else ''
-                                        timeh = float(rr.get('time',0.0)) if rr.get('time', '')!='' else ''
-                                        w.writerow([day, name, assigned, f"{timeh:.2f}" if timeh!='' else ''])
-                messagebox.showinfo('保存完了', f'プランを保存しました: {fname}')
+    def _write_version_csv(self, fname, version, total_needed):
+        # 版（Day1 からの通しのプラン）を本ツールの CSV 形式で保存する。start_date は Day 1 の日付にする
+        plan = [[{'name': n, 'assigned': a, 'time': t} for n, a, t in items] for items in version.days]
+        # 読み込んだファイルに上書きする場合は、読み込み後に他（監視モードなど）で更新されていないか確認する
+        meta = version.meta
+        same = self.loaded_path and os.path.abspath(fname) == os.path.abspath(self.loaded_path)
+        expected = self.loaded_version if same else store_mod.ANY
+        # RLE で保存されていたプランは RLE のまま保存する（それ以外は first_study_plan.PLAN_CSV_RLE に従う）
+        rle = meta.get('plan_encoding') == 'rle' or None
+        # 版は Day 1 から書くので、継続プランの start_date（最初の Day の日付）は Day 1 の日付に直す
+        start_date = done_mod.day1_start_date(meta.get('start_date'), self.loaded_first_day) or None
+        try:
+            saved = first_mod.write_plan_csv(fname, meta.get('subject','(無題)'), version.day_capacities(), plan, total_needed,
+                                             start_date=start_date,
+                                             test_date=meta.get('test_date') or None, expected=expected, rle=rle)
+        except store_mod.PlanConflict as e:
+            if not messagebox.askyesno('競合', f'{e}。\nこの内容で上書きしますか？'):
+                return False
+            saved = first_mod.write_plan_csv(fname, meta.get('subject','(無題)'), version.day_capacities(), plan, total_needed,
+                                             start_date=start_date,
+                                             test_date=meta.get('test_date') or None, rle=rle)
+        except TimeoutError as e:
+            messagebox.showerror('エラー', str(e))
+            return False
+        if same:
+            self.loaded_version = saved
+        return True
+
+    # -- 再計画の履歴
+    def _use_current_version(self):
+        version = self.history.current()
+        self.loaded_plan_rows = version.plan_rows()
+        self.loaded_day_caps = version.day_capacities()
+
+    def _show_version(self):
+        version = self.history.current()
+        self.txt_update.delete('1.0','end')
+        self.txt_update.insert('end', f"版 {self.history.cursor + 1}/{len(self.history.versions)}: {version.label}\n\n")
+        self._insert_days([[{'name': n, 'assigned': a, 'time': t} for n, a, t in items] for items in version.days], 1)
+
+    def _reset_ledger(self):
+        # 台帳を今の版から作り直す（記録した実績は消える）
+        self.ledger = ledger_mod.PlanLedger.from_rows(self.loaded_plan_rows, len(self.loaded_day_caps))
+        self.last_today = None
 
+    def _undo_replan(self):
+        if not self.history or not self.history.can_undo():
+            messagebox.showinfo('履歴', 'これより前の版はありません')
+            return
+        self.history.undo()
+        self._use_current_version()
+        self._reset_ledger()
+        self._show_version()
+
+    def _redo_replan(self):
+        if not self.history or not self.history.can_redo():
+            messagebox.showinfo('履歴', 'これより後の版はありません')
+            return
+        self.history.redo()
+        self._use_current_version()
+        self._reset_ledger()
+        self._show_version()
+
+    def _correct_actual(self):
+        # 再計画した日より前の実績を直し、その差だけを反映して最後の再計画をやり直す
+        if not self.ledger or not self.last_today:
+            messagebox.showwarning('警告', '先に「完了を適用して再計画」を行ってください')
+            return
+        today = self.last_today
+        s = tk.simpledialog.askinteger('実績の修正', f'修正する Day 番号を入力してください（1～{today}）:',
+                                       minvalue=1, maxvalue=today)
+        if s is None:
+            return
+        names = sorted(self.ledger.tasks())
+        listing = '\n'.join(f"{i}. {n}（予定 {self.ledger.planned_count(n, s, s)} 問"
+                            + (f"、記録 {self.ledger.actual(n, s)} 問" if self.ledger.actual(n, s) is not None else '') + '）'
+                            for i, n in enumerate(names, start=1))
+        k = tk.simpledialog.askinteger('実績の修正', f'Day {s} のどのタスクですか？\n{listing}', minvalue=1, maxvalue=len(names))
+        if k is None:
+            return
+        name = names[k - 1]
+        count = tk.simpledialog.askinteger('実績の修正', f'{name} の Day {s} の完了数:', minvalue=0)
+        if count is None:
+            return
+        self.ledger.set_actual(name, s, count)
+        done_today = {n: (self.ledger.actual(n, today) if self.ledger.actual(n, today) is not None
+                          else self.ledger.planned_count(n, today, today)) for n in names}
+        try:
+            result = done_mod.replan_plan_rows(self.loaded_plan_rows, self.loaded_day_caps, today, done_today,
+                                               ledger=self.ledger, subject=self.loaded_meta.get('subject', ''))
+        except ValueError as e:
+            messagebox.showerror('エラー', str(e))
+            return
+        self.history.push(f"Day {s} の実績を修正（{name}: {count} 問）", result['rows'], result['day_capacities'], self.loaded_meta)
+        self._use_current_version()
+        self._show_version()
+        if result['unassigned']:
+            self.txt_update.insert('end', '未割当: ' + ', '.join(f"{n} {c}問" for n, c in result['unassigned'].items()) + '\n')
+
+    def _diff_versions(self):
+        if not self.history or len(self.history.versions) < 2:
+            messagebox.showinfo('履歴', '比較できる版がありません（再計画すると版が増えます）')
+            return
+        n = len(self.history.versions)
+        listing = '\n'.join(f"{i+1}: {v.label}" for i, v in enumerate(self.history.versions))
+        s = tk.simpledialog.askstring('版の比較', f"比較する2つの版番号をカンマ区切りで入力してください（例: 1,{n}）\n{listing}")
+        if not s:
+            return
+        try:
+            a, b = [int(x) - 1 for x in s.split(',')[:2]]
+            if not (0 <= a < n and 0 <= b < n):
+                raise ValueError
+        except ValueError:
+            messagebox.showwarning('警告', f'1～{n} の番号を2つ入力してください')
+            return
+        va, vb = self.history.versions[a], self.history.versions[b]
+        text = history_mod.format_diff(self.history.diff(a, b), f"版{a+1}（{va.label}）", f"版{b+1}（{vb.label}）")
+        self.txt_update.insert('end', '\n' + text + '\n')
+        self.txt_update.see('end')
 
 if __name__ == '__main__':
     app = PlannerGUI()
@@ -0,0 +1,202 @@
+"""再計画の履歴（元に戻す／やり直す／版の比較）を構造共有で保持するモジュール
+
+各版のプランは「日ごとの割当（タプル）」を要素とする永続ベクタ（分岐数 32 の木）で持ちます。
+再計画で変わった日だけ新しいノードを作り、変わっていない日と部分木は前の版と共有するため、
+メモリは版の数ではなく変更の大きさに比例して増えます。版どうしの差分も、同じ部分木
+（同一オブジェクト）は読み飛ばすので変更箇所の数に比例した時間で求まります。
+"""
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+class PersistentVector:
+    """変更のたびに新しいベクタを返す（元のベクタは変わらない）固定長ベクタ。"""
+
+    __slots__ = ('size', 'shift', 'root')
+
+    def __init__(self, size, shift, root):
+        self.size = size
+        self.shift = shift
+        self.root = root
+
+    @classmethod
+    def from_list(cls, items):
+        items = list(items)
+        nodes = [tuple(items[i:i + WIDTH]) for i in range(0, len(items), WIDTH)] or [()]
+        shift = 0
+        while len(nodes) > 1:
+            nodes = [tuple(nodes[i:i + WIDTH]) for i in range(0, len(nodes), WIDTH)]
+            shift += BITS
+        return cls(len(items), shift, nodes[0])
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        node = self.root
+        shift = self.shift
+        while shift > 0:
+            node = node[(i >> shift) & MASK]
+            shift -= BITS
+        return node[i & MASK]
+
+    def __iter__(self):
+        def walk(node, shift):
+            if shift == 0:
+                yield from node
+            else:
+                for child in node:
+                    yield from walk(child, shift - BITS)
+        return walk(self.root, self.shift)
+
+    def set(self, i, value):
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+
+        def assoc(node, shift):
+            idx = (i >> shift) & MASK
+            if shift == 0:
+                if node[idx] is value:
+                    return node
+                return node[:idx] + (value,) + node[idx + 1:]
+            child = assoc(node[idx], shift - BITS)
+            if child is node[idx]:
+                return node
+            return node[:idx] + (child,) + node[idx + 1:]
+
+        root = assoc(self.root, self.shift)
+        return self if root is self.root else PersistentVector(self.size, self.shift, root)
+
+    def updated(self, items):
+        """新しい内容 items（同じ長さ）との差分だけを置き換えたベクタを返す。"""
+        items = list(items)
+        if len(items) != self.size:
+            return PersistentVector.from_list(items)
+        vec = self
+        for i, (old, new) in enumerate(zip(self, items)):
+            if old != new:
+                vec = vec.set(i, new)
+        return vec
+
+    def diff(self, other):
+        """(添字, 自分の値, 相手の値) の一覧。同一の部分木は比較しない。"""
+        if self.size != other.size or self.shift != other.shift:
+            n = max(self.size, other.size)
+            a, b = list(self), list(other)
+            return [(i, a[i] if i < len(a) else None, b[i] if i < len(b) else None)
+                    for i in range(n) if (a[i] if i < len(a) else None) != (b[i] if i < len(b) else None)]
+        out = []
+
+        def walk(x, y, shift, base):
+            if x is y:
+                return
+            for k in range(max(len(x), len(y))):
+                cx = x[k] if k < len(x) else None
+                cy = y[k] if k < len(y) else None
+                if shift == 0:
+                    if cx != cy:
+                        out.append((base + k, cx, cy))
+                else:
+                    walk(cx or (), cy or (), shift - BITS, base + (k << shift))
+
+        walk(self.root, other.root, self.shift, 0)
+        return out
+
+
+class PlanVersion:
+    """1つの版: 日別割当（Day1 から）・日別容量・メタ情報。"""
+
+    __slots__ = ('label', 'days', 'caps', 'meta')
+
+    def __init__(self, label, days, caps, meta):
+        self.label = label
+        self.days = days
+        self.caps = caps
+        self.meta = meta
+
+    def plan_rows(self):
+        rows = []
+        for day, items in enumerate(self.days, start=1):
+            if not items:
+                rows.append({"day": day, "name": "", "assigned": 0, "time": 0.0})
+            for name, assigned, time_h in items:
+                rows.append({"day": day, "name": name, "assigned": assigned, "time": time_h})
+        return rows
+
+    def day_capacities(self):
+        return list(self.caps)
+
+
+def _days_from_rows(plan_rows, ndays):
+    days = [[] for _ in range(ndays)]
+    for r in plan_rows:
+        name = str(r.get("name", "")).strip()
+        if name and 1 <= r["day"] <= ndays:
+            days[r["day"] - 1].append((name, int(r["assigned"]), float(r["time"])))
+    return [tuple(d) for d in days]
+
+
+class PlanHistory:
+    """版の列と現在位置。push で新しい版を追加（やり直し分は破棄）し、undo/redo で移動する。"""
+
+    def __init__(self):
+        self.versions = []
+        self.cursor = -1
+
+    def push(self, label, plan_rows, day_capacities, meta):
+        ndays = max([len(day_capacities)] + [r["day"] for r in plan_rows])
+        days = _days_from_rows(plan_rows, ndays)
+        caps = list(day_capacities) + [0.0] * (ndays - len(day_capacities))
+        prev = self.current()
+        if prev is not None and len(prev.days) == ndays:
+            # 変わらない日は前の版のノードをそのまま共有する
+            days_vec = prev.days.updated(days)
+            caps_vec = prev.caps.updated(caps)
+        else:
+            days_vec = PersistentVector.from_list(days)
+            caps_vec = PersistentVector.from_list(caps)
+        del self.versions[self.cursor + 1:]
+        self.versions.append(PlanVersion(label, days_vec, caps_vec, dict(meta)))
+        self.cursor = len(self.versions) - 1
+        return self.versions[-1]
+
+    def current(self):
+        return self.versions[self.cursor] if self.cursor >= 0 else None
+
+    def can_undo(self):
+        return self.cursor > 0
+
+    def can_redo(self):
+        return self.cursor + 1 < len(self.versions)
+
+    def undo(self):
+        if self.can_undo():
+            self.cursor -= 1
+        return self.current()
+
+    def redo(self):
+        if self.can_redo():
+            self.cursor += 1
+        return self.current()
+
+    def diff(self, i, j):
+        """版 i と版 j（0 始まり）の日ごとの差分: [(Day, i の割当, j の割当)]"""
+        a, b = self.versions[i], self.versions[j]
+        return [(k + 1, x or (), y or ()) for k, x, y in a.days.diff(b.days)]
+
+
+def format_diff(diff, label_a, label_b):
+    if not diff:
+        return f"{label_a} と {label_b} に違いはありません。"
+
+    def fmt(items):
+        return ', '.join(f"{n} {a}問" for n, a, _ in items) or '(なし)'
+
+    lines = [f"{label_a} → {label_b} の差分（{len(diff)} 日）:"]
+    for day, before, after in diff:
+        lines.append(f"  Day {day}: {fmt(before)}  →  {fmt(after)}")
+    return '\n'.join(lines)
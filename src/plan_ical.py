@@ -0,0 +1,203 @@
+"""プラン CSV を iCalendar（.ics、カレンダーアプリで購読できる形式）に書き出すコマンド
+
+使い方:
+    python src/plan_ical.py plans/example.csv                 # plans/example.ics を作成
+    python src/plan_ical.py plans/example.csv --per-task      # 割当1件ごとに1予定
+    python src/plan_ical.py --all --out calendars/            # plans/ 全体を並列に書き出す
+
+Day n の日付は、meta の start_date を CSV の最初の Day の日付として数えます（done_task.day_date。継続プランは
+Day 番号が途中から始まり、start_date はその日の日付です）。start_date の無いプランは書き出せません。
+予定は終日予定で、既定では1日1件（その日のタスクと問題数を説明欄に列挙）です。
+CSV は1行ずつ読みながらそのまま書き出すので、プランが大きくてもメモリはほとんど使いません。
+--all では出力先の .ics が元の CSV より新しければ書き出しを省略するため、毎晩の一括出力は
+変更のあったプランの分だけで済みます。
+"""
+import argparse
+import hashlib
+import os
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import done_task
+from plan_catalog import PLANS_DIR, PlanCatalog
+
+PRODID = '-//optimal_study_plan//plan_ical//JA'
+# RFC 5545: 1行は改行を除いて 75 オクテットまで。超える分は「改行 + 空白」で折り返す
+FOLD_OCTETS = 75
+
+
+def _escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _write_line(f, line):
+    """1行を折り返して書く。UTF-8 の文字の途中では折り返さない。"""
+    data = line.encode('utf-8')
+    if len(data) <= FOLD_OCTETS:
+        f.write(data + b'\r\n')
+        return
+    start = 0
+    limit = FOLD_OCTETS
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # 継続バイト（0b10xxxxxx）の手前まで戻す
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        f.write((b' ' if start else b'') + data[start:end] + b'\r\n')
+        start = end
+        limit = FOLD_OCTETS - 1  # 継続行は先頭の空白を含めて 75 オクテット
+
+
+def _stamp(meta):
+    # DTSTAMP はプランの生成日時（無ければ現在時刻）。同じ CSV からは同じ .ics になる
+    try:
+        dt = datetime.fromisoformat(meta.get('generated_at', ''))
+    except ValueError:
+        dt = datetime.now()
+    return dt.strftime('%Y%m%dT%H%M%S')
+
+
+def _uid_prefix(path, meta):
+    key = f"{os.path.abspath(path)}|{meta.get('subject', '')}|{meta.get('start_date', '')}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _write_event(f, uid, stamp, day_date, summary, description):
+    _write_line(f, 'BEGIN:VEVENT')
+    _write_line(f, f'UID:{uid}@optimal_study_plan')
+    _write_line(f, f'DTSTAMP:{stamp}')
+    _write_line(f, f'DTSTART;VALUE=DATE:{day_date:%Y%m%d}')
+    _write_line(f, f'DTEND;VALUE=DATE:{day_date + timedelta(days=1):%Y%m%d}')
+    _write_line(f, f'SUMMARY:{_escape(summary)}')
+    if description:
+        _write_line(f, f'DESCRIPTION:{_escape(description)}')
+    _write_line(f, 'END:VEVENT')
+
+
+def export_ical(csv_path, ics_path, per_task=False):
+    """プラン CSV を .ics に書き出し、書いた予定の件数を返す。start_date が無ければ ValueError。"""
+    rows = done_task.iter_plan_csv(csv_path)
+    _, meta = next(rows)
+    try:
+        start = datetime.fromisoformat(meta.get('start_date', '')).date()
+    except ValueError:
+        raise ValueError(f"start_date が無いため日付を決められません: {csv_path}")
+    subject = meta.get('subject', '') or '(無題)'
+    stamp = _stamp(meta)
+    uid = _uid_prefix(csv_path, meta)
+    count = 0
+
+    tmp = ics_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        _write_line(f, 'BEGIN:VCALENDAR')
+        _write_line(f, 'VERSION:2.0')
+        _write_line(f, f'PRODID:{PRODID}')
+        _write_line(f, 'CALSCALE:GREGORIAN')
+        _write_line(f, f'X-WR-CALNAME:{_escape(subject)}')
+
+        # 1日1件のときは、同じ日の行（CSV では日ごとに連続）だけをためて日が変わったら書く
+        cur_day, cur_items = None, []
+        # 最初の Day（空の日の行も含む。行は Day の順に並ぶ）が start_date の日
+        first_day = None
+
+        def flush():
+            nonlocal count
+            if cur_items:
+                hours = sum(t for _, _, t in cur_items)
+                lines = [f"{name} {assigned}問（{t:.2f} 時間）" for name, assigned, t in cur_items]
+                _write_event(f, f"{uid}-d{cur_day}", stamp, done_task.day_date(start, first_day, cur_day),
+                             f"{subject} Day {cur_day}（{hours:.2f} 時間）", '\n'.join(lines))
+                count += 1
+
+        for kind, row in rows:
+            if kind != 'plan':
+                continue
+            day = row['day']
+            if first_day is None:
+                first_day = day
+            name = str(row['name']).strip()
+            if not name:
+                continue
+            if per_task:
+                _write_event(f, f"{uid}-d{day}-{count}", stamp, done_task.day_date(start, first_day, day),
+                             f"{subject}: {name} {row['assigned']}問", f"{row['time']:.2f} 時間")
+                count += 1
+                continue
+            if day != cur_day:
+                flush()
+                cur_day, cur_items = day, []
+            cur_items.append((name, row['assigned'], row['time']))
+        if not per_task:
+            flush()
+        _write_line(f, 'END:VCALENDAR')
+    os.replace(tmp, ics_path)
+    return count
+
+
+def _export_job(args):
+    csv_path, ics_path, per_task = args
+    try:
+        return csv_path, export_ical(csv_path, ics_path, per_task), None
+    except (OSError, ValueError) as e:
+        return csv_path, 0, str(e)
+
+
+def export_directory(plans_dir=PLANS_DIR, out_dir=None, per_task=False, workers=None, force=False):
+    """plans_dir 以下のプランを out_dir（既定: plans_dir）に同じ相対パスの .ics として書き出す。
+
+    start_date の無いプランは対象外。戻り値は (書き出し件数, 省略件数, エラー [(パス, 理由)])。
+    """
+    catalog = PlanCatalog(plans_dir)
+    catalog.refresh()
+    out_dir = os.path.abspath(out_dir or catalog.plans_dir)
+    jobs = []
+    skipped = 0
+    for entry in catalog.entries.values():
+        if not entry['start_date']:
+            continue
+        src = os.path.join(catalog.plans_dir, entry['path'])
+        dst = os.path.join(out_dir, os.path.splitext(entry['path'])[0] + '.ics')
+        if not force and os.path.exists(dst) and os.stat(dst).st_mtime_ns >= entry['mtime_ns']:
+            skipped += 1
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        jobs.append((src, dst, per_task))
+    errors = []
+    written = 0
+    if jobs:
+        with Pool(workers) as pool:
+            for path, _, err in pool.imap_unordered(_export_job, jobs, chunksize=16):
+                if err:
+                    errors.append((path, err))
+                else:
+                    written += 1
+    return written, skipped, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プラン CSV を iCalendar (.ics) に書き出します')
+    parser.add_argument('csv', nargs='?', help='プラン CSV（--all のときは不要）')
+    parser.add_argument('-o', '--out', default=None, help='出力先（単体: .ics ファイル、--all: フォルダー）')
+    parser.add_argument('--per-task', action='store_true', help='1日1件ではなく割当1件ごとに予定を作る')
+    parser.add_argument('--all', action='store_true', help='plans/ 全体を書き出す')
+    parser.add_argument('--dir', default=PLANS_DIR, help='--all で対象にする plans フォルダー')
+    parser.add_argument('--workers', type=int, default=None, help='--all の並列プロセス数（既定: CPU 数）')
+    parser.add_argument('--force', action='store_true', help='--all で新しい .ics があっても書き直す')
+    args = parser.parse_args(argv)
+
+    if args.all:
+        written, skipped, errors = export_directory(args.dir, args.out, args.per_task, args.workers, args.force)
+        for path, err in errors:
+            print(f"エラー: {path}: {err}")
+        print(f"書き出し {written} 件 / 変更なしで省略 {skipped} 件 / エラー {len(errors)} 件")
+        return
+    if not args.csv:
+        parser.error('CSV を指定するか --all を付けてください')
+    out = args.out or os.path.splitext(args.csv)[0] + '.ics'
+    count = export_ical(args.csv, out, args.per_task)
+    print(f"{out} に {count} 件の予定を書き出しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""allocate_by_priority（貪欲法）のプランを、複数の局所探索の鎖で並列に改善する後処理
+
+使い方:
+    python src/plan_improver.py                              # プリセットを 4 本 × 20000 手で改善して表示
+    python src/plan_improver.py --chains 8 --steps 50000 --seed 3
+    python src/plan_improver.py --weight overload=5 --weight spread=0.5   # 目的の重みを変える
+
+貪欲法は優先度の厳密な順序で前から詰めるため、優先度の低いタスクが期限ぎりぎりに寄ったり、
+「最低1問ルール」で容量を超える日が残ったりします。ここでは anytime_solver.LocalSearch（問題の移動・入れ替え）を
+異なる出発点・異なる種（seed）で何本も走らせ、目的の値が最も小さいプランを返します。
+ - 鎖 0 は貪欲法のプランから、残りは plan_pareto.py のパラメータ違いの割当から出発する
+ - 各鎖の種は seed から決まり、手数（steps）で止めるので、同じ seed なら結果は常に同じ
+   （プロセスの数や終わる順番には依存しない。--budget で時間でも止めると再現性は無くなる）
+ - 目的は anytime_solver と同じ 未完了・優先遅れ・負荷のばらつき に、容量の超過（時間）を加えたもの。
+   重みは OBJECTIVE（--weight 名前=値 で変更）
+鎖 0 は悪くなる手を採用しないので、結果が貪欲法より悪くなることはありません。
+"""
+import argparse
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import anytime_solver
+import first_study_plan
+import plan_pareto
+from first_study_plan import deadline_days
+
+DEFAULT_CHAINS = 4
+DEFAULT_STEPS = 20000
+# 目的の重み: anytime_solver の重みに、容量を超えた時間を加える
+OBJECTIVE = dict(anytime_solver.OBJECTIVE_WEIGHTS, overload=1.0)
+# 全鎖の手数の合計がこれ未満なら並列化しない（プロセスの起動の方が高くつく）
+PARALLEL_MIN_STEPS = 20000
+
+
+def chain_seeds(seed, chains):
+    rng = random.Random(seed)
+    return [rng.getrandbits(32) for _ in range(chains)]
+
+
+def start_plans(day_capacities, tasks, plan, chains):
+    """鎖ごとの出発点。0 本目は plan、残りはパラメータ違いの割当を均等に選ぶ。"""
+    params = plan_pareto.sweep_params(day_capacities)[1:]
+    starts = [plan]
+    for k in range(1, chains):
+        if not params:
+            starts.append(plan)
+            continue
+        p = params[(k - 1) * len(params) // max(1, chains - 1)]
+        starts.append(plan_pareto.allocate_with_params(day_capacities, tasks, **p))
+    return starts
+
+
+def _run_chain(args):
+    day_capacities, tasks, start, deadline, seed, steps, weights, stop_at = args
+    search = anytime_solver.LocalSearch(day_capacities, tasks, start, deadline, seed, weights)
+    cost = search.run(stop_at, steps)
+    return cost, search.plan(), list(search.total)
+
+
+def improve(day_capacities, tasks, plan=None, chains=DEFAULT_CHAINS, steps=DEFAULT_STEPS, seed=0, weights=None,
+            workers=None, start_date=None, test_date=None, budget=None):
+    """plan（省略時は allocate_by_priority の結果）を改善する。
+
+    tasks は割当前の状態（allocate_by_priority に渡すのと同じ remaining）で渡し、allocate_by_priority と同じく
+    remaining を減らす。戻り値は {'plan', 'cost', 'greedy_cost', 'chain', 'costs'}。
+    前提タスクの指定ミスは ValueError。同じ名前のタスクが複数ある場合は（プランの項目からタスクを決められないので）
+    改善せずに allocate_by_priority の結果を返し（cost などは None）、plan を渡していれば ValueError。
+    """
+    base = [dict(t) for t in tasks]
+    if plan is None and len({t['name'] for t in base}) < len(base):
+        plan = first_study_plan.allocate_by_priority(list(day_capacities), tasks)
+        return {'plan': plan, 'cost': None, 'greedy_cost': None, 'chain': None, 'costs': []}
+    first_study_plan._build_dependency_graph(base)
+    if plan is None:
+        plan = first_study_plan.allocate_by_priority(list(day_capacities), [dict(t) for t in base])
+    weights = dict(OBJECTIVE, **(weights or {}))
+    deadline = deadline_days(len(day_capacities), start_date, test_date)
+    chains = max(1, chains)
+    stop_at = time.perf_counter() + budget if budget is not None else math.inf
+    jobs = [(list(day_capacities), base, start, deadline, s, steps, weights, stop_at)
+            for start, s in zip(start_plans(day_capacities, base, plan, chains), chain_seeds(seed, chains))]
+    if workers == 1 or chains == 1 or chains * steps < PARALLEL_MIN_STEPS:
+        results = [_run_chain(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chain, jobs))
+    # 同じ値なら番号の小さい鎖（どの順に終わっても同じ結果になる）
+    costs = [cost for cost, _, _ in results]
+    best = min(range(len(results)), key=lambda k: (costs[k], k))
+    greedy_cost = anytime_solver.LocalSearch(day_capacities, base, plan, deadline, weights=weights).cost
+    _, best_plan, done = results[best]
+    # 割り当てた数はタスクの並び順で戻す（名前では戻さない）
+    for t, n in zip(tasks, done):
+        t['remaining'] = t.get('remaining', 0) - n
+    return {'plan': best_plan, 'cost': costs[best], 'greedy_cost': greedy_cost, 'chain': best, 'costs': costs}
+
+
+def parse_weights(items):
+    weights = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        if name not in OBJECTIVE:
+            raise ValueError(f"不明な目的です: {name}（{', '.join(OBJECTIVE)}）")
+        weights[name] = float(value)
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='貪欲法のプランを複数の局所探索で並列に改善します')
+    parser.add_argument('--chains', type=int, default=DEFAULT_CHAINS, help='局所探索の鎖の数')
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS, help='1本あたりの手数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='並列プロセス数（既定: CPU 数）')
+    parser.add_argument('--weight', action='append', default=[], metavar='名前=値',
+                        help=f"目的の重み（{', '.join(f'{k}={v:g}' for k, v in OBJECTIVE.items())}）")
+    parser.add_argument('--budget', type=float, default=None, help='時間でも止める（秒、指定すると再現性は無くなる）')
+    args = parser.parse_args(argv)
+    subject, day_capacities, total_available, tasks = first_study_plan.collect_inputs()
+    total_needed = first_study_plan.compute_total_time(tasks)
+    result = improve(day_capacities, tasks, None, args.chains, args.steps, args.seed, parse_weights(args.weight),
+                     args.workers, first_study_plan.START_DATE_PRESET, first_study_plan.TEST_DATE_PRESET, args.budget)
+    first_study_plan.print_plan(subject, total_available, day_capacities, tasks, total_needed, result['plan'])
+    if result['cost'] is None:
+        print('同じ名前のタスクがあるため、貪欲法のプランのまま表示しています')
+        return
+    print(f"良さ {result['greedy_cost']:.3f} -> {result['cost']:.3f}（鎖 {result['chain']}、各鎖: "
+          + ', '.join(f"{c:.3f}" for c in result['costs']) + '）')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""タスクごと・日ごとの予定数と実績（完了数）を持つ台帳（Fenwick 木による区間和）
+
+再計画で必要になる「Day k より前の予定数」「今日から cutoff までの予定数」などを、プラン行を
+毎回全部なめずに O(log 日数) で求めます。タスクごとに次の3本の Fenwick 木（BIT）を持ちます。
+ - planned:   今の版のプランの日ごとの予定数
+ - shortfall: 記録した実績と予定の差（予定 − 実績）
+ - pending:   shortfall のうち、まだ再計画に反映していない分
+実績を記録していない日は「予定どおりに終えた」とみなします（従来の再計画と同じ）。
+過去の日の実績を後から直したときは、その差だけが pending に入るので、次の再計画で
+全部を読み直さずに残り数へ反映されます（更新は O(log 日数)）。
+
+    ledger = PlanLedger.from_rows(plan_rows)
+    ledger.set_actual('教科書問題', 3, 4)              # Day 3 は 4 問だった（後からの修正も同じ）
+    ledger.remaining('教科書問題', today=5, cutoff=9)  # Day 6～9 の予定 + 未反映の不足分
+    ledger.rebase(result['rows'], today=5)             # 再計画の結果を新しい版として取り込む
+"""
+
+
+class Fenwick:
+    """1 始まりの添字の Fenwick 木（点の加算と接頭辞和が O(log n)）。"""
+
+    def __init__(self, values=()):
+        # values[i] が添字 i + 1 の値。O(n) で構築する
+        self.tree = [0] + list(values)
+        n = len(self.tree)
+        for i in range(1, n):
+            j = i + (i & -i)
+            if j < n:
+                self.tree[j] += self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, i, delta):
+        """添字 i（1 始まり）に delta を足す。添字 0 以下は IndexError（大きすぎる添字は無視）。"""
+        if i < 1:
+            raise IndexError(f"Fenwick の添字は 1 以上です: {i}")
+        n = len(self.tree)
+        while i < n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """添字 1～i の和（i が範囲外なら端で切る）。"""
+        i = min(i, len(self.tree) - 1)
+        s = 0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def range(self, lo, hi):
+        """添字 lo～hi（両端を含む）の和。"""
+        if hi < lo:
+            return 0
+        return self.prefix(hi) - self.prefix(max(lo, 1) - 1)
+
+
+class PlanLedger:
+    """タスクごとの予定数・未反映の差分の Fenwick 木と、記録した実績。"""
+
+    def __init__(self, days):
+        self.days = days
+        self.planned = {}
+        self.shortfall = {}
+        self.pending = {}
+        self.planned_at = {}
+        # 記録した実績 (タスク, Day) -> 完了数、タスク -> 未反映の差分がある Day の集合
+        self.actuals = {}
+        self.pending_days = {}
+
+    @classmethod
+    def from_rows(cls, plan_rows, days=None):
+        days = max([days or 0] + [r['day'] for r in plan_rows])
+        ledger = cls(days)
+        ledger._load_planned(plan_rows)
+        return ledger
+
+    def _load_planned(self, plan_rows):
+        per_task = {}
+        for r in plan_rows:
+            name = str(r['name']).strip()
+            if not name or not 1 <= r['day'] <= self.days:
+                continue
+            counts = per_task.setdefault(name, [0] * self.days)
+            counts[r['day'] - 1] += int(r['assigned'])
+        self.planned_at = per_task
+        self.planned = {name: Fenwick(counts) for name, counts in per_task.items()}
+        self.shortfall = {name: Fenwick([0] * self.days) for name in per_task}
+        for name in per_task:
+            self.pending.setdefault(name, Fenwick([0] * self.days))
+        for (name, day), count in self.actuals.items():
+            if name in per_task and day <= self.days:
+                self.shortfall[name].add(day, per_task[name][day - 1] - count)
+
+    def tasks(self):
+        return list(self.planned)
+
+    # -- 予定数の問い合わせ
+    def planned_count(self, name, lo, hi):
+        """Day lo～hi（両端を含む）の予定数。"""
+        tree = self.planned.get(name)
+        return tree.range(lo, hi) if tree else 0
+
+    def planned_before(self, name, day):
+        return self.planned_count(name, 1, day - 1)
+
+    def planned_total(self, name):
+        return self.planned_count(name, 1, self.days)
+
+    # -- 実績
+    def actual(self, name, day):
+        """記録した実績。記録が無ければ None（予定どおりとみなす）。"""
+        return self.actuals.get((name, day))
+
+    def set_actual(self, name, day, count):
+        """Day day の実績を記録（または修正）する。予定との差のうち未反映の分を pending に足す。"""
+        if name not in self.planned:
+            raise ValueError(f"タスクが見つかりません: {name}")
+        if not 1 <= day <= self.days:
+            raise ValueError(f"Day {day} は範囲外です（1～{self.days}）")
+        old = self.actuals.get((name, day))
+        if old is None:
+            old = self.planned_at[name][day - 1]
+        delta = old - int(count)
+        self.actuals[(name, day)] = int(count)
+        if delta:
+            self.shortfall[name].add(day, delta)
+            self.pending[name].add(day, delta)
+            self.pending_days.setdefault(name, set()).add(day)
+
+    def done_through(self, name, day):
+        """Day 1～day に終えたとみなす数（記録の無い日は予定どおり）。"""
+        tree = self.shortfall.get(name)
+        return self.planned_count(name, 1, day) - (tree.prefix(day) if tree else 0)
+
+    def remaining(self, name, today, cutoff):
+        """今日の完了を記録したうえで、Day today+1～cutoff に割り当て直す数。
+
+        = Day today+1～cutoff の予定 + Day today までの未反映の不足分（予定 − 実績）
+        """
+        tree = self.pending.get(name)
+        shortfall = tree.prefix(today) if tree else 0
+        return max(0, self.planned_count(name, today + 1, cutoff) + shortfall)
+
+    def rebase(self, plan_rows, today):
+        """再計画の結果（Day1 からの通しの行）を新しい版として取り込む。
+
+        Day today までの未反映の差分は再計画に反映済みになる。実績の記録は残すので、
+        その後に過去の実績を直すと差分だけがまた pending に入る。版ごとに O(タスク数 × 日数)。
+        """
+        self.days = max([self.days] + [r['day'] for r in plan_rows])
+        pending = {}
+        for name, days in self.pending_days.items():
+            tree = self.pending[name]
+            kept = {d: tree.range(d, d) for d in days if d > today}
+            pending[name] = {d: v for d, v in kept.items() if v}
+        self.pending = {}
+        self._load_planned(plan_rows)
+        self.pending_days = {}
+        for name, values in pending.items():
+            for d, v in values.items():
+                # 新しい版の行に無くなったタスクでも、未反映の差分は持ち越す
+                self.pending.setdefault(name, Fenwick([0] * self.days)).add(d, v)
+                self.pending_days.setdefault(name, set()).add(d)
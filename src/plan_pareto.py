@@ -0,0 +1,189 @@
+"""複数の目的のトレードオフを比べるための候補プラン（パレート最適な集合）を作るモジュール
+
+使い方:
+    python src/plan_pareto.py                 # first_study_plan.py のプリセットで候補を表示
+    python src/plan_pareto.py --workers 4
+    （GUI の「候補を比較」ボタンからも使えます）
+
+比べる目的（すべて小さいほど良い）:
+ - 優先遅れ: 各タスクの完了日を優先度の高いものほど重く平均した値（未完了はテスト日の翌日扱い）
+ - 負荷のばらつき: 日ごとの割当時間の標準偏差（時間）
+ - 未完了: テスト日の前日までに割り当てられなかった問題数（テスト日が無ければ全日程）
+
+割当の規則自体（allocate_by_priority）は変えず、次のパラメータを振って候補を作ります。
+ - ペース: 各日に使う時間を「残り必要時間 × その日の容量 ÷ 残り容量 × ペース」までに抑える（None は上限なし）
+ - 上限: 1日に使う時間の上限（容量の分位点から選ぶ。None は上限なし）
+ - 優先度のまとめ方: そのまま／2段ずつまとめる／区別しない（残数の多い順）
+候補はプロセスプールで並列に評価し、他の候補に全目的で劣る（支配される）候補を取り除きます。
+"""
+import argparse
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import first_study_plan
+from first_study_plan import deadline_days
+
+PACES = (None, 1.5, 1.25, 1.1, 1.0)
+PRIORITY_MODES = ('strict', 'grouped', 'flat')
+PRIORITY_MODE_LABELS = {'strict': '優先度どおり', 'grouped': '優先度を2段ずつまとめる', 'flat': '優先度を区別しない'}
+# 候補の評価に使う規模（タスク数 × 日数の合計）がこれ未満なら並列化しない
+PARALLEL_MIN_WORK = 20000
+
+
+def _peak_levels(day_capacities):
+    # 1日の上限候補: 容量の大きい日を削る分位点（重複と「上限なし」と同じになるものは除く）
+    caps = sorted(set(c for c in day_capacities if c > 0))
+    if len(caps) < 2:
+        return [None]
+    levels = [None]
+    for q in (0.75, 0.5):
+        level = caps[int((len(caps) - 1) * q)]
+        if level < caps[-1] and level not in levels:
+            levels.append(level)
+    return levels
+
+
+def sweep_params(day_capacities):
+    """評価するパラメータの組の一覧。"""
+    return [{'pace': pace, 'peak': peak, 'priority_mode': mode}
+            for mode in PRIORITY_MODES for peak in _peak_levels(day_capacities) for pace in PACES]
+
+
+def _effective_priorities(tasks, mode):
+    if mode == 'flat':
+        return [0 for _ in tasks]
+    ranks = {p: i for i, p in enumerate(sorted({t.get('priority', 99) for t in tasks}))}
+    if mode == 'grouped':
+        return [ranks[t.get('priority', 99)] // 2 for t in tasks]
+    return [t.get('priority', 99) for t in tasks]
+
+
+def allocate_with_params(day_capacities, tasks, pace=None, peak=None, priority_mode='strict'):
+    """パラメータ付きの割当。1日ずつ allocate_by_priority を呼び、その日に使う時間だけを調整する。
+
+    tasks の remaining は変更しない。pace も peak も None で 'strict' なら allocate_by_priority と同じ結果。
+    """
+    work = [dict(t) for t in tasks]
+    for t, p in zip(work, _effective_priorities(tasks, priority_mode)):
+        t['priority'] = p
+    if pace is None and peak is None:
+        return first_study_plan.allocate_by_priority(list(day_capacities), work)
+    quanta = [first_study_plan.task_quanta(t) for t in work]
+    plan = []
+    for day, cap in enumerate(day_capacities):
+        budget = first_study_plan.to_quanta(cap)
+        if peak is not None:
+            budget = min(budget, first_study_plan.to_quanta(peak))
+        if pace is not None:
+            needed = sum(t['remaining'] * q for t, q in zip(work, quanta) if q > 0)
+            left = sum(first_study_plan.to_quanta(c) for c in day_capacities[day:])
+            if left > 0:
+                budget = min(budget, math.ceil(needed * first_study_plan.to_quanta(cap) / left * pace))
+        if not any(t['remaining'] > 0 for t in work):
+            plan.append([])
+            continue
+        plan.append(first_study_plan.allocate_by_priority([first_study_plan.quanta_to_hours(budget)], work)[0])
+    return plan
+
+
+def evaluate(plan, tasks, deadline):
+    """(優先遅れ, 負荷のばらつき, 未完了) を返す。"""
+    ranks = {p: i for i, p in enumerate(sorted({t.get('priority', 99) for t in tasks}))}
+    totals = {t['name']: t['remaining'] for t in tasks}
+    done = {}
+    by_deadline = {}
+    finished_day = {}
+    loads = []
+    for day, day_tasks in enumerate(plan, start=1):
+        loads.append(sum(it['time'] for it in day_tasks))
+        for it in day_tasks:
+            name = it['name']
+            done[name] = done.get(name, 0) + it['assigned']
+            if day <= deadline:
+                by_deadline[name] = by_deadline.get(name, 0) + it['assigned']
+            if done[name] >= totals[name]:
+                finished_day.setdefault(name, day)
+    weighted = weight_sum = 0.0
+    for t in tasks:
+        if t['remaining'] <= 0:
+            continue
+        w = 1.0 / (ranks[t.get('priority', 99)] + 1)
+        weighted += w * min(finished_day.get(t['name'], deadline + 1), deadline + 1)
+        weight_sum += w
+    # テスト日の前日までに割り当てられなかった分（テスト日以降の割当も未完了に数える）
+    unfinished = sum(max(0, t['remaining'] - by_deadline.get(t['name'], 0)) for t in tasks)
+    lateness = weighted / weight_sum if weight_sum else 0.0
+    mean = sum(loads) / len(loads) if loads else 0.0
+    spread = math.sqrt(sum((x - mean) ** 2 for x in loads) / len(loads)) if loads else 0.0
+    return round(lateness, 4), round(spread, 4), unfinished
+
+
+def _evaluate_params(args):
+    day_capacities, tasks, deadline, params = args
+    plan = allocate_with_params(day_capacities, tasks, **params)
+    return {'params': params, 'plan': plan, 'objectives': evaluate(plan, tasks, deadline)}
+
+
+def dominates(a, b):
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+
+def pareto_front(candidates):
+    """支配されない候補だけを残す。目的値が同じ候補は最初の1つだけ残す。"""
+    ordered = sorted(candidates, key=lambda c: c['objectives'])
+    front = []
+    for c in ordered:
+        if any(f['objectives'] == c['objectives'] or dominates(f['objectives'], c['objectives']) for f in front):
+            continue
+        front.append(c)
+    return front
+
+
+def pareto_plans(day_capacities, tasks, start_date=None, test_date=None, workers=None):
+    """パレート最適な候補プランの一覧（優先遅れの小さい順）を返す。
+
+    前提タスクの指定ミスは allocate_by_priority と同じく ValueError。
+    """
+    tasks = [dict(t) for t in tasks]
+    if any(first_study_plan._prerequisites(t) for t in tasks):
+        # 指定ミスは候補を作る前に一度だけ検出する
+        first_study_plan._build_dependency_graph(tasks)
+    deadline = deadline_days(len(day_capacities), start_date, test_date)
+    jobs = [(list(day_capacities), tasks, deadline, params) for params in sweep_params(day_capacities)]
+    if workers == 1 or len(tasks) * len(day_capacities) * len(jobs) < PARALLEL_MIN_WORK:
+        candidates = [_evaluate_params(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            candidates = list(pool.map(_evaluate_params, jobs, chunksize=max(1, len(jobs) // 16)))
+    return pareto_front(candidates)
+
+
+def describe(params):
+    parts = [PRIORITY_MODE_LABELS[params['priority_mode']]]
+    if params['pace'] is not None:
+        parts.append(f"ペース ×{params['pace']:g}")
+    if params['peak'] is not None:
+        parts.append(f"1日 {params['peak']:g} 時間まで")
+    return '、'.join(parts)
+
+
+def format_front(front):
+    lines = [f"{'No':>3} {'優先遅れ':>8} {'負荷ばらつき':>12} {'未完了':>6}  パラメータ"]
+    for i, c in enumerate(front, start=1):
+        lateness, spread, unfinished = c['objectives']
+        lines.append(f"{i:>3} {lateness:>8.2f} {spread:>12.2f} {unfinished:>6}  {describe(c['params'])}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プリセットのタスクについてパレート最適な候補プランを表示します')
+    parser.add_argument('--workers', type=int, default=None, help='並列プロセス数（既定: CPU 数）')
+    args = parser.parse_args(argv)
+    _, day_capacities, _, tasks = first_study_plan.collect_inputs()
+    front = pareto_plans(day_capacities, tasks, first_study_plan.START_DATE_PRESET,
+                         first_study_plan.TEST_DATE_PRESET, args.workers)
+    print(format_front(front))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""新規プラン入力中のライブプレビュー用エンジン（GUI から利用）
+
+ - 入力欄の行ごとの解析結果をキャッシュし、変更された行だけを解析し直します。
+ - 割当は日ごとに進め、各日の開始時点の残数（スナップショット）を保存しておきます。
+   タスクが変わらず日別容量だけを編集した場合は、変更のない先頭の日までの結果を
+   再利用し、最初に変わった日から割当を再開します（割当は各日の開始時点の残数だけで決まるため）。
+ - 再計算はバックグラウンドのスレッド1本で行い、最新の入力だけを処理します。
+   finish を渡すと、割当の結果をさらに仕上げてから返します（GUI は「プラン生成」と同じ局所探索をかける）。
+"""
+import threading
+
+import first_study_plan
+
+# 行キャッシュの上限（超えたら作り直す）
+LINE_CACHE_MAX = 5000
+
+
+def parse_task_line(line):
+    """タスク1行（名前,合計問題数,優先順位,問題コスト[,前提;...]）を解析する。空行は None。"""
+    if not line.strip():
+        return None
+    parts = [p.strip() for p in line.split(',')]
+    if len(parts) < 4:
+        return None
+    name, total, priority, difficulty = parts[0], int(parts[1]), int(parts[2]), float(parts[3])
+    # 5列目（任意）: 前提タスク名をセミコロン区切りで指定
+    after = tuple(a.strip() for a in parts[4].split(';') if a.strip()) if len(parts) >= 5 else ()
+    return (name, total, priority, difficulty, after)
+
+
+class TaskLineCache:
+    """行の文字列 -> 解析結果 のキャッシュ。解析できない行は例外ごと覚えておく。"""
+
+    def __init__(self):
+        self._parsed = {}
+        self.bad_lines = []
+
+    def parse(self, text, time_per, strict=True):
+        """タスク欄全体を解析して tasks（first_study_plan と同じ形の dict のリスト）を返す。
+
+        strict=False のときは解析できない行を読み飛ばし、その行番号（1始まり）を bad_lines に残す。
+        """
+        if len(self._parsed) > LINE_CACHE_MAX:
+            self._parsed = {}
+        tasks = []
+        bad = []
+        for lineno, line in enumerate(text.splitlines(), start=1):
+            try:
+                parsed = self._parsed[line]
+            except KeyError:
+                try:
+                    parsed = parse_task_line(line)
+                except ValueError as e:
+                    parsed = e
+                self._parsed[line] = parsed
+            if isinstance(parsed, ValueError):
+                if strict:
+                    raise parsed
+                bad.append(lineno)
+                continue
+            if parsed is None:
+                continue
+            name, total, priority, difficulty, after = parsed
+            tasks.append({'name': name, 'remaining': total, 'total': total, 'time_per_item': time_per,
+                          'difficulty': difficulty, 'priority': priority, 'after': list(after)})
+        self.bad_lines = bad
+        return tasks
+
+
+def parse_day_caps(text):
+    day_caps = []
+    for part in text.strip().replace('\n', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            day_caps.append(float(part))
+        except ValueError:
+            pass
+    return day_caps
+
+
+def _tasks_key(tasks):
+    return tuple((t['name'], t['total'], t['priority'], t['difficulty'], t['time_per_item'], tuple(t['after']))
+                 for t in tasks)
+
+
+class PreviewEngine:
+    """日別スナップショットを保持し、変更のない先頭の日の割当を再利用する割当器。"""
+
+    def __init__(self):
+        self._key = None
+        self._work = []
+        self._caps = []
+        self._states = []
+        self._days = []
+
+    def compute(self, day_capacities, tasks):
+        """allocate_by_priority と同じ結果を返す（tasks は変更しない）。
+
+        戻り値: {'plan', 'unassigned': {名前: 問題数}, 'remaining': タスク順の割当後の残数, 'total_needed', 'reused_days'}
+        前提タスクの指定ミスは allocate_by_priority と同じく ValueError。
+        """
+        key = _tasks_key(tasks)
+        caps = [float(c) for c in day_capacities]
+        if key != self._key:
+            work = [dict(t, after=list(t['after'])) for t in tasks]
+            # 前提タスクの検証は割当前に一度だけ行う
+            if any(first_study_plan._prerequisites(t) for t in work):
+                first_study_plan._build_dependency_graph(work)
+            self._key = key
+            self._work = work
+            self._caps = []
+            self._states = [tuple(t['remaining'] for t in work)]
+            self._days = []
+        reused = 0
+        while reused < min(len(caps), len(self._caps)) and caps[reused] == self._caps[reused]:
+            reused += 1
+        del self._caps[reused:]
+        del self._days[reused:]
+        del self._states[reused + 1:]
+
+        work = self._work
+        for day in range(reused, len(caps)):
+            state = self._states[day]
+            if any(state):
+                for t, r in zip(work, state):
+                    t['remaining'] = r
+                day_plan = first_study_plan.allocate_by_priority([caps[day]], work)[0]
+                state = tuple(t['remaining'] for t in work)
+            else:
+                day_plan = []
+            self._caps.append(caps[day])
+            self._days.append(day_plan)
+            self._states.append(state)
+
+        final = self._states[len(caps)]
+        return {
+            'plan': [list(d) for d in self._days],
+            'unassigned': {t['name']: r for t, r in zip(work, final) if r > 0},
+            'remaining': list(final),
+            'total_needed': first_study_plan.compute_total_time(tasks),
+            'reused_days': reused,
+        }
+
+
+class PreviewWorker:
+    """最新の入力だけを処理するバックグラウンド再計算スレッド。
+
+    submit() は待たずに戻り、結果は poll() で受け取る（tkinter のウィジェットはメインスレッドで更新する）。
+    finish(day_capacities, tasks, result, extra) は再計算スレッドで呼ばれ、仕上げた結果を返す。
+    """
+
+    def __init__(self, engine=None, finish=None):
+        self.engine = engine or PreviewEngine()
+        self.finish = finish
+        self._cond = threading.Condition()
+        self._request = None
+        self._result = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, generation, day_capacities, tasks, extra=None):
+        with self._cond:
+            # 未処理の古い入力は捨てて最新だけを残す
+            self._request = (generation, list(day_capacities), tasks, extra)
+            self._cond.notify()
+
+    def poll(self):
+        """新しい結果があれば (generation, result または例外, extra) を返す。
+
+        計算中の例外は結果として返す（スレッドは止めない）。入力の誤りは ValueError、それ以外は不具合。
+        """
+        with self._cond:
+            result, self._result = self._result, None
+            return result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._request is None:
+                    self._cond.wait()
+                generation, caps, tasks, extra = self._request
+                self._request = None
+            try:
+                result = self.engine.compute(caps, tasks)
+                if self.finish is not None:
+                    result = self.finish(caps, tasks, result, extra)
+            except Exception as e:
+                result = e
+            with self._cond:
+                if self._result is None or self._result[0] <= generation:
+                    self._result = (generation, result, extra)
@@ -0,0 +1,197 @@
+"""プラン生成後の感度分析: どの日に1時間増やす／どのタスクを易しくすると未割当が最も減るか
+
+使い方:
+    python src/plan_sensitivity.py            # first_study_plan.py のプリセットで分析
+    （GUI の「感度分析」ボタンからも使えます）
+
+割当（allocate_by_priority と同じ規則）は「各日の開始時点の残数」だけで決まるため、基準の割当を1日ずつ進めながら
+各日の開始時点の状態（タスク別残数）を記録しておきます。摂動（ある日の容量 +1 時間、
+あるタスクの難易度 ×0.9 など）ごとに最初から割当し直すのではなく、影響が出始める日の
+状態から再開し、途中で基準と同じ状態に戻ったらそこで打ち切ります。
+"""
+import argparse
+import copy
+import heapq
+
+import first_study_plan
+
+
+class _DayStepper:
+    """allocate_by_priority と同じ規則で1日分だけ割当を進める（配列版）。
+
+    タスクの1問時間・優先度・前提関係を最初に一度だけ整数配列にしておき、
+    摂動ごと・日ごとの再計算では残数の配列だけを更新する。
+    """
+
+    def __init__(self, tasks, difficulties=None):
+        index = {t["name"]: i for i, t in enumerate(tasks)}
+        self.time_per = [first_study_plan.task_quanta(t) for t in tasks]
+        self.priority = [t.get("priority", 99) for t in tasks]
+        self.prereqs = [[index[p] for p in first_study_plan._prerequisites(t) if p in index] for t in tasks]
+        self.dependents = [[] for _ in tasks]
+        for i, pre in enumerate(self.prereqs):
+            for p in pre:
+                self.dependents[p].append(i)
+        self.has_prereqs = any(self.prereqs)
+        valid = [tp for tp in self.time_per if tp > 0]
+        self.min_time_per = min(valid) if valid else None
+
+    def with_time_per(self, idx, time_per):
+        # 1タスクの1問時間だけ差し替えた複製（前提関係などは共有）
+        other = copy.copy(self)
+        other.time_per = list(self.time_per)
+        other.time_per[idx] = time_per
+        valid = [tp for tp in other.time_per if tp > 0]
+        other.min_time_per = min(valid) if valid else None
+        return other
+
+    def step(self, cap, rem):
+        if self.min_time_per is None:
+            return
+        time_per, priority = self.time_per, self.priority
+        if self.has_prereqs:
+            pending = [sum(1 for p in pre if rem[p] > 0) for pre in self.prereqs]
+            ready = [(priority[i], -rem[i], i) for i in range(len(rem)) if pending[i] == 0 and rem[i] > 0 and time_per[i] > 0]
+        else:
+            pending = None
+            ready = [(priority[i], -r, i) for i, r in enumerate(rem) if r > 0 and time_per[i] > 0]
+        heapq.heapify(ready)
+        remaining_time = first_study_plan.to_quanta(cap)
+        any_assigned = False
+        deferred = []
+
+        def complete(i):
+            if pending is None:
+                return
+            for j in self.dependents[i]:
+                pending[j] -= 1
+                if pending[j] == 0 and rem[j] > 0 and time_per[j] > 0:
+                    heapq.heappush(ready, (priority[j], -rem[j], j))
+
+        while ready and remaining_time >= self.min_time_per:
+            i = heapq.heappop(ready)[-1]
+            if remaining_time < time_per[i]:
+                deferred.append(i)
+                continue
+            assign = min(remaining_time // time_per[i], rem[i])
+            rem[i] -= assign
+            remaining_time -= assign * time_per[i]
+            any_assigned = True
+            if rem[i] <= 0:
+                complete(i)
+            else:
+                deferred.append(i)
+
+        # 最低1問ルール
+        if not any_assigned and remaining_time > 0:
+            candidates = deferred + [k[-1] for k in ready]
+            if candidates:
+                i = min(candidates, key=lambda j: (priority[j], -rem[j], j))
+                rem[i] -= 1
+                if rem[i] <= 0:
+                    complete(i)
+
+
+def _unassigned(time_per, state):
+    items = sum(state)
+    hours = first_study_plan.quanta_to_hours(sum(r * tp for tp, r in zip(time_per, state) if tp > 0))
+    return items, hours
+
+
+class SensitivityAnalyzer:
+    """基準割当の日別スナップショットを持ち、摂動を差分的に再計算する。"""
+
+    def __init__(self, day_capacities, tasks):
+        self.day_capacities = list(day_capacities)
+        self.tasks = [dict(t) for t in tasks]
+        self.stepper = _DayStepper(self.tasks)
+        rem = [int(t.get("remaining", 0)) for t in self.tasks]
+        # snapshots[d] = Day d+1 開始時点の残数。最後の要素は全日程終了後
+        self.snapshots = [tuple(rem)]
+        for cap in self.day_capacities:
+            self.stepper.step(cap, rem)
+            self.snapshots.append(tuple(rem))
+        self.baseline = _unassigned(self.stepper.time_per, self.snapshots[-1])
+
+    def _ready_day(self, idx):
+        # タスク idx が初めて割当候補になる日（残数があり、その日のうちに前提がすべて完了する日）
+        pre = self.stepper.prereqs[idx]
+        for day in range(len(self.day_capacities)):
+            if self.snapshots[day][idx] <= 0:
+                return None
+            if all(self.snapshots[day + 1][p] <= 0 for p in pre):
+                return day
+        return None
+
+    def _resume(self, start_day, stepper, caps):
+        rem = list(self.snapshots[start_day])
+        same_rules = stepper is self.stepper
+        for day in range(start_day, len(caps)):
+            stepper.step(caps[day], rem)
+            state = tuple(rem)
+            if same_rules and state == self.snapshots[day + 1]:
+                # 基準と同じ状態に戻ったので以降の結果も基準と同じ
+                return self.snapshots[-1]
+            if not any(state):
+                return state
+        return tuple(rem)
+
+    def _gain(self, final_state):
+        # 未割当時間は元の難易度で数えて比較する
+        items, hours = _unassigned(self.stepper.time_per, final_state)
+        return self.baseline[0] - items, self.baseline[1] - hours
+
+    def day_gain(self, day, extra_hours=1.0):
+        caps = list(self.day_capacities)
+        caps[day] += extra_hours
+        return self._gain(self._resume(day, self.stepper, caps))
+
+    def task_gain(self, idx, difficulty_factor=0.9):
+        start = self._ready_day(idx)
+        if start is None:
+            return 0, 0.0
+        t = self.tasks[idx]
+        time_per = first_study_plan.task_quanta(dict(t, difficulty=t.get("difficulty", 1.0) * difficulty_factor))
+        return self._gain(self._resume(start, self.stepper.with_time_per(idx, time_per), self.day_capacities))
+
+    def report(self, extra_hours=1.0, difficulty_factor=0.9):
+        days = [(d + 1,) + self.day_gain(d, extra_hours) for d in range(len(self.day_capacities))]
+        tasks = [(t["name"],) + self.task_gain(i, difficulty_factor) for i, t in enumerate(self.tasks)]
+        days.sort(key=lambda x: (-x[1], -x[2], x[0]))
+        tasks.sort(key=lambda x: (-x[1], -x[2], x[0]))
+        return {"baseline_items": self.baseline[0], "baseline_hours": self.baseline[1], "days": days, "tasks": tasks}
+
+
+def sensitivity_report(day_capacities, tasks, extra_hours=1.0, difficulty_factor=0.9):
+    """未割当を減らす効果の大きい日・タスクの一覧を返す（tasks は変更しない）。"""
+    return SensitivityAnalyzer(day_capacities, tasks).report(extra_hours, difficulty_factor)
+
+
+def format_report(report, extra_hours=1.0, difficulty_factor=0.9, limit=10):
+    lines = [f"基準の未割当: {report['baseline_items']} 問（{report['baseline_hours']:.2f} 時間）"]
+    if report['baseline_items'] == 0:
+        lines.append("すべて割り当て済みのため、追加の余地による改善はありません。")
+        return '\n'.join(lines)
+    lines.append('')
+    lines.append(f"容量を +{extra_hours:g} 時間した場合（効果の大きい順）:")
+    for day, items, hours in report['days'][:limit]:
+        lines.append(f"  Day {day}: 未割当 -{items} 問（-{hours:.2f} 時間）")
+    lines.append('')
+    lines.append(f"難易度を ×{difficulty_factor:g} にした場合（効果の大きい順）:")
+    for name, items, hours in report['tasks'][:limit]:
+        lines.append(f"  {name}: 未割当 -{items} 問（-{hours:.2f} 時間）")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プリセットのプランに対する感度分析')
+    parser.add_argument('--extra-hours', type=float, default=1.0, help='日ごとに追加する時間')
+    parser.add_argument('--difficulty-factor', type=float, default=0.9, help='タスクの難易度に掛ける係数')
+    args = parser.parse_args(argv)
+    _, day_capacities, _, tasks = first_study_plan.collect_inputs()
+    report = sensitivity_report(day_capacities, tasks, args.extra_hours, args.difficulty_factor)
+    print(format_report(report, args.extra_hours, args.difficulty_factor))
+
+
+if __name__ == '__main__':
+    main()
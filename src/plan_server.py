@@ -0,0 +1,319 @@
+"""プラン生成・再計画・実現可能性チェックをローカル HTTP で提供する常駐サービス
+
+使い方:
+    python src/plan_server.py                 # http://127.0.0.1:8765
+    python src/plan_server.py --port 9000 --workers 4
+    python src/plan_server.py --unix /tmp/plan.sock   # Unix ソケット（対応 OS のみ）
+
+エンドポイント（すべて JSON、外部ネットワークには公開しません）:
+    GET  /health
+    POST /generate     {"day_capacities": [...], "tasks": [...], "time_per_item": 0.5, "subject": "数学"}
+    POST /replan       {"plan_rows": [...] または "csv": "plans/ からの相対パス", "today": 3,
+                        "done_today": {"タスク": 2}, "next_caps": [...], "day_capacities": [...], "subject": "数学"}
+    POST /feasibility  {"day_capacities": [...], "tasks": [...], "time_per_item": 0.5, "subject": "数学"}
+"subject"（任意）は較正表（difficulty_calibration.py）を引く科目です。csv を指定した再計画ではプランの科目を使い、
+科目が分からなければ較正表は使いません。
+
+ワーカープロセスは起動時に first_study_plan / done_task を一度だけ読み込み（ウォーム状態）、
+同一内容の同時リクエストは 1 回の計算にまとめ、小さなリクエストは短い時間窓でまとめて
+1 回のプロセス間呼び出しで処理します。
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANS_DIR = os.path.abspath(os.path.join(SRC_DIR, '..', 'plans'))
+
+# まとめ処理の設定: 窓（秒）、1バッチの最大件数、「小さい」とみなす タスク数×日数 の上限
+BATCH_WINDOW = 0.005
+BATCH_MAX = 32
+SMALL_PROBLEM = 20000
+
+# --- ワーカープロセス側 ---
+_first_mod = None
+_done_mod = None
+
+
+def _warm():
+    # プロセスプールの initializer。モジュールの読み込みとプリセット評価をここで一度だけ行う
+    global _first_mod, _done_mod
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+    import first_study_plan
+    import done_task
+    _first_mod = first_study_plan
+    _done_mod = done_task
+
+
+def _normalize_tasks(raw_tasks, time_per_item, subject=None):
+    tasks = []
+    for t in raw_tasks:
+        total = int(t.get("remaining", t.get("total", 0)))
+        tasks.append({
+            "name": str(t["name"]),
+            "remaining": total,
+            "total": total,
+            "time_per_item": float(t.get("time_per_item", time_per_item)),
+            "difficulty": float(t.get("difficulty", 1.0)),
+            "priority": int(t.get("priority", 99)),
+            "after": list(t.get("after", [])),
+        })
+    # 較正表があれば、表にある (科目, タスク) は実績から求めた1問あたり時間で計画する
+    if subject is not None:
+        import difficulty_calibration
+        difficulty_calibration.apply_to_tasks(tasks, subject)
+    return tasks
+
+
+def _generate(payload):
+    caps = [float(x) for x in payload["day_capacities"]]
+    tasks = _normalize_tasks(payload["tasks"], float(payload.get("time_per_item", 0.0)), payload.get("subject"))
+    total_needed = _first_mod.compute_total_time(tasks)
+    plan = _first_mod.allocate_by_priority(caps, tasks)
+    return {
+        "plan": plan,
+        "total_available": sum(caps),
+        "total_needed": total_needed,
+        "unassigned": {t["name"]: t["remaining"] for t in tasks if t["remaining"] > 0},
+    }
+
+
+def _plan_csv_path(path):
+    """csv に指定されたパスを plans/ の中の実際のパスにする。plans/ の外・隠しフォルダーを指す場合は ValueError。"""
+    plans_dir = os.path.realpath(PLANS_DIR)
+    real = os.path.realpath(os.path.join(plans_dir, str(path)))
+    try:
+        rel = os.path.relpath(real, plans_dir)
+    except ValueError:
+        # Windows で別ドライブの場合
+        rel = os.pardir
+    parts = rel.split(os.sep)
+    if rel == os.curdir or parts[0] == os.pardir or any(part.startswith('.') for part in parts):
+        raise ValueError(f"plans/ の中のプランを指定してください: {path}")
+    return real
+
+
+def _replan(payload):
+    subject = payload.get("subject")
+    if "plan_rows" in payload:
+        rows = [{"day": int(r["day"]), "name": str(r.get("name", "")), "assigned": int(r.get("assigned", 0) or 0),
+                 "time": float(r.get("time", 0.0) or 0.0)} for r in payload["plan_rows"]]
+        caps = [float(x) for x in payload.get("day_capacities", [])]
+    elif "csv" in payload:
+        data = _done_mod.load_plan_csv(_plan_csv_path(payload["csv"]))
+        rows = data["plan_rows"]
+        if subject is None:
+            subject = data["meta"].get("subject", "")
+        caps = [float(x) for x in payload.get("day_capacities", data["day_capacities"])]
+    else:
+        raise ValueError("plan_rows または csv を指定してください")
+    next_caps = payload.get("next_caps")
+    if next_caps is not None:
+        next_caps = [float(x) for x in next_caps]
+    done_today = {str(k): int(v) for k, v in payload.get("done_today", {}).items()}
+    return _done_mod.replan_plan_rows(rows, caps, int(payload.get("today", 1)), done_today, next_caps,
+                                      subject=subject)
+
+
+def _feasibility(payload):
+    caps = [float(x) for x in payload["day_capacities"]]
+    tasks = _normalize_tasks(payload["tasks"], float(payload.get("time_per_item", 0.0)), payload.get("subject"))
+    return _done_mod.check_feasibility(caps, tasks)
+
+
+HANDLERS = {
+    "/generate": _generate,
+    "/replan": _replan,
+    "/feasibility": _feasibility,
+}
+
+
+def _run_batch(items):
+    # items: [(endpoint, payload)] -> [(ok, result or エラーメッセージ)]
+    results = []
+    for endpoint, payload in items:
+        try:
+            results.append((True, HANDLERS[endpoint](payload)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+# --- サーバープロセス側 ---
+def _problem_size(payload):
+    try:
+        days = len(payload.get("day_capacities") or payload.get("next_caps") or []) or 1
+        tasks = len(payload.get("tasks") or payload.get("plan_rows") or []) or 1
+    except (AttributeError, TypeError):
+        # 形式の誤りはワーカーでエラーとして返すので、ここでは小さいとみなす
+        return 0
+    return days * tasks
+
+
+class Dispatcher:
+    """同一リクエストの合流と、小さなリクエストのまとめ送りを行う。"""
+
+    def __init__(self, workers=None):
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.batcher = threading.Thread(target=self._batch_loop, daemon=True)
+        self.batcher.start()
+
+    def submit(self, endpoint, payload):
+        key = hashlib.sha256((endpoint + json.dumps(payload, sort_keys=True, ensure_ascii=False)).encode('utf-8')).hexdigest()
+        # 合流先に登録する前に大きさを求める（ここで失敗しても待ち続ける Future を残さない）
+        small = _problem_size(payload) <= SMALL_PROBLEM
+        with self.lock:
+            fut = self.inflight.get(key)
+            if fut is not None:
+                return fut
+            fut = Future()
+            self.inflight[key] = fut
+        fut.add_done_callback(lambda _f, k=key: self._forget(k))
+
+        try:
+            if small:
+                self.pending.put((endpoint, payload, fut))
+            else:
+                self._dispatch([(endpoint, payload, fut)])
+        except Exception as e:
+            # 登録した Future は必ず完了させる（完了時に inflight からも外れる）
+            if not fut.done():
+                fut.set_result((False, f"{type(e).__name__}: {e}"))
+        return fut
+
+    def _forget(self, key):
+        with self.lock:
+            self.inflight.pop(key, None)
+
+    def _batch_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            try:
+                while len(batch) < BATCH_MAX:
+                    batch.append(self.pending.get(timeout=BATCH_WINDOW))
+            except queue.Empty:
+                pass
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        try:
+            pool_fut = self.pool.submit(_run_batch, [(e, p) for e, p, _ in batch])
+        except Exception as e:
+            for _, _, fut in batch:
+                fut.set_result((False, f"{type(e).__name__}: {e}"))
+            return
+
+        def done(pf):
+            try:
+                results = pf.result()
+            except Exception as e:
+                results = [(False, f"{type(e).__name__}: {e}")] * len(batch)
+            for (_, _, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+        pool_fut.add_done_callback(done)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class PlanRequestHandler(BaseHTTPRequestHandler):
+    dispatcher = None
+    quiet = True
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in HANDLERS:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_json(400, {"error": f"JSON を解釈できません: {e}"})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "リクエストの本文は JSON のオブジェクトにしてください"})
+            return
+        ok, result = self.dispatcher.submit(self.path, payload).result()
+        if ok:
+            self._send_json(200, result)
+        else:
+            self._send_json(400, {"error": result})
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            sys.stderr.write("%s\n" % (format % args))
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    # 同時接続が多いフロントエンドからの呼び出しに備えて待ち行列を広げる
+    request_queue_size = 128
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler はクライアントアドレスを (host, port) として扱う
+        return request, ('unix', 0)
+
+
+def make_server(host='127.0.0.1', port=8765, unix_path=None, workers=None, quiet=True):
+    handler = type('Handler', (PlanRequestHandler,), {"dispatcher": Dispatcher(workers), "quiet": quiet})
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        return UnixHTTPServer(unix_path, handler)
+    return LocalHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='学習プランのローカル計画サービス')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='Unix ソケットのパス（指定時は TCP を使わない）')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数（既定: CPU 数）')
+    parser.add_argument('--verbose', action='store_true', help='アクセスログを表示する')
+    args = parser.parse_args(argv)
+
+    # 外部公開を避けるため TCP は常に 127.0.0.1 にのみバインドする
+    server = make_server(port=args.port, unix_path=args.unix, workers=args.workers, quiet=not args.verbose)
+    where = args.unix if args.unix else f"http://127.0.0.1:{args.port}"
+    print(f"計画サービスを起動しました: {where}（Ctrl+C で終了）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.dispatcher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
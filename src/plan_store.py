@@ -0,0 +1,174 @@
+"""plans/ への同時書き込みを安全にする保存層（アトミックな置き換え・プランごとのロック・版の確認）
+
+GUI・CLI・バッチ・監視モード（watch_actuals.py）が同じ plans/ に同時に書いても壊れないように、
+プラン CSV の保存はすべてここを通します。
+ - 書き込みは一時ファイルに書いてから置き換える（plan_archive._write_atomic）ので、読み手が書きかけを見ることはありません
+ - 書き込みの間はプランごとのロック（同じフォルダーの .<ファイル名>.lock）を取ります。
+   fcntl（Linux / macOS）、msvcrt（Windows）、どちらも無ければロックファイルの排他作成を使います。
+   ロックファイルは解放時に消します（Windows では開いたままのファイルを消せないので、空のファイルが残ります）
+ - 版（version）はファイルの中身のハッシュです。読み込んだときの版を expected に渡して保存すると、
+   その間に他の誰かが書き換えていた場合は上書きせずに PlanConflict を出します（楽観的な版の確認）
+ - update_plan は「読む → 作り直す → 版を確認して書く」を、競合したら読み直してやり直します
+
+ロックは書き込みの瞬間だけ取るので、再計画の計算そのものは並列に進められます。
+"""
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+import plan_archive
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# 版の確認をしない（無条件に上書きする）ことを表す値。expected=None は「まだ存在しないこと」
+ANY = object()
+LOCK_TIMEOUT = 10.0
+LOCK_POLL = 0.01
+# ロックファイル方式で、これより古いロックファイルは落ちたプロセスの残りとみなして消す
+STALE_LOCK_SECONDS = 60.0
+# ロックファイルの権限（中身は空で、実行ビットは要らない）
+LOCK_MODE = 0o644
+UPDATE_RETRIES = 5
+
+
+class PlanConflict(RuntimeError):
+    """読み込んでから保存するまでの間に、プランが他で書き換えられていた。"""
+
+    def __init__(self, path, expected, actual):
+        super().__init__(f"{path} は読み込んだ後に他で更新されています")
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+
+def lock_path(path):
+    d, name = os.path.split(os.path.abspath(path))
+    return os.path.join(d, f".{name}.lock")
+
+
+def _try_lock(fd):
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _same_file(fd, path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    fst = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+
+@contextmanager
+def plan_lock(path, timeout=LOCK_TIMEOUT):
+    """path のプランのロックを取る。timeout 秒取れなければ TimeoutError。"""
+    lp = lock_path(path)
+    os.makedirs(os.path.dirname(lp), exist_ok=True)
+    give_up = time.monotonic() + timeout
+    if fcntl or msvcrt:
+        while True:
+            fd = os.open(lp, os.O_RDWR | os.O_CREAT, LOCK_MODE)
+            while not _try_lock(fd):
+                if time.monotonic() >= give_up:
+                    os.close(fd)
+                    raise TimeoutError(f"{path} のロックを取得できませんでした")
+                time.sleep(LOCK_POLL)
+            # 待っている間に前の持ち主がロックファイルを消していたら、新しいファイルで取り直す
+            if not fcntl or _same_file(fd, lp):
+                break
+            _unlock(fd)
+            os.close(fd)
+        try:
+            yield
+        finally:
+            if fcntl:
+                # ロックを持ったまま消す（後から来た人は上の確認で作り直したファイルを使う）
+                try:
+                    os.remove(lp)
+                except OSError:
+                    pass
+            _unlock(fd)
+            os.close(fd)
+        return
+    # ロックの仕組みが無い環境: ロックファイルを排他的に作れた人だけが書く
+    while True:
+        try:
+            fd = os.open(lp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, LOCK_MODE)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lp) > STALE_LOCK_SECONDS:
+                    os.remove(lp)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() >= give_up:
+                raise TimeoutError(f"{path} のロックを取得できませんでした")
+            time.sleep(LOCK_POLL)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        os.remove(lp)
+
+
+def read_version(path):
+    """ファイルの中身の版（ハッシュ）。ファイルが無ければ None。"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except FileNotFoundError:
+        return None
+
+
+def write_rows(path, rows, expected=ANY, plans_dir=plan_archive.PLANS_DIR):
+    """プラン CSV の行を、ロックを取り版を確認してから保存する。戻り値は保存後の版。"""
+    rows = list(rows)
+    with plan_lock(path):
+        if expected is not ANY:
+            current = read_version(path)
+            if current != expected:
+                raise PlanConflict(path, expected, current)
+        plan_archive.write_rows(path, rows, plans_dir)
+        return read_version(path)
+
+
+def update_plan(path, build_rows, retries=UPDATE_RETRIES, plans_dir=plan_archive.PLANS_DIR):
+    """build_rows(path) でプランを作り直して保存する。途中で他に書き換えられたら読み直してやり直す。
+
+    build_rows が None を返したら何も書かない。戻り値は保存後の版（書かなければ None）。
+    """
+    for attempt in range(retries + 1):
+        version = read_version(path)
+        rows = build_rows(path)
+        if rows is None:
+            return None
+        try:
+            return write_rows(path, rows, expected=version, plans_dir=plans_dir)
+        except PlanConflict:
+            if attempt == retries:
+                raise
+    return None
@@ -0,0 +1,139 @@
+"""終えた問題の復習（間隔反復）を日々の割当に組み込むスケジューラ
+
+使い方:
+    python src/review_schedule.py            # first_study_plan.py のプリセットで復習込みのプランを表示
+    （first_study_plan.py の REVIEW_INTERVALS_PRESET を設定すると、通常の実行でも復習が入ります）
+
+ - ある日に初めて割り当てた問題は、REVIEW_INTERVALS（既定: 1, 3, 7 日）の間隔で復習を予定します。
+   1回目の復習はその日から 1 日後、2回目は1回目の復習をした日から 3 日後…と続きます。
+ - 各日はまず期限の来た復習に容量の REVIEW_SHARE（既定 5 割）までを使い、残りを通常の割当
+   （allocate_by_priority と同じ規則）に使います。復習が少ない日はその分を新しい問題に回します。
+ - 入りきらなかった復習は翌日に繰り越します。テスト日（期限）以降に来る復習は予定しません。
+ - 復習の所要時間は 1問時間 × 難易度 × REVIEW_COST（既定 0.3）です。
+ - 出力は通常のプランと同じ形で、復習は「タスク名 (復習)」として並びます（CSV もそのまま保存できます）。
+   再計画（done_task / GUI / 監視モード）・難易度の較正・集計は is_review でこの行を見分け、通常のタスクとしては扱いません。
+
+予定中の復習は日付ごとのバケツを並べたタイミングホイールに入れるため、
+追加・取り出しは1件あたり O(1) で、数十万件の復習が長期間に渡って溜まっても遅くなりません。
+"""
+from collections import deque
+
+import first_study_plan
+from first_study_plan import deadline_days
+
+REVIEW_INTERVALS = (1, 3, 7)
+REVIEW_COST = 0.3
+REVIEW_SHARE = 0.5
+REVIEW_SUFFIX = ' (復習)'
+WHEEL_SLOTS = 64
+
+
+def is_review(name):
+    """プランのタスク名が復習の行（「タスク名 (復習)」）かどうか。"""
+    return str(name).strip().endswith(REVIEW_SUFFIX)
+
+
+class TimingWheel:
+    """日付 -> 予定項目 の待ち行列（タイミングホイール）。
+
+    現在の周回（WHEEL_SLOTS 日ごとの区切り）に入る項目は 日付 % スロット数 のバケツに直接入れ、
+    それより先の項目は周回番号ごとのあふれ置き場に入れておき、ホイールがその周回に入ったときにまとめてバケツへ移す
+    （各項目が移されるのは1回だけなので、追加・取り出しとも1件あたり O(1)）。
+    """
+
+    def __init__(self, slots=WHEEL_SLOTS):
+        self.slots = [deque() for _ in range(slots)]
+        self.size = slots
+        self.now = 0
+        self.overflow = {}
+        self.count = 0
+
+    def schedule(self, day, item):
+        day = max(day, self.now)
+        if day // self.size == self.now // self.size:
+            self.slots[day % self.size].append((day, item))
+        else:
+            self.overflow.setdefault(day // self.size, []).append((day, item))
+        self.count += 1
+
+    def advance(self, day):
+        """現在日を day に進める（周回が変わったらあふれ置き場から移す）。"""
+        while self.now < day:
+            self.now += 1
+            if self.now % self.size == 0:
+                for d, item in self.overflow.pop(self.now // self.size, ()):
+                    self.slots[d % self.size].append((d, item))
+
+    def pop_due(self):
+        """現在日の項目をすべて取り出す。"""
+        bucket = self.slots[self.now % self.size]
+        items = [item for _, item in bucket]
+        self.count -= len(items)
+        bucket.clear()
+        return items
+
+
+def allocate_with_reviews(day_capacities, tasks, intervals=REVIEW_INTERVALS, review_cost=REVIEW_COST,
+                          review_share=REVIEW_SHARE, deadline=None):
+    """復習込みの割当。tasks の remaining は allocate_by_priority と同じく減らす。
+
+    deadline はテスト日までの日数（その日数より後の復習は予定しない）。既定は全日程。
+    """
+    days = len(day_capacities)
+    deadline = days if deadline is None else deadline
+    review_quanta = [max(1, round(first_study_plan.task_quanta(t) * review_cost)) for t in tasks]
+    index = {t['name']: i for i, t in enumerate(tasks)}
+    wheel = TimingWheel()
+    carry = []
+    plan = []
+
+    def enqueue(day, idx, count, stage):
+        if stage < len(intervals) and day + intervals[stage] < deadline:
+            wheel.schedule(day + intervals[stage], (idx, count, stage))
+
+    for day in range(days):
+        wheel.advance(day)
+        budget = first_study_plan.to_quanta(day_capacities[day])
+        review_budget = int(budget * review_share)
+        day_plan = []
+        reviewed = {}
+        # 前日からの繰り越しを先に、次に今日が期限の復習を処理する
+        due = carry + wheel.pop_due()
+        carry = []
+        for idx, count, stage in due:
+            fit = min(count, review_budget // review_quanta[idx])
+            if fit:
+                review_budget -= fit * review_quanta[idx]
+                reviewed[idx] = reviewed.get(idx, 0) + fit
+                enqueue(day, idx, fit, stage + 1)
+            if fit < count and day + 1 < deadline:
+                # 入りきらない分は翌日に繰り越す（期限を過ぎるものは予定しない）
+                carry.append((idx, count - fit, stage))
+        used = 0
+        for idx, count in reviewed.items():
+            q = count * review_quanta[idx]
+            used += q
+            day_plan.append({'name': tasks[idx]['name'] + REVIEW_SUFFIX, 'assigned': count,
+                             'time': first_study_plan.quanta_to_hours(q)})
+        # 残りの容量で新しい問題を割り当てる（規則は allocate_by_priority と同じ）
+        if any(t.get('remaining', 0) > 0 for t in tasks):
+            new_items = first_study_plan.allocate_by_priority(
+                [first_study_plan.quanta_to_hours(budget - used)], tasks)[0]
+            for it in new_items:
+                enqueue(day, index[it['name']], it['assigned'], 0)
+            day_plan = new_items + day_plan
+        plan.append(day_plan)
+    return plan
+
+
+def main():
+    subject, day_capacities, total_available, tasks = first_study_plan.collect_inputs()
+    total_needed = first_study_plan.compute_total_time(tasks)
+    deadline = deadline_days(len(day_capacities), first_study_plan.START_DATE_PRESET, first_study_plan.TEST_DATE_PRESET)
+    intervals = getattr(first_study_plan, 'REVIEW_INTERVALS_PRESET', None) or REVIEW_INTERVALS
+    plan = allocate_with_reviews(day_capacities, tasks, intervals, deadline=deadline)
+    first_study_plan.print_plan(subject, total_available, day_capacities, tasks, total_needed, plan)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""1日の中の「空いている時間帯」に合わせてタスクを配置するスケジューラ
+
+使い方:
+    python src/time_slots.py        # first_study_plan.py のタスクと下の DAY_WINDOWS_PRESET で配置して表示・保存
+
+日ごとの利用可能時間（day_capacities）の代わりに、「07:00-08:00,20:00-22:00」のような時間帯を日ごとに
+指定できます（指定しない日は DEFAULT_DAY_START から day_capacities の時間だけ空いているとみなします）。
+1問は時間帯をまたいで分割できないので、タスクは「同じタスクの連続した問題のかたまり（ブロック）」として
+空き時間の早い順（first-fit）に置きます。タスクを選ぶ順序（優先度 → 残数、前提タスク）は
+allocate_by_priority と同じです。ただし時間帯に物理的に入らない問題は入れません（最低1問ルールはありません）。
+
+各日の空き状況は 1日を TIME_QUANTUM_MINUTES 単位に区切った区間木（各ノードが区間内の最長の空き・
+先頭からの空き・末尾までの空きを持つ）で管理するため、ブロックの配置・取り消し（再配置）は1件あたり O(log n) です。
+結果は従来の Day/Task/Assigned/Time 形式のプランにまとめ直せます（collapse_to_plan）。
+"""
+import heapq
+
+import first_study_plan
+
+# --- プリセット: 日ごとの時間帯（None の日は DEFAULT_DAY_START から day_capacities の時間） ---
+DAY_WINDOWS_PRESET = [
+    "07:00-08:00,20:00-21:00",
+    "07:00-08:00,20:00-22:00",
+    None,
+    "20:00-23:00",
+    "20:00-23:00",
+    "09:00-12:00,13:00-18:00",
+    "09:00-12:00,13:00-18:00",
+]
+DEFAULT_DAY_START = "18:00"
+# ------------------------------------------------------------------
+
+
+def _quantum():
+    return first_study_plan.TIME_QUANTUM_MINUTES
+
+
+def parse_clock(text):
+    h, m = text.strip().split(':')
+    return (int(h) * 60 + int(m)) // _quantum()
+
+
+def format_clock(q):
+    minutes = q * _quantum()
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_windows(text):
+    """「07:00-08:00,20:00-22:00」を [(開始, 終了)]（量子単位）にする。"""
+    windows = []
+    for part in str(text).split(','):
+        if not part.strip():
+            continue
+        start, end = part.split('-')
+        s, e = parse_clock(start), parse_clock(end)
+        if e <= s:
+            raise ValueError(f"時間帯の終わりが始まりより前です: {part.strip()}")
+        windows.append((s, e))
+    return windows
+
+
+class DaySlots:
+    """1日分の空き時間の区間木。葉は TIME_QUANTUM_MINUTES 単位の時刻。"""
+
+    def __init__(self, windows):
+        self.n = 24 * 60 // _quantum()
+        size = 1
+        while size < self.n:
+            size *= 2
+        self.size = size
+        # best: 区間内の最長の空き, pref: 先頭からの空き, suff: 末尾までの空き, length: 区間の長さ
+        self.best = [0] * (2 * size)
+        self.pref = [0] * (2 * size)
+        self.suff = [0] * (2 * size)
+        self.length = [0] * (2 * size)
+        self.lazy = [None] * (2 * size)
+        for i in range(size):
+            self.length[size + i] = 1
+        for i in range(size - 1, 0, -1):
+            self.length[i] = self.length[2 * i] + self.length[2 * i + 1]
+        for s, e in windows:
+            self._assign(1, 0, size, max(0, s), min(self.n, e), True)
+
+    # -- 区間木の内部処理
+    def _set(self, node, free):
+        v = self.length[node] if free else 0
+        self.best[node] = self.pref[node] = self.suff[node] = v
+        self.lazy[node] = free
+
+    def _push(self, node):
+        if self.lazy[node] is not None and node < self.size:
+            self._set(2 * node, self.lazy[node])
+            self._set(2 * node + 1, self.lazy[node])
+            self.lazy[node] = None
+
+    def _pull(self, node):
+        l, r = 2 * node, 2 * node + 1
+        self.pref[node] = self.pref[l] if self.pref[l] < self.length[l] else self.length[l] + self.pref[r]
+        self.suff[node] = self.suff[r] if self.suff[r] < self.length[r] else self.length[r] + self.suff[l]
+        self.best[node] = max(self.best[l], self.best[r], self.suff[l] + self.pref[r])
+
+    def _assign(self, node, lo, hi, s, e, free):
+        if e <= lo or hi <= s:
+            return
+        if s <= lo and hi <= e:
+            self._set(node, free)
+            return
+        self._push(node)
+        mid = (lo + hi) // 2
+        self._assign(2 * node, lo, mid, s, e, free)
+        self._assign(2 * node + 1, mid, hi, s, e, free)
+        self._pull(node)
+
+    # -- 公開 API
+    def free_total(self):
+        return self._count(1, 0, self.size)
+
+    def _count(self, node, lo, hi):
+        if self.best[node] == hi - lo:
+            return hi - lo
+        if self.best[node] == 0:
+            return 0
+        self._push(node)
+        mid = (lo + hi) // 2
+        return self._count(2 * node, lo, mid) + self._count(2 * node + 1, mid, hi)
+
+    def first_fit(self, length):
+        """長さ length 以上の空きの最も早い開始位置と、その空きの長さ。無ければ (None, 0)。"""
+        if length <= 0 or self.best[1] < length:
+            return None, 0
+        node, lo, hi = 1, 0, self.size
+        while node < self.size:
+            self._push(node)
+            mid = (lo + hi) // 2
+            l, r = 2 * node, 2 * node + 1
+            if self.best[l] >= length:
+                node, hi = l, mid
+            elif self.suff[l] + self.pref[r] >= length:
+                start = mid - self.suff[l]
+                return start, self._run_from(start)
+            else:
+                node, lo = r, mid
+        return lo, self._run_from(lo)
+
+    def _run_from(self, pos):
+        # pos から始まる空きの長さ（pos は空きの先頭）
+        end = self._first_busy(1, 0, self.size, pos)
+        return (self.n if end is None else min(end, self.n)) - pos
+
+    def _first_busy(self, node, lo, hi, pos):
+        # pos 以降で最初の埋まっている位置
+        if hi <= pos or self.best[node] == hi - lo:
+            return None
+        if node >= self.size:
+            return lo
+        self._push(node)
+        mid = (lo + hi) // 2
+        found = self._first_busy(2 * node, lo, mid, pos)
+        return found if found is not None else self._first_busy(2 * node + 1, mid, hi, pos)
+
+    def occupy(self, start, end):
+        self._assign(1, 0, self.size, start, end, False)
+
+    def release(self, start, end):
+        self._assign(1, 0, self.size, start, end, True)
+
+
+def day_windows_for(day_capacities, day_windows=None):
+    """日ごとの時間帯の一覧（量子単位）。時間帯の指定が無い日は既定の開始時刻から容量分。"""
+    default_start = parse_clock(DEFAULT_DAY_START)
+    out = []
+    for day, cap in enumerate(day_capacities):
+        text = day_windows[day] if day_windows and day < len(day_windows) else None
+        if text:
+            out.append(parse_windows(text))
+        else:
+            q = first_study_plan.to_quanta(cap)
+            out.append([(default_start, min(default_start + q, 24 * 60 // _quantum()))] if q > 0 else [])
+    return out
+
+
+class SlotPlanner:
+    """時間帯へのブロック配置。配置済みのブロックは remove_block で取り消して置き直せる。"""
+
+    def __init__(self, windows_by_day, tasks):
+        self.days = [DaySlots(w) for w in windows_by_day]
+        self.tasks = tasks
+        self.blocks = [[] for _ in windows_by_day]
+        self.index = {t['name']: i for i, t in enumerate(tasks)}
+        # 前提タスクの検証（名前の重複・存在しない前提・循環）は allocate_by_priority と同じ
+        self.dependents, self.pending = first_study_plan._build_dependency_graph(tasks)
+
+    def _key(self, idx):
+        t = self.tasks[idx]
+        return (t.get('priority', 99), -int(t.get('remaining', 0)), idx)
+
+    def fill_day(self, day):
+        """その日の空き時間に、優先度順にタスクのブロックを置けるだけ置く。"""
+        slots = self.days[day]
+        ready = [self._key(i) for i, t in enumerate(self.tasks)
+                 if self.pending[i] == 0 and t.get('remaining', 0) > 0 and first_study_plan.task_quanta(t) > 0]
+        heapq.heapify(ready)
+        while ready:
+            idx = heapq.heappop(ready)[-1]
+            t = self.tasks[idx]
+            tq = first_study_plan.task_quanta(t)
+            # 入る限り早い空きから詰める（1つの空きに入る分を1ブロックにする）
+            while t['remaining'] > 0:
+                start, run = slots.first_fit(tq)
+                if start is None:
+                    break
+                count = min(t['remaining'], run // tq)
+                self._place(day, idx, start, count)
+            if t['remaining'] <= 0:
+                for j in self.dependents[idx]:
+                    self.pending[j] -= 1
+                    if self.pending[j] == 0 and self.tasks[j].get('remaining', 0) > 0:
+                        heapq.heappush(ready, self._key(j))
+
+    def _place(self, day, idx, start, count):
+        t = self.tasks[idx]
+        end = start + count * first_study_plan.task_quanta(t)
+        self.days[day].occupy(start, end)
+        t['remaining'] -= count
+        self.blocks[day].append({'name': t['name'], 'start': start, 'end': end, 'assigned': count})
+
+    def remove_block(self, day, block):
+        """配置済みのブロックを取り消し、空き時間と残数を戻す（前提関係の解放は戻さない）。"""
+        self.blocks[day].remove(block)
+        self.days[day].release(block['start'], block['end'])
+        idx = self.index[block['name']]
+        if self.tasks[idx]['remaining'] <= 0:
+            for j in self.dependents[idx]:
+                self.pending[j] += 1
+        self.tasks[idx]['remaining'] += block['assigned']
+
+    def run(self):
+        for day in range(len(self.days)):
+            self.fill_day(day)
+        return self.blocks
+
+
+def schedule_time_slots(day_capacities, tasks, day_windows=None):
+    """時間帯に配置したブロックの一覧（日ごと、開始時刻順）を返す。tasks の remaining は減る。"""
+    planner = SlotPlanner(day_windows_for(day_capacities, day_windows), tasks)
+    return [sorted(day, key=lambda b: b['start']) for day in planner.run()]
+
+
+def collapse_to_plan(blocks_by_day, tasks):
+    """ブロックを従来のプラン（日ごと・タスクごとの問題数と時間）にまとめる。"""
+    quanta = {t['name']: first_study_plan.task_quanta(t) for t in tasks}
+    plan = []
+    for blocks in blocks_by_day:
+        merged = {}
+        for b in blocks:
+            merged[b['name']] = merged.get(b['name'], 0) + b['assigned']
+        plan.append([{'name': name, 'assigned': n, 'time': first_study_plan.quanta_to_hours(n * quanta[name])}
+                     for name, n in merged.items()])
+    return plan
+
+
+def window_capacities(day_capacities, day_windows=None):
+    # 時間帯の合計（時間）。CSV の Day Capacities に使う
+    return [first_study_plan.quanta_to_hours(sum(e - s for s, e in w))
+            for w in day_windows_for(day_capacities, day_windows)]
+
+
+def main():
+    subject, day_capacities, _, tasks = first_study_plan.collect_inputs()
+    total_needed = first_study_plan.compute_total_time(tasks)
+    blocks = schedule_time_slots(day_capacities, tasks, DAY_WINDOWS_PRESET)
+    for day, day_blocks in enumerate(blocks, start=1):
+        print(f"Day {day}:")
+        for b in day_blocks:
+            print(f"  {format_clock(b['start'])}-{format_clock(b['end'])}  {b['name']} を {b['assigned']} 問")
+        print('')
+    caps = window_capacities(day_capacities, DAY_WINDOWS_PRESET)
+    plan = collapse_to_plan(blocks, tasks)
+    first_study_plan.prompt_and_save(subject, caps, plan, tasks, total_needed)
+
+
+if __name__ == '__main__':
+    main()
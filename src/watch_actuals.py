@@ -0,0 +1,281 @@
+"""実績ファイルの置き場（受信箱）を監視して、プランを自動で再計画する常駐コマンド
+
+使い方:
+    python src/watch_actuals.py                      # inbox/ を監視し続ける
+    python src/watch_actuals.py --once               # 今ある実績だけ反映して終了（タスクスケジューラ／cron 向け）
+
+受信箱（既定: plans/ と同じ階層の inbox/）に置く実績ファイルは、1行1件の CSV です（ヘッダーは任意）。
+    plan,day,task,done[,hours]
+    taro/数学.csv,3,教科書問題,5,1.5
+ - plan は plans/ からの相対パス（plans/ の外を指すもの・絶対パスは無視します）、day はその日の Day 番号、
+   done はその日に終えた問題数（同じ plan・day・task の行が複数あれば足し合わせます）
+ - hours（任意）はその日に実際に勉強した時間。再計画には使いませんが、capacity_forecast.py が
+   利用可能時間の見込みに使います
+ファイルは追記していって構いません。ファイルごとに読んだ位置（バイト数）を覚えておき、新しく増えた
+行だけを読みます（書きかけの最後の行は次回に回します）。
+
+同じプランへの実績が続けて届いたときは、最後の到着から --debounce 秒（既定 2 秒）待ってまとめて
+1回だけ再計画します。実績はプラン・Day・タスクごとの累計として受信箱の .watch_state.json に保存し、
+プランに反映済みの累計も一緒に覚えておきます。再計画では、累計と反映済みの差だけを台帳（plan_ledger.py）に
+記録し直し、実績のある最後の Day の翌日以降を done_task.replan_plan_rows（GUI の「完了を適用して再計画」と
+同じ規則）で割り当て直します。
+ - 届いていないタスクは「予定どおり」のまま（あとから別のタスクの実績だけが届いても 0 問扱いにしない）
+ - Day の順番が前後して届いても、過去の日には割り当てず、差は実績のある最後の Day の翌日以降に回す
+ - 同じ累計で何度再計画しても、差が無いのでプランは変わらない
+結果は plan_store.py を通して保存します（一時ファイルからの置き換えなので読み手が書きかけを見ることはなく、
+計算中に GUI などが同じプランを保存していたら読み直してやり直します）。保存の直前に「保存中」の印を状態に
+書いておくので、保存と状態の更新の間で落ちても、再起動時にプランの版を見てどちらまで済んだかを判断し、
+二重に反映しません。
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+
+import done_task
+import first_study_plan
+import plan_store
+from plan_catalog import PLANS_DIR
+from plan_ledger import PlanLedger
+
+INBOX_NAME = 'inbox'
+STATE_NAME = '.watch_state.json'
+POLL_SECONDS = 1.0
+DEBOUNCE_SECONDS = 2.0
+
+
+def _log(msg):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+class ActualsWatcher:
+    """受信箱の新しい行を読み、プランごとにためて、落ち着いたら再計画する。"""
+
+    def __init__(self, plans_dir=PLANS_DIR, inbox=None, debounce=DEBOUNCE_SECONDS):
+        self.plans_dir = os.path.abspath(plans_dir)
+        # plans/ の中に置くとカタログやアーカイブがプランとして数えてしまうので、既定は plans/ の隣
+        self.inbox = os.path.abspath(inbox or os.path.join(os.path.dirname(self.plans_dir), INBOX_NAME))
+        self.state_path = os.path.join(self.inbox, STATE_NAME)
+        self.debounce = debounce
+        self.offsets = {}
+        # プラン -> {Day（文字列）: {タスク: 完了数の累計}}。actuals は届いた分、applied はプランに反映済みの分
+        self.actuals = {}
+        self.applied = {}
+        # プラン -> {'from': 保存前の版, 'actuals': 保存しようとしている累計}（保存中に落ちたときの判断用）
+        self.inflight = {}
+        # プラン -> 最後に実績が届いた時刻
+        self.last_seen = {}
+        os.makedirs(self.inbox, exist_ok=True)
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.offsets = data.get('offsets', {})
+        self.actuals = data.get('actuals', {})
+        self.applied = data.get('applied', {})
+        self.inflight = data.get('inflight', {})
+        # 以前の形式（未反映の実績の一覧）は累計に足し込む
+        for plan, entries in data.get('pending', {}).items():
+            for day, task, done in entries:
+                self._add_actual(plan, day, task, done)
+        # 再起動前の未反映分は、次の確認ですぐに再計画する
+        self.last_seen = {plan: 0.0 for plan in self.actuals if self._has_changes(plan) or plan in self.inflight}
+
+    def _save_state(self):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'offsets': self.offsets, 'actuals': self.actuals, 'applied': self.applied,
+                       'inflight': self.inflight}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+
+    def _add_actual(self, plan, day, task, done):
+        tasks = self.actuals.setdefault(plan, {}).setdefault(str(day), {})
+        tasks[task] = tasks.get(task, 0) + done
+
+    def _has_changes(self, plan):
+        return self.actuals.get(plan, {}) != self.applied.get(plan, {})
+
+    def plan_path(self, plan):
+        """実績の plan 列を plans/ の中の絶対パスにする。plans/ の外・隠しフォルダーを指す場合は None。"""
+        if not plan or os.path.isabs(plan) or os.path.splitdrive(plan)[0]:
+            return None
+        path = os.path.abspath(os.path.join(self.plans_dir, plan))
+        rel = os.path.relpath(path, self.plans_dir)
+        if rel == os.curdir or rel.split(os.sep)[0] == os.pardir:
+            return None
+        if any(part.startswith('.') for part in rel.split(os.sep)):
+            return None
+        return path
+
+    def poll(self):
+        """受信箱の新しい行を読み込む。戻り値は新しく読んだ実績の件数。"""
+        count = 0
+        now = time.monotonic()
+        for entry in os.scandir(self.inbox):
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.csv') or not entry.is_file():
+                continue
+            offset = self.offsets.get(entry.name, 0)
+            size = entry.stat().st_size
+            if size < offset:
+                # 作り直された（短くなった）ファイルは先頭から読み直す
+                offset = 0
+            if size == offset:
+                continue
+            with open(entry.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # 書きかけの最後の行（改行で終わっていない部分）は次回に回す
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                continue
+            for row in csv.reader(io.StringIO(data[:end].decode('utf-8-sig'))):
+                parsed = self._parse(row)
+                if parsed is None:
+                    continue
+                plan, day, task, done = parsed
+                if self.plan_path(plan) is None:
+                    _log(f"plans フォルダーの外を指す実績は無視します: {plan}（{entry.name}）")
+                    continue
+                self._add_actual(plan, day, task, done)
+                self.last_seen[plan] = now
+                count += 1
+            self.offsets[entry.name] = offset + end
+        if count:
+            self._save_state()
+        return count
+
+    @staticmethod
+    def _parse(row):
+        if len(row) < 4:
+            return None
+        try:
+            return row[0].strip().replace('\\', '/'), int(row[1]), row[2].strip(), int(row[3])
+        except ValueError:
+            # ヘッダー行など
+            return None
+
+    def due_plans(self, now=None):
+        now = time.monotonic() if now is None else now
+        return [plan for plan, seen in self.last_seen.items() if now - seen >= self.debounce]
+
+    def replan(self, plan):
+        """plan の実績の累計のうち、まだプランに反映していない差を反映して保存する。"""
+        self.last_seen.pop(plan, None)
+        path = self.plan_path(plan)
+        if path is None or not os.path.isfile(path):
+            _log(f"プランが見つかりません（実績を破棄）: {plan}")
+            for store in (self.actuals, self.applied, self.inflight):
+                store.pop(plan, None)
+            self._save_state()
+            return
+        self._resolve_inflight(plan, path)
+        target = {day: dict(tasks) for day, tasks in self.actuals.get(plan, {}).items()}
+        applied = self.applied.get(plan, {})
+        if target == applied:
+            self._save_state()
+            return
+        changed = sorted({int(day) for day in set(target) | set(applied)
+                          if target.get(day, {}) != applied.get(day, {})})
+
+        def build_rows(path):
+            # 競合してやり直すときは、最新の内容から作り直す
+            data = done_task.load_plan_csv(path)
+            rows, caps = data['plan_rows'], data['day_capacities']
+            ledger = PlanLedger.from_rows(rows, len(caps))
+            # 反映済みの累計を記録してから版に取り込み、今回の累計との差だけを未反映として残す
+            self._record(ledger, plan, applied)
+            ledger.rebase(rows, ledger.days)
+            self._record(ledger, plan, target)
+            # 実績のある最後の Day より前には割り当てない（Day の順番が前後して届いた場合も同じ）
+            today = max(int(day) for day in set(target) | set(applied))
+            done_today = {name: ledger.actual(name, today) if ledger.actual(name, today) is not None
+                          else ledger.planned_count(name, today, today) for name in ledger.tasks()}
+            try:
+                result = done_task.replan_plan_rows(rows, caps, today, done_today, ledger=ledger,
+                                                    subject=data['meta'].get('subject', ''))
+            except ValueError as e:
+                _log(f"{plan} Day {today}: 反映できません（{e}）")
+                return None
+            meta = data['meta']
+            self.inflight[plan] = {'from': data['version'], 'actuals': target}
+            self._save_state()
+            return first_study_plan.plan_csv_rows(meta.get('subject', ''), result['day_capacities'],
+                                                  done_task.plan_from_rows(result['rows'], len(result['day_capacities'])),
+                                                  result['total_needed'],
+                                                  start_date=done_task.day1_start_date(meta.get('start_date'),
+                                                                                       data['first_day']) or None,
+                                                  test_date=meta.get('test_date') or None,
+                                                  rle=meta.get('plan_encoding') == 'rle' or None)
+
+        try:
+            saved = plan_store.update_plan(path, build_rows)
+        except (plan_store.PlanConflict, TimeoutError) as e:
+            # 反映できなかった差は残しておき、次の確認でやり直す
+            _log(f"{plan}: 保存できませんでした（{e}）。あとでやり直します")
+            self.inflight.pop(plan, None)
+            self.last_seen[plan] = time.monotonic()
+            saved = None
+        if saved is not None:
+            self.applied[plan] = target
+            self.inflight.pop(plan, None)
+            _log(f"再計画しました: {plan}（Day {', '.join(str(d) for d in changed)} の実績）")
+        self._save_state()
+
+    def _record(self, ledger, plan, actuals):
+        for day, tasks in actuals.items():
+            for task, done in tasks.items():
+                try:
+                    ledger.set_actual(task, int(day), done)
+                except ValueError as e:
+                    _log(f"{plan} Day {day}: 反映できません（{e}）")
+
+    def _resolve_inflight(self, plan, path):
+        """保存中に落ちていた場合、プランの版が保存前から変わっていれば保存は済んだとみなす。"""
+        pending = self.inflight.pop(plan, None)
+        if pending and plan_store.read_version(path) != pending['from']:
+            self.applied[plan] = pending['actuals']
+
+    def run_once(self, wait=False):
+        """新しい実績を読み、落ち着いたプランを再計画する。wait=True なら待たずに全部反映する。"""
+        self.poll()
+        plans = [p for p in self.actuals if self._has_changes(p) or p in self.inflight] if wait else self.due_plans()
+        for plan in plans:
+            self.replan(plan)
+        return len(plans)
+
+    def run_forever(self, interval=POLL_SECONDS):
+        _log(f"監視を開始します: {self.inbox}")
+        while True:
+            self.run_once()
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='実績ファイルの受信箱を監視してプランを自動で再計画します')
+    parser.add_argument('--dir', default=PLANS_DIR, help='plans フォルダー')
+    parser.add_argument('--inbox', default=None, help=f'受信箱（既定: plans フォルダーの隣の {INBOX_NAME}）')
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help='確認の間隔（秒）')
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, help='最後の実績から再計画までの待ち時間（秒）')
+    parser.add_argument('--once', action='store_true', help='今ある実績をすべて反映して終了する')
+    args = parser.parse_args(argv)
+    watcher = ActualsWatcher(args.dir, args.inbox, args.debounce)
+    if args.once:
+        n = watcher.run_once(wait=True)
+        _log(f"{n} 件のプランを再計画しました")
+        return
+    try:
+        watcher.run_forever(args.interval)
+    except KeyboardInterrupt:
+        _log('監視を終了します')
+
+
+if __name__ == '__main__':
+    main()
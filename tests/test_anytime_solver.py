@@ -0,0 +1,78 @@
+"""anytime_solver.solve を手数で止めたときに結果が入力と種だけで決まることを確かめるテスト"""
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import anytime_solver  # noqa: E402
+import first_study_plan  # noqa: E402
+
+STEPS = 800
+
+
+def random_problem(seed):
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(rng.randint(2, 7)):
+        n = rng.randint(1, 12)
+        tasks.append({'name': f't{i}', 'remaining': n, 'total': n,
+                      'time_per_item': rng.choice([0.25, 0.5, 1.0]), 'difficulty': rng.choice([1.0, 1.3]),
+                      'priority': rng.randint(1, 3)})
+    caps = [rng.choice([0.5, 1, 2, 3]) for _ in range(rng.randint(2, 8))]
+    return caps, tasks
+
+
+class SolveTest(unittest.TestCase):
+    def test_steps_without_budget_is_deterministic(self):
+        for seed in range(8):
+            caps, tasks = random_problem(seed)
+            for engine in ('sweep+local', 'local'):
+                runs = []
+                for _ in range(2):
+                    copied = copy.deepcopy(tasks)
+                    result = anytime_solver.solve(caps, copied, None, engine=engine, seed=seed, steps=STEPS)
+                    runs.append((result, copied))
+                self.assertEqual(runs[1], runs[0], f"seed={seed} engine={engine}")
+                self.assertLessEqual(runs[0][0]['cost'], runs[0][0]['greedy_cost'] + 1e-9)
+
+    def test_precomputed_greedy_gives_same_result(self):
+        # PreviewWorker の finish は前もって求めた貪欲法の結果を渡す。渡さない場合と同じプランになること
+        for seed in range(8):
+            caps, tasks = random_problem(seed)
+            greedy_tasks = copy.deepcopy(tasks)
+            greedy = first_study_plan.allocate_by_priority(caps, greedy_tasks)
+            with_greedy = copy.deepcopy(tasks)
+            a = anytime_solver.solve(caps, with_greedy, None, seed=0, steps=STEPS,
+                                     greedy=(greedy, [t['remaining'] for t in greedy_tasks]))
+            without = copy.deepcopy(tasks)
+            b = anytime_solver.solve(caps, without, None, seed=0, steps=STEPS)
+            self.assertEqual(a, b, f"seed={seed}")
+            self.assertEqual(with_greedy, without, f"seed={seed}")
+
+    def test_duplicate_names_return_greedy(self):
+        tasks = [
+            {'name': '計算', 'remaining': 4, 'total': 4, 'time_per_item': 0.5, 'priority': 1},
+            {'name': '計算', 'remaining': 3, 'total': 3, 'time_per_item': 0.5, 'priority': 2},
+        ]
+        caps = [1.0, 1.0, 1.5]
+        greedy_tasks = copy.deepcopy(tasks)
+        greedy = first_study_plan.allocate_by_priority(caps, greedy_tasks)
+        solved_tasks = copy.deepcopy(tasks)
+        result = anytime_solver.solve(caps, solved_tasks, None, steps=STEPS)
+        self.assertEqual(result['plan'], greedy)
+        self.assertEqual(result['engine'], 'greedy')
+        self.assertEqual(solved_tasks, greedy_tasks)
+        with self.assertRaises(ValueError):
+            anytime_solver.LocalSearch(caps, tasks, greedy, len(caps))
+
+    def test_requires_budget_or_steps(self):
+        caps, tasks = random_problem(0)
+        with self.assertRaises(ValueError):
+            anytime_solver.solve(caps, tasks, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""cohort_resources の値段つき割当をランダムな生徒で確かめるテスト"""
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import cohort_resources  # noqa: E402
+import first_study_plan  # noqa: E402
+
+RESOURCES = ('チューター', '実験室')
+
+
+def random_spec(rng, sid, days):
+    tasks = []
+    for i in range(rng.randint(1, 6)):
+        task = {'name': f't{i}', 'total': rng.randint(0, 12), 'priority': rng.randint(1, 3),
+                'time_per_item': rng.choice([0.25, 0.5, 1.0]), 'difficulty': rng.choice([1.0, 1.5])}
+        if rng.random() < 0.5:
+            task['resources'] = {rng.choice(RESOURCES): rng.choice([1, 2])}
+        if i and rng.random() < 0.3:
+            task['after'] = [f't{rng.randrange(i)}']
+        tasks.append(task)
+    return {'id': sid, 'day_capacities': [rng.choice([0, 0.5, 1, 2, 3]) for _ in range(days)], 'tasks': tasks}
+
+
+class CohortTest(unittest.TestCase):
+    def test_zero_prices_match_allocate_by_priority(self):
+        for seed in range(300):
+            rng = random.Random(seed)
+            days = rng.randint(1, 8)
+            student = cohort_resources.student_from_spec(random_spec(rng, 's', days))
+            expected = first_study_plan.allocate_by_priority(list(student['day_capacities']),
+                                                             copy.deepcopy(student['tasks']))
+            zero = {r: [0.0] * days for r in RESOURCES}
+            self.assertEqual(cohort_resources.plan_student(student), expected, f"seed={seed}")
+            self.assertEqual(cohort_resources.plan_student(student, zero), expected, f"seed={seed}")
+
+    def test_cohort_is_within_caps_and_independent_of_workers(self):
+        saved = cohort_resources.PARALLEL_MIN_STUDENTS
+        cohort_resources.PARALLEL_MIN_STUDENTS = 0
+        try:
+            for seed in range(3):
+                rng = random.Random(seed)
+                days = 6
+                students = [cohort_resources.student_from_spec(random_spec(rng, f's{k}', days)) for k in range(12)]
+                caps = cohort_resources.resource_caps({'チューター': 3, '実験室': [2, 0, 2, 2, 0, 2]}, days)
+                serial = cohort_resources.allocate_cohort(students, caps, workers=1)
+                pooled = cohort_resources.allocate_cohort(students, caps, workers=2)
+                self.assertEqual(pooled, serial, f"seed={seed}")
+
+                usages = [cohort_resources.plan_usage(s, serial['plans'][s['id']]) for s in students]
+                totals = cohort_resources.total_usage(usages, caps)
+                self.assertEqual(cohort_resources.overbooked(totals, caps), {}, f"seed={seed}")
+        finally:
+            cohort_resources.PARALLEL_MIN_STUDENTS = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""first_study_plan の割当（前提タスクつき割当）をランダムな入力で確かめるテスト"""
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import first_study_plan  # noqa: E402
+
+CASES = 300
+
+
+def random_tasks(rng, n, edges=False):
+    tasks = []
+    for i in range(n):
+        t = {
+            'name': f't{i}',
+            'remaining': rng.randint(0, 15),
+            'time_per_item': rng.choice([0.1, 0.25, 0.5, 0.75, 1.0, 1.5]),
+            'difficulty': rng.choice([0.8, 1.0, 1.3]),
+            'priority': rng.randint(1, 4),
+        }
+        t['total'] = t['remaining']
+        if edges and i:
+            # 番号の小さいタスクだけを前提にする（循環しない）
+            t['after'] = [f't{j}' for j in rng.sample(range(i), rng.randint(0, min(2, i)))]
+        tasks.append(t)
+    return tasks
+
+
+def random_caps(rng):
+    return [rng.choice([0, 0.2, 1, 2, 3.5]) for _ in range(rng.randint(1, 10))]
+
+
+class PrerequisiteAllocationTest(unittest.TestCase):
+    def test_matches_greedy_without_edges(self):
+        # 前提が無ければ、ヒープ版は allocate_by_priority の日ごとの割当と同じ結果になる
+        for seed in range(CASES):
+            rng = random.Random(seed)
+            tasks = random_tasks(rng, rng.randint(1, 8))
+            caps = random_caps(rng)
+            greedy_tasks = copy.deepcopy(tasks)
+            heap_tasks = copy.deepcopy(tasks)
+            greedy = first_study_plan.allocate_by_priority(caps, greedy_tasks)
+            heap = first_study_plan.allocate_with_prerequisites(caps, heap_tasks)
+            self.assertEqual(heap, greedy, f"seed={seed}")
+            self.assertEqual(heap_tasks, greedy_tasks, f"seed={seed}")
+
+    def test_dependents_wait_for_prerequisites(self):
+        for seed in range(CASES):
+            rng = random.Random(seed)
+            tasks = random_tasks(rng, rng.randint(2, 8), edges=True)
+            caps = random_caps(rng)
+            totals = {t['name']: t['remaining'] for t in tasks}
+            plan = first_study_plan.allocate_by_priority(caps, copy.deepcopy(tasks))
+
+            done = dict.fromkeys(totals, 0)
+            completed_day = {name: -1 for name, n in totals.items() if n == 0}
+            first_day = {}
+            for day, items in enumerate(plan):
+                for item in items:
+                    name = item['name']
+                    first_day.setdefault(name, day)
+                    done[name] += item['assigned']
+                    if done[name] >= totals[name]:
+                        completed_day.setdefault(name, day)
+            for t in tasks:
+                if t['name'] not in first_day:
+                    continue
+                for pre in t.get('after', []):
+                    # 前提はその日のうちに完了していれば後続を同じ日に始めてよい
+                    self.assertIn(pre, completed_day, f"seed={seed}")
+                    self.assertLessEqual(completed_day[pre], first_day[t['name']], f"seed={seed}")
+            for name, n in done.items():
+                self.assertLessEqual(n, totals[name], f"seed={seed}")
+
+    def test_rejects_unschedulable_prerequisites(self):
+        tasks = [
+            {'name': 'a', 'remaining': 3, 'time_per_item': 0.0, 'priority': 1},
+            {'name': 'b', 'remaining': 2, 'time_per_item': 0.5, 'priority': 1, 'after': ['a']},
+        ]
+        with self.assertRaises(ValueError):
+            first_study_plan.allocate_by_priority([2.0], tasks)
+        # 完了済みの前提は時間が 0 でも構わない
+        tasks[0]['remaining'] = 0
+        plan = first_study_plan.allocate_by_priority([2.0], tasks)
+        self.assertEqual(plan, [[{'name': 'b', 'assigned': 2, 'time': 1.0}]])
+
+    def test_rejects_unknown_and_cyclic_prerequisites(self):
+        unknown = [{'name': 'a', 'remaining': 1, 'time_per_item': 0.5, 'after': ['x']}]
+        cyclic = [
+            {'name': 'a', 'remaining': 1, 'time_per_item': 0.5, 'after': ['b']},
+            {'name': 'b', 'remaining': 1, 'time_per_item': 0.5, 'after': ['a']},
+        ]
+        for tasks in (unknown, cyclic):
+            with self.assertRaises(ValueError):
+                first_study_plan.allocate_by_priority([1.0], tasks)
+
+
+if __name__ == '__main__':
+    unittest.main()
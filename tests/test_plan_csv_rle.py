@@ -0,0 +1,56 @@
+"""RLE 形式のプラン CSV が従来の形式と同じ内容に読み戻せることを確かめるテスト"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import done_task  # noqa: E402
+import first_study_plan  # noqa: E402
+
+
+def random_plan(rng, days):
+    # 繰り返しが多くなるよう、少ない種類の項目から日ごとの並びを作る（空日も混ぜる）
+    pool = [(f"t{k}", rng.randint(1, 4)) for k in range(rng.randint(1, 4))]
+    period = rng.randint(1, 9)
+    pattern = [rng.sample(pool, rng.randint(0, len(pool))) for _ in range(period)]
+    plan = []
+    for day in range(days):
+        items = pattern[day % period] if rng.random() < 0.8 else rng.sample(pool, rng.randint(0, len(pool)))
+        plan.append([{'name': name, 'assigned': n, 'time': n * 0.5} for name, n in items])
+    return plan
+
+
+class PlanCsvRleTest(unittest.TestCase):
+    def test_rle_reads_back_like_plain_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for seed in range(200):
+                rng = random.Random(seed)
+                days = rng.randint(1, 40)
+                caps = [rng.choice([0.0, 1.0, 2.5, 3.0]) for _ in range(days)]
+                plan = random_plan(rng, days)
+                start_day = rng.choice([1, 1, 5])
+                loaded = []
+                for rle in (False, True):
+                    path = os.path.join(tmp, f"{seed}_{rle}.csv")
+                    first_study_plan.write_plan_csv(path, '数学', caps, plan, 1.0, start_day=start_day, rle=rle)
+                    loaded.append(done_task.load_plan_csv(path))
+                plain, rle = loaded
+                self.assertEqual(rle['day_capacities'], plain['day_capacities'], f"seed={seed}")
+                self.assertEqual(rle['plan_rows'], plain['plan_rows'], f"seed={seed}")
+                self.assertEqual(rle['meta'].get('plan_encoding'), 'rle')
+
+    def test_day_runs_keep_order_within_day(self):
+        day_items = [[('a',), ('b',)], [('a',), ('b',)], [('b',), ('a',)], [('a',), ('b',)]]
+        runs = first_study_plan.day_runs(day_items)
+        expanded = {}
+        for start, end, every, *item in runs:
+            for day in range(start, end + 1, every):
+                expanded.setdefault(day, []).append(tuple(item))
+        self.assertEqual([expanded[d] for d in range(1, 5)], day_items)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""plan_improver の結果が種だけで決まること（ワーカー数によらないこと）を確かめるテスト"""
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import first_study_plan  # noqa: E402
+import plan_improver  # noqa: E402
+
+STEPS = 1500
+
+
+def random_problem(seed):
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(rng.randint(3, 8)):
+        n = rng.randint(1, 12)
+        tasks.append({'name': f't{i}', 'remaining': n, 'total': n,
+                      'time_per_item': rng.choice([0.25, 0.5, 1.0]), 'difficulty': rng.choice([1.0, 1.2]),
+                      'priority': rng.randint(1, 3)})
+    caps = [rng.choice([0.5, 1, 2, 3]) for _ in range(rng.randint(3, 8))]
+    return caps, tasks
+
+
+def assigned_counts(plan, tasks):
+    counts = dict.fromkeys((t['name'] for t in tasks), 0)
+    for items in plan:
+        for item in items:
+            counts[item['name']] += item['assigned']
+    return counts
+
+
+class ImproverTest(unittest.TestCase):
+    def setUp(self):
+        # 小さな問題でもプロセスプールを使わせ、直列の結果と比べられるようにする
+        self.saved_min_steps = plan_improver.PARALLEL_MIN_STEPS
+        plan_improver.PARALLEL_MIN_STEPS = 0
+
+    def tearDown(self):
+        plan_improver.PARALLEL_MIN_STEPS = self.saved_min_steps
+
+    def test_same_seed_same_plan_for_any_worker_count(self):
+        for seed in range(5):
+            caps, tasks = random_problem(seed)
+            results = []
+            for workers in (1, 2, 1):
+                copied = copy.deepcopy(tasks)
+                result = plan_improver.improve(caps, copied, steps=STEPS, seed=seed, workers=workers)
+                results.append((result, copied))
+            self.assertEqual(results[1], results[0], f"seed={seed}")
+            self.assertEqual(results[2], results[0], f"seed={seed}")
+
+    def test_result_is_no_worse_than_greedy_and_writes_back(self):
+        for seed in range(5):
+            caps, tasks = random_problem(seed)
+            copied = copy.deepcopy(tasks)
+            result = plan_improver.improve(caps, copied, steps=STEPS, seed=seed, workers=1)
+            self.assertLessEqual(result['cost'], result['greedy_cost'] + 1e-9, f"seed={seed}")
+            counts = assigned_counts(result['plan'], tasks)
+            for before, after in zip(tasks, copied):
+                self.assertEqual(after['remaining'], before['remaining'] - counts[before['name']], f"seed={seed}")
+                self.assertGreaterEqual(after['remaining'], 0, f"seed={seed}")
+
+    def test_duplicate_names_return_greedy(self):
+        tasks = [
+            {'name': '計算', 'remaining': 4, 'total': 4, 'time_per_item': 0.5, 'priority': 1},
+            {'name': '計算', 'remaining': 3, 'total': 3, 'time_per_item': 0.5, 'priority': 2},
+        ]
+        caps = [1.0, 1.0, 1.5]
+        greedy_tasks = copy.deepcopy(tasks)
+        greedy = first_study_plan.allocate_by_priority(caps, greedy_tasks)
+        improved_tasks = copy.deepcopy(tasks)
+        result = plan_improver.improve(caps, improved_tasks, steps=STEPS, seed=0)
+        self.assertEqual(result['plan'], greedy)
+        self.assertIsNone(result['cost'])
+        self.assertEqual(improved_tasks, greedy_tasks)
+        with self.assertRaises(ValueError):
+            plan_improver.improve(caps, copy.deepcopy(tasks), plan=greedy, steps=STEPS)
+
+
+if __name__ == '__main__':
+    unittest.main()
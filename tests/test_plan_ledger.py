@@ -0,0 +1,111 @@
+"""plan_ledger の Fenwick 木と台帳の問い合わせを、素朴な合計と比べるテスト"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import done_task  # noqa: E402
+from plan_ledger import Fenwick, PlanLedger  # noqa: E402
+
+
+class FenwickTest(unittest.TestCase):
+    def test_matches_plain_sums(self):
+        for seed in range(200):
+            rng = random.Random(seed)
+            n = rng.randint(1, 30)
+            values = [rng.randint(-5, 9) for _ in range(n)]
+            tree = Fenwick(values)
+            self.assertEqual(len(tree), n)
+            for _ in range(20):
+                i = rng.randint(1, n)
+                delta = rng.randint(-4, 4)
+                tree.add(i, delta)
+                values[i - 1] += delta
+                lo, hi = sorted((rng.randint(0, n + 2), rng.randint(0, n + 2)))
+                self.assertEqual(tree.prefix(hi), sum(values[:hi]), f"seed={seed}")
+                self.assertEqual(tree.range(lo, hi), sum(values[max(lo, 1) - 1:hi]), f"seed={seed}")
+
+    def test_rejects_index_below_one(self):
+        tree = Fenwick([1, 2, 3])
+        for i in (0, -1):
+            with self.assertRaises(IndexError):
+                tree.add(i, 1)
+        # 大きすぎる添字は無視する
+        tree.add(10, 5)
+        self.assertEqual(tree.prefix(3), 6)
+
+
+def random_rows(rng, days, names):
+    rows = []
+    for day in range(1, days + 1):
+        for name in rng.sample(names, rng.randint(0, len(names))):
+            rows.append({'day': day, 'name': name, 'assigned': rng.randint(1, 6), 'time': 1.0})
+    return rows
+
+
+class PlanLedgerTest(unittest.TestCase):
+    def test_queries_match_plain_sums(self):
+        names = ['a', 'b', 'c']
+        for seed in range(100):
+            rng = random.Random(seed)
+            days = rng.randint(1, 12)
+            rows = random_rows(rng, days, names)
+            ledger = PlanLedger.from_rows(rows, days)
+            planned = {(r['name'], r['day']): r['assigned'] for r in rows}
+            actual = {}
+            for _ in range(10 if ledger.tasks() else 0):
+                name = rng.choice(ledger.tasks())
+                day = rng.randint(1, days)
+                count = rng.randint(0, 8)
+                ledger.set_actual(name, day, count)
+                actual[(name, day)] = count
+            for name in ledger.tasks():
+                def done(d, name=name):
+                    return actual.get((name, d), planned.get((name, d), 0))
+                for today in range(0, days + 1):
+                    expected_done = sum(done(d) for d in range(1, today + 1))
+                    self.assertEqual(ledger.done_through(name, today), expected_done, f"seed={seed}")
+                    short = sum(planned.get((name, d), 0) - done(d) for d in range(1, today + 1))
+                    later = sum(planned.get((name, d), 0) for d in range(today + 1, days + 1))
+                    self.assertEqual(ledger.remaining(name, today, days), max(0, later + short), f"seed={seed}")
+
+    def test_rebase_keeps_pending_of_dropped_task(self):
+        rows = [{'day': 1, 'name': 'a', 'assigned': 2, 'time': 1.0},
+                {'day': 3, 'name': 'b', 'assigned': 4, 'time': 2.0}]
+        ledger = PlanLedger.from_rows(rows)
+        ledger.set_actual('b', 3, 1)
+        # 新しい版に b が無くても KeyError にならず、Day 3 の不足分は持ち越される
+        ledger.rebase([{'day': 1, 'name': 'a', 'assigned': 2, 'time': 1.0}], today=1)
+        self.assertEqual(ledger.pending['b'].range(3, 3), 3)
+
+    def test_replan_remaining_matches_plain_sums(self):
+        # 台帳を使う前の再計画と同じく、残り = Day today～cutoff の予定 − 今日の完了数
+        names = ['a', 'b', 'c']
+        for seed in range(200):
+            rng = random.Random(seed)
+            days = rng.randint(2, 12)
+            rows = random_rows(rng, days, names)
+            caps = [rng.choice([1.0, 2.0, 3.0]) for _ in range(days)]
+            today = rng.randint(1, days - 1)
+            cutoff = rng.randint(today + 1, days)
+            next_caps = caps[today:cutoff]
+            done_today = {name: rng.randint(0, 8) for name in rng.sample(names, rng.randint(0, 3))}
+
+            result = done_task.replan_plan_rows(rows, caps, today, done_today, next_caps)
+            expected = {}
+            for r in rows:
+                if today <= r['day'] <= cutoff:
+                    expected[r['name']] = expected.get(r['name'], 0) + r['assigned']
+            for name in {r['name'] for r in rows}:
+                want = max(0, expected.get(name, 0) - done_today.get(name, 0))
+                self.assertEqual(result['requested'][name], want, f"seed={seed} task={name}")
+
+            with_ledger = done_task.replan_plan_rows(rows, caps, today, done_today, next_caps,
+                                                     ledger=PlanLedger.from_rows(rows, cutoff))
+            self.assertEqual(with_ledger, result, f"seed={seed}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""plan_preview の差分再計算が allocate_by_priority と同じ結果になることを確かめるテスト"""
+import copy
+import os
+import random
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import first_study_plan  # noqa: E402
+import plan_preview  # noqa: E402
+
+
+def random_tasks(rng):
+    edges = rng.random() < 0.5
+    tasks = []
+    for i in range(rng.randint(1, 7)):
+        n = rng.randint(0, 15)
+        after = [f't{j}' for j in rng.sample(range(i), rng.randint(0, min(2, i)))] if edges and i else []
+        tasks.append({'name': f't{i}', 'remaining': n, 'total': n, 'priority': rng.randint(1, 4),
+                      'difficulty': rng.choice([0.8, 1.0, 1.3]),
+                      'time_per_item': rng.choice([0.1, 0.25, 0.5, 1.0, 1.5]), 'after': after})
+    return tasks
+
+
+def expected(caps, tasks):
+    work = copy.deepcopy(tasks)
+    plan = first_study_plan.allocate_by_priority(list(caps), work)
+    return plan, [t['remaining'] for t in work]
+
+
+class PreviewEngineTest(unittest.TestCase):
+    def test_incremental_edits_match_allocate_by_priority(self):
+        for seed in range(200):
+            rng = random.Random(seed)
+            engine = plan_preview.PreviewEngine()
+            tasks = random_tasks(rng)
+            caps = [rng.choice([0, 0.5, 1, 2, 3]) for _ in range(rng.randint(1, 10))]
+            for _ in range(6):
+                # 容量の書き換え・日の追加と削除・タスクの変更を混ぜて続けて計算する
+                edit = rng.random()
+                if edit < 0.4:
+                    caps[rng.randrange(len(caps))] = rng.choice([0, 0.5, 1, 2, 3])
+                elif edit < 0.6:
+                    caps.append(rng.choice([1, 2]))
+                elif edit < 0.7 and len(caps) > 1:
+                    caps.pop()
+                elif edit < 0.9:
+                    tasks = random_tasks(rng)
+                before = copy.deepcopy(tasks)
+                result = engine.compute(caps, tasks)
+                plan, remaining = expected(caps, tasks)
+                self.assertEqual(result['plan'], plan, f"seed={seed}")
+                self.assertEqual(result['remaining'], remaining, f"seed={seed}")
+                self.assertEqual(result['unassigned'],
+                                 {t['name']: r for t, r in zip(tasks, remaining) if r > 0}, f"seed={seed}")
+                self.assertEqual(tasks, before)
+
+    def test_reuses_unchanged_leading_days(self):
+        engine = plan_preview.PreviewEngine()
+        tasks = [{'name': 'a', 'remaining': 20, 'total': 20, 'priority': 1, 'difficulty': 1.0,
+                  'time_per_item': 0.5, 'after': []}]
+        engine.compute([1, 1, 1, 1], tasks)
+        self.assertEqual(engine.compute([1, 1, 2, 1], tasks)['reused_days'], 2)
+
+
+class PreviewWorkerTest(unittest.TestCase):
+    def test_errors_are_returned_as_results(self):
+        done = threading.Event()
+
+        def finish(caps, tasks, result, extra):
+            done.set()
+            raise RuntimeError('finish failed')
+
+        worker = plan_preview.PreviewWorker(finish=finish)
+        worker.submit(1, [1.0], [{'name': 'a', 'remaining': 1, 'total': 1, 'priority': 1, 'difficulty': 1.0,
+                                  'time_per_item': 0.5, 'after': []}])
+        self.assertTrue(done.wait(5))
+        result = None
+        for _ in range(500):
+            result = worker.poll()
+            if result is not None:
+                break
+            time.sleep(0.01)
+        self.assertIsNotNone(result)
+        generation, error, _ = result
+        self.assertEqual(generation, 1)
+        self.assertIsInstance(error, RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
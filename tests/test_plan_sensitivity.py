@@ -0,0 +1,82 @@
+"""plan_sensitivity の差分計算が割当のやり直しと一致することをランダムな入力で確かめるテスト"""
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import first_study_plan  # noqa: E402
+import plan_sensitivity  # noqa: E402
+
+CASES = 200
+
+
+def random_tasks(rng, n):
+    edges = rng.random() < 0.5
+    tasks = []
+    for i in range(n):
+        t = {
+            'name': f't{i}',
+            'remaining': rng.randint(0, 15),
+            'time_per_item': rng.choice([0.1, 0.25, 0.5, 0.75, 1.0, 1.5]),
+            'difficulty': rng.choice([0.8, 1.0, 1.3]),
+            'priority': rng.randint(1, 4),
+        }
+        if edges and i:
+            t['after'] = [f't{j}' for j in rng.sample(range(i), rng.randint(0, min(2, i)))]
+        tasks.append(t)
+    return tasks
+
+
+def unassigned(day_capacities, tasks, original):
+    # 割当を最初からやり直し、残った問題数と時間（元の難易度で数える）を返す
+    tasks = copy.deepcopy(tasks)
+    first_study_plan.allocate_by_priority(list(day_capacities), tasks)
+    items = sum(t['remaining'] for t in tasks)
+    quanta = 0
+    for t, o in zip(tasks, original):
+        time_per = first_study_plan.task_quanta(o)
+        if time_per > 0:
+            quanta += t['remaining'] * time_per
+    return items, first_study_plan.quanta_to_hours(quanta)
+
+
+class SensitivityTest(unittest.TestCase):
+    def test_matches_full_reallocation(self):
+        for seed in range(CASES):
+            rng = random.Random(seed)
+            tasks = random_tasks(rng, rng.randint(1, 8))
+            caps = [rng.choice([0, 0.2, 1, 2, 3.5]) for _ in range(rng.randint(1, 10))]
+            analyzer = plan_sensitivity.SensitivityAnalyzer(caps, tasks)
+            base_items, base_hours = unassigned(caps, tasks, tasks)
+            self.assertEqual(analyzer.baseline[0], base_items, f"seed={seed}")
+            self.assertAlmostEqual(analyzer.baseline[1], base_hours, msg=f"seed={seed}")
+
+            for day in range(len(caps)):
+                more = list(caps)
+                more[day] += 1.0
+                items, hours = unassigned(more, tasks, tasks)
+                gain = analyzer.day_gain(day, 1.0)
+                self.assertEqual(gain[0], base_items - items, f"seed={seed} day={day + 1}")
+                self.assertAlmostEqual(gain[1], base_hours - hours, msg=f"seed={seed} day={day + 1}")
+
+            for idx, t in enumerate(tasks):
+                easier = copy.deepcopy(tasks)
+                easier[idx]['difficulty'] = t.get('difficulty', 1.0) * 0.9
+                items, hours = unassigned(caps, easier, tasks)
+                gain = analyzer.task_gain(idx, 0.9)
+                self.assertEqual(gain[0], base_items - items, f"seed={seed} task={t['name']}")
+                self.assertAlmostEqual(gain[1], base_hours - hours, msg=f"seed={seed} task={t['name']}")
+
+    def test_report_leaves_tasks_unchanged(self):
+        rng = random.Random(0)
+        tasks = random_tasks(rng, 6)
+        before = copy.deepcopy(tasks)
+        plan_sensitivity.sensitivity_report([1.0, 2.0, 0.5], tasks)
+        self.assertEqual(tasks, before)
+
+
+if __name__ == '__main__':
+    unittest.main()